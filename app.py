@@ -2,7 +2,10 @@
 
 import streamlit as st
 
-from utils.data_loader import list_companies, load_company_info
+from utils.data_loader import load_company_info
+from utils.search import get_company_index
+from utils.session_cache import display_unit
+from utils.units import CANONICAL_UNIT, DISPLAY_UNITS
 
 st.set_page_config(
     page_title="財務ビジュアライザー",
@@ -17,26 +20,47 @@ st.markdown("個人投資家向け - 財務諸表を直感的に可視化")
 st.divider()
 
 # 企業選択
-companies = list_companies()
-if not companies:
+index = get_company_index()
+if not len(index):
     st.error("data/ フォルダに企業データがありません。")
     st.stop()
 
+# 検索結果・選択肢に表示する最大件数（全社分の選択肢はブラウザに送らない）
+SEARCH_LIMIT = 50
+
 # サイドバーに企業選択を配置（全ページ共通）
 with st.sidebar:
     st.header("企業選択")
-    options = {f"{c['code']} {c['name']}": c["code"] for c in companies}
-    selected = st.selectbox("企業を選択", list(options.keys()))
-    code = options[selected]
+    query = st.text_input("企業を検索", placeholder="コード・社名・英語名・よみ")
+    current = st.session_state.get("selected_code", index.codes[0])
+    if query:
+        options = index.search(query, SEARCH_LIMIT)
+    else:
+        options = list(dict.fromkeys([current] + index.codes[:SEARCH_LIMIT]))
+    if not options:
+        st.warning("該当する企業がありません。")
+        options = [current]
+    code = st.selectbox("企業を選択", options, format_func=index.label)
     st.session_state["selected_code"] = code
 
+    # 金額の表示単位（全ページ共通）。他のページから戻ったときも選択を保つ
+    st.header("表示設定")
+    if "display_unit_choice" not in st.session_state:
+        st.session_state["display_unit_choice"] = display_unit()
+    st.session_state["display_unit"] = st.radio(
+        "金額の表示単位", list(DISPLAY_UNITS), key="display_unit_choice", horizontal=True
+    )
+
 info = load_company_info(code)
 
 # 企業情報カード
 col1, col2 = st.columns([2, 1])
 with col1:
     st.subheader(f"{info['name']} ({info['code']})")
-    st.markdown(f"**市場:** {info['market']}　|　**決算期:** {info['fiscal_label']}")
+    st.markdown(
+        f"**市場:** {info['market']}　|　**決算期:** {info['fiscal_label']}"
+        f"　|　**開示単位:** {info.get('currency') or CANONICAL_UNIT}"
+    )
     st.markdown(f"**事業内容:** {info['description']}")
     if info.get("notes"):
         st.info(info["notes"])
@@ -56,6 +80,9 @@ pages_info = [
     ("3 - B/S (貸借対照表)", "資産＝負債＋純資産のブロック図。2期並列比較で変化を把握"),
     ("4 - CF (キャッシュフロー)", "営業・投資・財務CFのサンキー図とウォーターフォール"),
     ("5 - Trend (時系列推移)", "4期分の折れ線グラフで売上・利益・指標の推移を分析"),
+    ("6 - Valuation (バリュエーション)", "FCF から DCF で企業価値を試算。割引率・成長率の感応度ヒートマップと全社スクリーニング"),
+    ("7 - データチェック", "全社の財務データから外れ値・急変・符号反転などの要確認箇所を一覧表示"),
+    ("8 - 企業クラスタ分析", "収益構造・成長・資産構成・CFの型から財務の形が似た企業をグループ化。指標の相関行列"),
 ]
 
 for page, desc in pages_info:
@@ -1,5 +1,6 @@
 """P/L（損益計算書）ビュー - サンキー・ウォーターフォール・セグメント。"""
 
+import numpy as np
 import streamlit as st
 import pandas as pd
 
@@ -9,9 +10,22 @@ from utils.data_loader import (
     load_segment,
     load_factors,
     get_period_label,
+    to_display_table,
 )
-from utils.charts import create_pl_sankey, create_waterfall, create_treemap
+from utils.anomalies import show_anomaly_badges
+from utils.bridge import FactorBridge, LineItemBridge
+from utils.charts import create_pl_sankey_frames, create_waterfall, create_treemap, create_fan_chart
+from utils.periods import shift_period
+from utils.scenario import ScenarioParams, bridge_summary, calibrate, fan_quantiles, simulate
+from utils.session_cache import display_unit, session_memo
 from utils.tooltips import PL_TOOLTIPS
+from utils.units import (
+    CANONICAL_UNIT,
+    amount_format,
+    format_amount,
+    scaled_view,
+    unit_factor,
+)
 
 st.set_page_config(page_title="P/L 損益計算書", page_icon="📊", layout="wide")
 
@@ -19,150 +33,291 @@ code = st.session_state.get("selected_code", "5139")
 info = load_company_info(code)
 st.title(f"P/L 損益計算書 - {info['name']}")
 
-pl = load_pl(code)
-segment = load_segment(code)
+# 金額は表示単位に換算（変動要因の金額は文字列のため FactorBridge で換算する）
+unit = display_unit()
+pl = scaled_view(load_pl(code), unit)
+segment = scaled_view(load_segment(code), unit)
 factors = load_factors(code)
+factor_scale = unit_factor(info.get("currency"), unit)
 
-periods = pl["期"].tolist()
-selected_period = st.selectbox("表示期間", periods[::-1], format_func=get_period_label)
-row = pl[pl["期"] == selected_period].iloc[0]
-period_label = get_period_label(selected_period)
-idx = periods.index(selected_period)
 
-# --- タブ構成 ---
-tab_sankey, tab_waterfall, tab_segment, tab_table = st.tabs(
-    ["サンキーダイアグラム", "ウォーターフォール", "セグメント", "データテーブル"]
-)
+def _slider(label: str, low: float, high: float, value: float, step: float) -> float:
+    """初期値を範囲内に収めたスライダー（過去の実績から推定した値が範囲外になる企業もあるため）。"""
+    return st.slider(label, low, high, min(max(round(value, 1), low), high), step)
+
+
+@st.fragment
+def scenario_section(pl: pd.DataFrame, selected_period: int, period_label: str, unit: str) -> None:
+    """翌期以降の営業利益のモンテカルロ分析。前提を変えたときはこの部分だけ再実行する。"""
+    history = pl[pl["期"] <= selected_period]
+    base_row = history.iloc[-1]
+    calibrated = calibrate(history)
+
+    st.subheader(f"営業利益シナリオ ({period_label} 起点)")
+    st.caption("初期値は過去の実績から推定した前提です。スライダーで変更すると即座に再計算します。")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        growth = _slider("売上成長率 平均(%)", -50.0, 100.0, float(np.expm1(calibrated.growth_mean)) * 100, 0.5)
+        growth_vol = _slider("売上成長率 ばらつき(%)", 1.0, 50.0, calibrated.growth_std * 100, 0.5)
+    with col2:
+        cost_ratio = _slider("原価率 平均(%)", 0.0, 100.0, calibrated.cost_ratio_mean * 100, 0.5)
+        cost_vol = _slider("原価率 ばらつき(pt)", 0.5, 20.0, calibrated.cost_ratio_std * 100, 0.5)
+    with col3:
+        sga_ratio = _slider("販管費率 平均(%)", 0.0, 100.0, calibrated.sga_ratio_mean * 100, 0.5)
+        sga_vol = _slider("販管費率 ばらつき(pt)", 0.5, 20.0, calibrated.sga_ratio_std * 100, 0.5)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        horizon = st.select_slider("予測期間（期）", [1, 2, 3, 5], value=3)
+    with col2:
+        n_trials = st.select_slider("試行回数", [10_000, 100_000, 300_000], value=100_000,
+                                    format_func=lambda v: f"{v:,}")
+
+    params = ScenarioParams(
+        growth_mean=float(np.log1p(growth / 100)),
+        growth_std=growth_vol / 100,
+        cost_ratio_mean=cost_ratio / 100,
+        cost_ratio_std=cost_vol / 100,
+        sga_ratio_mean=sga_ratio / 100,
+        sga_ratio_std=sga_vol / 100,
+    )
+    sim = simulate(float(base_row["営業収益"]), params, n=n_trials, horizon=horizon)
+    next_profit = sim["営業利益"][:, 0]
+
+    cols = st.columns(3)
+    with cols[0]:
+        st.metric("翌期営業利益（中央値）", format_amount(np.median(next_profit), unit))
+    with cols[1]:
+        st.metric("減益確率", f"{(next_profit < base_row['営業利益']).mean() * 100:.1f}%")
+    with cols[2]:
+        st.metric("赤字確率", f"{(next_profit < 0).mean() * 100:.1f}%")
 
-# --- サンキーダイアグラム ---
-with tab_sankey:
-    st.subheader("収益→費用→利益フロー")
-    fig = create_pl_sankey(row, period_label)
-    st.plotly_chart(fig, use_container_width=True)
-
-    with st.expander("項目の解説"):
-        for key, desc in PL_TOOLTIPS.items():
-            st.markdown(f"**{key}**: {desc}")
-
-# --- ウォーターフォール ---
-with tab_waterfall:
-    if idx > 0:
-        prev_row = pl[pl["期"] == periods[idx - 1]].iloc[0]
-        prev_label = get_period_label(periods[idx - 1])
-
-        st.subheader(f"営業利益の変動要因 ({prev_label} → {period_label})")
-
-        # 変動要因データ取得
-        period_factors = factors[factors["期"] == selected_period]
-
-        if len(period_factors) > 0:
-            cats = [f"{prev_label}\n営業利益"]
-            vals = [prev_row["営業利益"]]
-            measures = ["absolute"]
-            hover_texts = [f"前期営業利益: {int(prev_row['営業利益']):,} 百万円"]
-            explanations = []
-
-            for _, f_row in period_factors.iterrows():
-                cats.append(f_row["要因"])
-                amount_str = str(f_row["金額"]).replace(",", "").replace("−", "-").replace("+", "")
-                vals.append(float(amount_str))
-                measures.append("relative")
-                desc = f_row.get("説明", "")
-                hover_texts.append(str(desc) if pd.notna(desc) else "")
-                explanations.append(f_row)
-
-            cats.append(f"{period_label}\n営業利益")
-            vals.append(row["営業利益"])
-            measures.append("total")
-            hover_texts.append(f"当期営業利益: {int(row['営業利益']):,} 百万円")
-
-            fig = create_waterfall(
-                cats, vals,
-                f"営業利益ブリッジ ({prev_label} → {period_label})",
-                measures, hover_texts=hover_texts,
+    # ファンチャート
+    future_labels = [f"{get_period_label(shift_period(selected_period, years=h))}(予)" for h in range(1, horizon + 1)]
+    fig = create_fan_chart(
+        [get_period_label(p) for p in history["期"]],
+        history["営業利益"].tolist(),
+        future_labels,
+        fan_quantiles(sim["営業利益"]),
+        "営業利益の予測分布",
+        unit=unit,
+    )
+    st.plotly_chart(fig, use_container_width=True, key="pl_scenario_fan")
+
+    # 確率的ブリッジ（平均で積み上げ、ばらつきはホバーに表示）
+    summary = bridge_summary(base_row, sim)
+    steps = ["売上増減", "原価増減", "販管費増減"]
+    fig = create_waterfall(
+        [f"{period_label}\n営業利益"] + steps + [f"{future_labels[0]}\n営業利益(平均)"],
+        [base_row["営業利益"]] + summary.loc[steps, "平均"].tolist() + [summary.loc["翌期営業利益", "平均"]],
+        f"営業利益ブリッジの期待値 ({period_label} → {future_labels[0]})",
+        ["absolute", "relative", "relative", "relative", "total"],
+        unit=unit,
+        hover_texts=[f"実績: {format_amount(base_row['営業利益'], unit)}"] + [
+            f"90%区間: {format_amount(summary.loc[s, 0.05], unit, signed=True, suffix=False)} 〜 "
+            f"{format_amount(summary.loc[s, 0.95], unit, signed=True)}"
+            for s in steps + ["翌期営業利益"]
+        ],
+    )
+    st.plotly_chart(fig, use_container_width=True, key="pl_scenario_bridge")
+
+
+@st.fragment
+def pl_view(
+    pl: pd.DataFrame, segment: pd.DataFrame, factors: pd.DataFrame, unit: str, factor_scale: float
+) -> None:
+    """期間選択以降の表示。期間を変えたときはこの範囲だけ再実行する。"""
+    periods = pl["期"].tolist()
+    selected_period = st.selectbox("表示期間", periods[::-1], format_func=get_period_label)
+    row = pl[pl["期"] == selected_period].iloc[0]
+    period_label = get_period_label(selected_period)
+    idx = periods.index(selected_period)
+    show_anomaly_badges(code, selected_period, ("pl",))
+
+    # --- タブ構成 ---
+    tab_sankey, tab_waterfall, tab_scenario, tab_segment, tab_table = st.tabs(
+        ["サンキーダイアグラム", "ウォーターフォール", "シナリオ分析", "セグメント", "データテーブル"],
+        key="pl_tab",
+        on_change="rerun",
+    )
+
+    # --- サンキーダイアグラム ---
+    with tab_sankey:
+        if tab_sankey.open:
+            st.subheader("収益→費用→利益フロー")
+            st.caption("図の下のスライダーで期を切り替えられます（▶ で全期を順に表示）。")
+            # 全期分をフレームに持たせ、期の切り替えはブラウザ内で行う
+            fig = session_memo(
+                "pl_sankey_frames", [pl], selected_period,
+                lambda: create_pl_sankey_frames(pl, unit, selected_period),
             )
-            st.plotly_chart(fig, use_container_width=True, key="pl_waterfall_chart")
-
-            # 変動要因の詳細（モバイル対応）
-            with st.expander("変動要因の詳細"):
-                for f_row in explanations:
-                    amount_str = str(f_row["金額"]).replace(",", "").replace("−", "-").replace("+", "")
-                    amount = float(amount_str)
-                    sign = "\U0001f4c8" if amount > 0 else "\U0001f4c9"
-                    st.markdown(f"{sign} **{f_row['要因']}** ({f_row['金額']}百万円)")
-                    desc = f_row.get("説明", "")
-                    if pd.notna(desc) and str(desc).strip():
-                        st.markdown(f"\u3000\u3000{desc}")
-        else:
-            cats = [
-                f"{prev_label}\n営業利益",
-                "売上増減",
-                "原価増減",
-                "販管費増減",
-                f"{period_label}\n営業利益",
-            ]
-            vals = [
-                prev_row["営業利益"],
-                row["営業収益"] - prev_row["営業収益"],
-                -(row["売上原価"] - prev_row["売上原価"]),
-                -(row["販管費"] - prev_row["販管費"]),
-                row["営業利益"],
-            ]
-            measures = ["absolute", "relative", "relative", "relative", "total"]
-            fig = create_waterfall(cats, vals, f"営業利益ブリッジ ({prev_label} → {period_label})", measures)
-            st.plotly_chart(fig, use_container_width=True, key="pl_waterfall_simple")
-    else:
-        st.info("ウォーターフォールチャートは前年データが必要です。2期目以降を選択してください。")
-
-# --- セグメント ---
-with tab_segment:
-    st.subheader("セグメント別売上構成")
-
-    seg_data = segment[segment["期"] == selected_period]
-    if len(seg_data) > 0:
-        # ツリーマップ
-        labels_tm = ["全社"] + seg_data["セグメント"].tolist()
-        parents_tm = [""] + ["全社"] * len(seg_data)
-        values_tm = [0] + seg_data["売上"].tolist()
-
-        # 前年比計算
-        color_vals = [0]
-        if idx > 0:
-            prev_seg = segment[segment["期"] == periods[idx - 1]]
-            for _, s_row in seg_data.iterrows():
-                prev_val = prev_seg[prev_seg["セグメント"] == s_row["セグメント"]]["売上"]
-                if len(prev_val) > 0:
-                    pct = ((s_row["売上"] - prev_val.iloc[0]) / prev_val.iloc[0]) * 100
-                    color_vals.append(pct)
+            st.plotly_chart(fig, use_container_width=True)
+
+            with st.expander("項目の解説"):
+                for key, desc in PL_TOOLTIPS.items():
+                    st.markdown(f"**{key}**: {desc}")
+
+    # --- ウォーターフォール ---
+    with tab_waterfall:
+        if tab_waterfall.open:
+            if idx > 0:
+                base_period = st.selectbox("比較元の期", periods[:idx][::-1], format_func=get_period_label)
+                base_row = pl[pl["期"] == base_period].iloc[0]
+                base_label = get_period_label(base_period)
+                pl_bridge = session_memo("pl_bridge", [pl], None, lambda: LineItemBridge(pl))
+                factor_bridge = session_memo(
+                    "pl_factor_bridge", [pl, factors], factor_scale,
+                    lambda: FactorBridge(factors, periods, factor_scale),
+                )
+                span = pl_bridge.span(base_period, selected_period)
+                title = f"営業利益ブリッジ ({base_label} → {period_label})"
+
+                st.subheader(f"営業利益の変動要因 ({base_label} → {period_label})")
+
+                # 変動要因データが区間内の全期にあれば要因で分解する
+                if factor_bridge.covers(base_period, selected_period):
+                    details = factor_bridge.details(base_period, selected_period)
+                    cats = [f"{base_label}\n営業利益"]
+                    vals = [base_row["営業利益"]]
+                    measures = ["absolute"]
+                    hover_texts = [f"{base_label}営業利益: {format_amount(base_row['営業利益'], unit)}"]
+
+                    if span == 1:
+                        for _, f_row in details.iterrows():
+                            cats.append(f_row["要因"])
+                            vals.append(f_row["金額"])
+                            measures.append("relative")
+                            desc = f_row.get("説明", "")
+                            hover_texts.append(str(desc) if pd.notna(desc) else "")
+                    else:
+                        # 複数期にまたがる場合は項目（売上増加・原価増加など）ごとに合計する
+                        counts = details["項目"].astype(str).value_counts()
+                        for item, amount in factor_bridge.by_item(base_period, selected_period).items():
+                            cats.append(f"{item}（{span}期計）")
+                            vals.append(amount)
+                            measures.append("relative")
+                            hover_texts.append(f"{span}期・{counts.get(item, 0)}要因の合計")
+
+                    # 要因の合計と営業利益の増減が一致しない場合（1百万円以上）は差額を表示する
+                    residual = row["営業利益"] - base_row["営業利益"] - sum(vals[1:])
+                    if abs(residual) >= unit_factor(CANONICAL_UNIT, unit):
+                        cats.append("その他（差額）")
+                        vals.append(residual)
+                        measures.append("relative")
+                        hover_texts.append("変動要因に含まれない増減")
+
+                    cats.append(f"{period_label}\n営業利益")
+                    vals.append(row["営業利益"])
+                    measures.append("total")
+                    hover_texts.append(f"当期営業利益: {format_amount(row['営業利益'], unit)}")
+
+                    fig = session_memo(
+                        "pl_waterfall", [pl, factors], (base_period, selected_period, factor_scale),
+                        lambda: create_waterfall(cats, vals, title, measures, unit, hover_texts),
+                    )
+                    st.plotly_chart(fig, use_container_width=True, key="pl_waterfall_chart")
+
+                    # 変動要因の詳細（モバイル対応）
+                    with st.expander("変動要因の詳細"):
+                        for _, f_row in details.iterrows():
+                            sign = "\U0001f4c8" if f_row["金額"] > 0 else "\U0001f4c9"
+                            prefix = f"[{get_period_label(f_row['期'])}] " if span > 1 else ""
+                            st.markdown(
+                                f"{sign} {prefix}**{f_row['要因']}** ({format_amount(f_row['金額'], unit, signed=True)})"
+                            )
+                            desc = f_row.get("説明", "")
+                            if pd.notna(desc) and str(desc).strip():
+                                st.markdown(f"\u3000\u3000{desc}")
                 else:
-                    color_vals.append(0)
-        else:
-            color_vals = None
-
-        fig = create_treemap(
-            labels_tm, parents_tm, values_tm,
-            f"セグメント別売上 ({period_label})",
-            color_vals,
-        )
-        st.plotly_chart(fig, use_container_width=True)
-
-        # セグメント別テーブル
-        st.dataframe(
-            seg_data[["セグメント", "売上", "営業利益"]].reset_index(drop=True),
-            use_container_width=True,
-            hide_index=True,
-        )
-    else:
-        st.info("セグメントデータがありません。")
-
-# --- データテーブル ---
-with tab_table:
-    st.subheader("P/L データテーブル")
-    display_cols = [c for c in pl.columns if c != "期"]
-    display_df = pl.copy()
-    display_df["期"] = display_df["期"].apply(get_period_label)
-    display_df = display_df.set_index("期")
-    st.dataframe(
-        display_df.style.format("{:,.0f}"),
-        use_container_width=True,
-    )
+                    delta = pl_bridge.delta(base_period, selected_period, ["営業収益", "売上原価", "販管費"])
+                    cats = [
+                        f"{base_label}\n営業利益",
+                        "売上増減",
+                        "原価増減",
+                        "販管費増減",
+                        f"{period_label}\n営業利益",
+                    ]
+                    vals = [
+                        base_row["営業利益"],
+                        delta["営業収益"],
+                        -delta["売上原価"],
+                        -delta["販管費"],
+                        row["営業利益"],
+                    ]
+                    measures = ["absolute", "relative", "relative", "relative", "total"]
+                    fig = session_memo(
+                        "pl_waterfall_simple", [pl], (base_period, selected_period),
+                        lambda: create_waterfall(cats, vals, title, measures, unit),
+                    )
+                    st.plotly_chart(fig, use_container_width=True, key="pl_waterfall_simple")
+            else:
+                st.info("ウォーターフォールチャートは前年データが必要です。2期目以降を選択してください。")
+
+    # --- シナリオ分析 ---
+    with tab_scenario:
+        if tab_scenario.open:
+            scenario_section(pl, selected_period, period_label, unit)
+
+    # --- セグメント ---
+    with tab_segment:
+        if tab_segment.open:
+            st.subheader("セグメント別売上構成")
+
+            seg_data = segment[segment["期"] == selected_period]
+            if len(seg_data) > 0:
+                # ツリーマップ
+                labels_tm = ["全社"] + seg_data["セグメント"].tolist()
+                parents_tm = [""] + ["全社"] * len(seg_data)
+                values_tm = [0] + seg_data["売上"].tolist()
+
+                # 前年比計算
+                color_vals = [0]
+                if idx > 0:
+                    prev_seg = segment[segment["期"] == periods[idx - 1]]
+                    for _, s_row in seg_data.iterrows():
+                        prev_val = prev_seg[prev_seg["セグメント"] == s_row["セグメント"]]["売上"]
+                        if len(prev_val) > 0:
+                            pct = ((s_row["売上"] - prev_val.iloc[0]) / prev_val.iloc[0]) * 100
+                            color_vals.append(pct)
+                        else:
+                            color_vals.append(0)
+                else:
+                    color_vals = None
+
+                fig = session_memo(
+                    "pl_treemap", [pl, segment], selected_period,
+                    lambda: create_treemap(
+                        labels_tm, parents_tm, values_tm,
+                        f"セグメント別売上 ({period_label})",
+                        color_vals,
+                        unit,
+                    ),
+                )
+                st.plotly_chart(fig, use_container_width=True)
+
+                # セグメント別テーブル
+                st.dataframe(
+                    seg_data[["セグメント", "売上", "営業利益"]].reset_index(drop=True),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            else:
+                st.info("セグメントデータがありません。")
+
+    # --- データテーブル ---
+    with tab_table:
+        if tab_table.open:
+            st.subheader("P/L データテーブル")
+            display_cols = [c for c in pl.columns if c != "期"]
+            styled = session_memo(
+                "pl_table", [pl], None,
+                lambda: to_display_table(pl).style.format("{:" + amount_format(unit) + "}"),
+            )
+            st.dataframe(
+                styled,
+                use_container_width=True,
+            )
+
+
+pl_view(pl, segment, factors, unit, factor_scale)
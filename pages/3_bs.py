@@ -1,10 +1,15 @@
 """B/S（貸借対照表）ビュー - ブロック図・前年比較・ドリルダウン。"""
 
+import pandas as pd
 import streamlit as st
 
-from utils.data_loader import load_company_info, load_bs, get_period_label
-from utils.charts import create_bs_block, create_waterfall
+from utils.data_loader import load_company_info, load_bs, get_period_label, to_display_table
+from utils.anomalies import show_anomaly_badges
+from utils.bridge import LineItemBridge
+from utils.charts import create_bs_block, create_bs_block_frames, create_waterfall
+from utils.session_cache import display_unit, session_memo
 from utils.tooltips import BS_TOOLTIPS
+from utils.units import amount_format, format_amount, scaled_view
 
 st.set_page_config(page_title="B/S 貸借対照表", page_icon="📊", layout="wide")
 
@@ -12,77 +17,14 @@ code = st.session_state.get("selected_code", "5139")
 info = load_company_info(code)
 st.title(f"B/S 貸借対照表 - {info['name']}")
 
-bs = load_bs(code)
-periods = bs["期"].tolist()
-selected_period = st.selectbox("表示期間", periods[::-1], format_func=get_period_label)
-row = bs[bs["期"] == selected_period].iloc[0]
-period_label = get_period_label(selected_period)
-idx = periods.index(selected_period)
-
-tab_block, tab_compare, tab_drill, tab_table = st.tabs(
-    ["ブロック図", "2期比較", "ドリルダウン", "データテーブル"]
-)
-
-# --- ブロック図 ---
-with tab_block:
-    st.subheader(f"資産＝負債＋純資産 ({period_label})")
-    fig = create_bs_block(row, period_label)
-    st.plotly_chart(fig, use_container_width=True)
-
-    # サマリー
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric("資産合計", f"{int(row['資産合計']):,} 百万円")
-    with col2:
-        st.metric("負債合計", f"{int(row['負債合計']):,} 百万円")
-    with col3:
-        st.metric("純資産合計", f"{int(row['純資産合計']):,} 百万円")
-
-    with st.expander("項目の解説"):
-        for key, desc in BS_TOOLTIPS.items():
-            st.markdown(f"**{key}**: {desc}")
-
-# --- 2期比較 ---
-with tab_compare:
-    if idx > 0:
-        prev_period = periods[idx - 1]
-        prev_row = bs[bs["期"] == prev_period].iloc[0]
-        prev_label = get_period_label(prev_period)
-
-        st.subheader(f"{prev_label} vs {period_label}")
-
-        col1, col2 = st.columns(2)
-        with col1:
-            fig1 = create_bs_block(prev_row, prev_label)
-            st.plotly_chart(fig1, use_container_width=True)
-        with col2:
-            fig2 = create_bs_block(row, period_label)
-            st.plotly_chart(fig2, use_container_width=True)
-
-        # 主要項目の増減
-        st.subheader("主要項目の増減")
-        compare_items = ["資産合計", "流動資産合計", "固定資産合計",
-                         "負債合計", "純資産合計", "現金及び預金", "利益剰余金"]
-        cats = []
-        vals = []
-        for item in compare_items:
-            cats.append(item)
-            vals.append(row[item] - prev_row[item])
-
-        measures = ["relative"] * len(cats)
-        fig = create_waterfall(
-            cats, vals,
-            f"B/S主要項目の増減 ({prev_label} → {period_label})",
-            measures,
-        )
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("2期比較は前年データが必要です。2期目以降を選択してください。")
+# 金額は表示単位に換算
+unit = display_unit()
+bs = scaled_view(load_bs(code), unit)
 
-# --- ドリルダウン ---
-with tab_drill:
-    st.subheader("資産内訳の詳細")
 
+@st.fragment
+def drill_down(row: pd.Series, unit: str) -> None:
+    """カテゴリを切り替えたときはドリルダウン部分だけ再実行する。"""
     drill_category = st.radio(
         "表示カテゴリ",
         ["流動資産", "固定資産", "負債", "純資産"],
@@ -106,23 +48,115 @@ with tab_drill:
                  "利益剰余金": row["利益剰余金"]}
         total = row["純資産合計"]
 
-    st.markdown(f"**{drill_category} 合計: {int(total):,} 百万円**")
+    st.markdown(f"**{drill_category} 合計: {format_amount(total, unit)}**")
 
     for name, val in items.items():
         pct = (val / total * 100) if total else 0
         col1, col2 = st.columns([3, 1])
         with col1:
-            st.progress(min(pct / 100, 1.0), text=f"{name}: {int(val):,} 百万円")
+            st.progress(min(pct / 100, 1.0), text=f"{name}: {format_amount(val, unit)}")
         with col2:
             st.markdown(f"**{pct:.1f}%**")
 
-# --- データテーブル ---
-with tab_table:
-    st.subheader("B/S データテーブル")
-    display_df = bs.copy()
-    display_df["期"] = display_df["期"].apply(get_period_label)
-    display_df = display_df.set_index("期")
-    st.dataframe(
-        display_df.style.format("{:,.0f}"),
-        use_container_width=True,
+
+@st.fragment
+def bs_view(bs: pd.DataFrame, unit: str) -> None:
+    """期間選択以降の表示。期間を変えたときはこの範囲だけ再実行する。"""
+    periods = bs["期"].tolist()
+    selected_period = st.selectbox("表示期間", periods[::-1], format_func=get_period_label)
+    row = bs[bs["期"] == selected_period].iloc[0]
+    period_label = get_period_label(selected_period)
+    idx = periods.index(selected_period)
+    show_anomaly_badges(code, selected_period, ("bs",))
+
+    tab_block, tab_compare, tab_drill, tab_table = st.tabs(
+        ["ブロック図", "2期比較", "ドリルダウン", "データテーブル"],
+        key="bs_tab",
+        on_change="rerun",
     )
+
+    # --- ブロック図 ---
+    with tab_block:
+        if tab_block.open:
+            st.subheader("資産＝負債＋純資産")
+            st.caption(
+                "図の下のスライダーで期を切り替えられます（▶ で全期を順に表示）。"
+                "図の上部の合計値も表示中の期に合わせて切り替わります。"
+            )
+            # 全期分をフレームに持たせ、期の切り替えはブラウザ内で行う（合計値も期ごとの注記にする）
+            fig = session_memo(
+                "bs_block_frames", [bs], selected_period,
+                lambda: create_bs_block_frames(bs, unit, selected_period),
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+            with st.expander("項目の解説"):
+                for key, desc in BS_TOOLTIPS.items():
+                    st.markdown(f"**{key}**: {desc}")
+
+    # --- 2期比較 ---
+    with tab_compare:
+        if tab_compare.open:
+            if idx > 0:
+                prev_period = st.selectbox("比較元の期", periods[:idx][::-1], format_func=get_period_label)
+                prev_row = bs[bs["期"] == prev_period].iloc[0]
+                prev_label = get_period_label(prev_period)
+
+                st.subheader(f"{prev_label} vs {period_label}")
+
+                col1, col2 = st.columns(2)
+                with col1:
+                    fig1 = session_memo(
+                        "bs_block", [bs], prev_period,
+                        lambda: create_bs_block(prev_row, prev_label, unit),
+                    )
+                    st.plotly_chart(fig1, use_container_width=True, key="bs_compare_prev")
+                with col2:
+                    fig2 = session_memo(
+                        "bs_block", [bs], selected_period,
+                        lambda: create_bs_block(row, period_label, unit),
+                    )
+                    st.plotly_chart(fig2, use_container_width=True, key="bs_compare_curr")
+
+                # 主要項目の増減
+                st.subheader("主要項目の増減")
+                compare_items = ["資産合計", "流動資産合計", "固定資産合計",
+                                 "負債合計", "純資産合計", "現金及び預金", "利益剰余金"]
+                bs_bridge = session_memo("bs_bridge", [bs], None, lambda: LineItemBridge(bs))
+                delta = bs_bridge.delta(prev_period, selected_period, compare_items)
+                cats = compare_items
+                vals = delta.tolist()
+
+                measures = ["relative"] * len(cats)
+                fig = create_waterfall(
+                    cats, vals,
+                    f"B/S主要項目の増減 ({prev_label} → {period_label})",
+                    measures,
+                    unit,
+                )
+                st.plotly_chart(fig, use_container_width=True, key="bs_compare_waterfall")
+            else:
+                st.info("2期比較は前年データが必要です。2期目以降を選択してください。")
+
+    # --- ドリルダウン ---
+    with tab_drill:
+        if tab_drill.open:
+            st.subheader("資産内訳の詳細")
+
+            drill_down(row, unit)
+
+    # --- データテーブル ---
+    with tab_table:
+        if tab_table.open:
+            st.subheader("B/S データテーブル")
+            styled = session_memo(
+                "bs_table", [bs], None,
+                lambda: to_display_table(bs).style.format("{:" + amount_format(unit) + "}"),
+            )
+            st.dataframe(
+                styled,
+                use_container_width=True,
+            )
+
+
+bs_view(bs, unit)
@@ -1,15 +1,25 @@
 """時系列推移ビュー - 折れ線グラフとトレンド分析。"""
 
+import pandas as pd
 import streamlit as st
 
 from utils.data_loader import (
+    company_fiscal_month,
+    has_statement,
     load_company_info,
     load_pl,
     load_bs,
     load_cf,
+    load_pl_q,
+    load_bs_q,
+    load_cf_q,
     get_period_label,
 )
 from utils.charts import create_trend_chart
+from utils.periods import fiscal_quarter_labels
+from utils.quarterly import quarterly_metrics, ttm
+from utils.session_cache import display_unit, session_memo
+from utils.units import format_amount, scaled_view
 
 st.set_page_config(page_title="Trend 時系列推移", page_icon="📊", layout="wide")
 
@@ -17,134 +27,266 @@ code = st.session_state.get("selected_code", "5139")
 info = load_company_info(code)
 st.title(f"時系列推移 - {info['name']}")
 
-pl = load_pl(code)
-bs = load_bs(code)
-cf = load_cf(code)
+# 金額は表示単位に換算
+unit = display_unit()
+pl = scaled_view(load_pl(code), unit)
+bs = scaled_view(load_bs(code), unit)
+cf = scaled_view(load_cf(code), unit)
 
-# --- 売上・利益推移 ---
-st.subheader("売上・利益の推移")
+# 四半期データがある企業は、四半期ごとの推移（直近12か月の合計・前年同期比など）も選べる
+frequency = "年次"
+if has_statement(code, "pl_q"):
+    frequency = st.radio("集計単位", ["年次", "四半期"], horizontal=True, key="trend_frequency")
 
-revenue_cols = st.multiselect(
-    "表示項目を選択",
-    ["営業収益", "売上総利益", "営業利益", "経常利益", "当期純利益"],
-    default=["営業収益", "営業利益", "当期純利益"],
-)
-
-if revenue_cols:
-    fig = create_trend_chart(pl, revenue_cols, "売上・利益の推移")
-    st.plotly_chart(fig, use_container_width=True)
 
-st.divider()
+def quarterly_view(code: str, unit: str) -> None:
+    """四半期ごとの推移（四半期の金額・直近12か月の合計・成長率・収益性・B/S）を表示する。"""
+    fiscal_month = company_fiscal_month(code)
+    pl_q = scaled_view(load_pl_q(code), unit)
+    bs_q = scaled_view(load_bs_q(code), unit) if has_statement(code, "bs_q") else None
 
-# --- 利益率推移 ---
-st.subheader("利益率の推移")
+    def quarter_labels(df):
+        return fiscal_quarter_labels(df["期"], fiscal_month)
 
-pl_rates = pl.copy()
-pl_rates["営業利益率"] = (pl_rates["営業利益"] / pl_rates["営業収益"] * 100).round(1)
-pl_rates["売上総利益率"] = (pl_rates["売上総利益"] / pl_rates["営業収益"] * 100).round(1)
-pl_rates["純利益率"] = (pl_rates["当期純利益"] / pl_rates["営業収益"] * 100).round(1)
+    # TTM・成長率・平均残高は全四半期分を一度に計算する（utils.quarterly）
+    metrics = session_memo(
+        "trend_quarterly_metrics", [pl_q] if bs_q is None else [pl_q, bs_q], None,
+        lambda: quarterly_metrics(pl_q, bs_q),
+    )
 
-fig = create_trend_chart(
-    pl_rates,
-    ["営業利益率", "売上総利益率", "純利益率"],
-    "利益率の推移",
-    unit="%",
-)
-st.plotly_chart(fig, use_container_width=True)
+    st.subheader("四半期の売上・利益")
+    st.caption("各四半期（3か月）の金額です。凡例の項目をクリックすると表示・非表示を切り替えられます。")
+    fig = session_memo(
+        "trend_quarterly_pl", [pl_q], None,
+        lambda: create_trend_chart(
+            pl_q,
+            ["営業収益", "売上総利益", "営業利益", "経常利益", "当期純利益"],
+            "四半期の売上・利益",
+            unit,
+            visible=["営業収益", "営業利益", "当期純利益"],
+            x_labels=quarter_labels(pl_q),
+        ),
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
-st.divider()
+    st.divider()
+
+    st.subheader("直近12か月（TTM）の売上・利益")
+    st.caption("各四半期末から遡る4四半期の合計です。季節変動をならした趨勢を見られます。")
+    pl_ttm = ttm(pl_q, "pl").dropna(subset=["営業収益"]).reset_index(drop=True)
+    if len(pl_ttm) > 0:
+        fig = create_trend_chart(
+            pl_ttm,
+            ["営業収益", "営業利益", "当期純利益"],
+            "直近12か月の売上・利益",
+            unit,
+            x_labels=quarter_labels(pl_ttm),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("直近12か月の合計には4四半期分のデータが必要です。")
+
+    st.divider()
+
+    st.subheader("成長率")
+    growth_columns = ["売上高前四半期比", "売上高前年同期比", "営業利益前年同期比"]
+    growth_df = metrics.dropna(subset=growth_columns, how="all").reset_index(drop=True)
+    if len(growth_df) > 0:
+        fig = create_trend_chart(
+            growth_df,
+            growth_columns,
+            "前四半期比・前年同期比",
+            unit="%",
+            visible=["売上高前年同期比", "営業利益前年同期比"],
+            x_labels=quarter_labels(growth_df),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption("前四半期比は季節変動の影響を受けるため、既定では前年同期比を表示しています。")
+
+    st.divider()
+
+    st.subheader("収益性（直近12か月）")
+    ratio_columns = ["営業利益率(TTM)"] + (["ROE(TTM)", "ROA(TTM)"] if bs_q is not None else [])
+    ratio_df = metrics.dropna(subset=ratio_columns, how="all").reset_index(drop=True)
+    if len(ratio_df) > 0:
+        fig = create_trend_chart(
+            ratio_df, ratio_columns, "収益性の推移", unit="%", x_labels=quarter_labels(ratio_df),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        if bs_q is not None:
+            st.caption("ROE・ROA は直近12か月の当期純利益を、直近5四半期末（期首と各四半期末）の平均純資産・平均総資産で割った値です。")
+
+    if has_statement(code, "cf_q"):
+        st.divider()
+        st.subheader("キャッシュフロー（直近12か月）")
+        cf_ttm = ttm(scaled_view(load_cf_q(code), unit), "cf").dropna(subset=["営業CF"]).reset_index(drop=True)
+        if len(cf_ttm) > 0:
+            cf_ttm["FCF"] = cf_ttm["営業CF"] + cf_ttm["投資CF"]
+            fig = create_trend_chart(
+                cf_ttm, ["営業CF", "投資CF", "財務CF", "FCF"], "直近12か月のキャッシュフロー", unit,
+                x_labels=quarter_labels(cf_ttm),
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+    if bs_q is not None:
+        st.divider()
+        st.subheader("四半期末のB/S")
+        fig = create_trend_chart(
+            bs_q,
+            ["資産合計", "純資産合計", "負債合計", "現金及び預金"],
+            "四半期末のB/S主要項目",
+            unit,
+            visible=["資産合計", "純資産合計", "現金及び預金"],
+            x_labels=quarter_labels(bs_q),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    st.divider()
+    st.caption("※ 四半期の金額は各四半期（3か月）の値です。年次の推移は「年次」に切り替えると表示されます。")
+
+
+def annual_view(pl: pd.DataFrame, bs: pd.DataFrame, cf: pd.DataFrame, unit: str) -> None:
+    """年次の推移（売上・利益・利益率・成長率・B/S・CF）とトレンドハイライトを表示する。"""
+    # --- 売上・利益推移 ---
+    st.subheader("売上・利益の推移")
+    st.caption("凡例の項目をクリックすると表示・非表示を切り替えられます。")
+
+    # 候補の全項目を1回だけ送り、表示項目の切り替えはブラウザ内（凡例）で行う
+    fig = session_memo(
+        "trend_revenue", [pl], None,
+        lambda: create_trend_chart(
+            pl,
+            ["営業収益", "売上総利益", "営業利益", "経常利益", "当期純利益"],
+            "売上・利益の推移",
+            unit,
+            visible=["営業収益", "営業利益", "当期純利益"],
+        ),
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
-# --- 成長率推移 ---
-st.subheader("前年比成長率")
+    st.divider()
 
-pl_growth = pl.copy()
-pl_growth["売上成長率"] = (pl_growth["営業収益"].pct_change() * 100).round(1)
-pl_growth["営業利益成長率"] = (pl_growth["営業利益"].pct_change() * 100).round(1)
-pl_growth["純利益成長率"] = (pl_growth["当期純利益"].pct_change() * 100).round(1)
+    # --- 利益率推移 ---
+    st.subheader("利益率の推移")
 
-# 最初の行はNaN
-growth_df = pl_growth.dropna(subset=["売上成長率"]).reset_index(drop=True)
+    pl_rates = pl.copy()
+    pl_rates["営業利益率"] = (pl_rates["営業利益"] / pl_rates["営業収益"] * 100).round(1)
+    pl_rates["売上総利益率"] = (pl_rates["売上総利益"] / pl_rates["営業収益"] * 100).round(1)
+    pl_rates["純利益率"] = (pl_rates["当期純利益"] / pl_rates["営業収益"] * 100).round(1)
 
-if len(growth_df) > 0:
     fig = create_trend_chart(
-        growth_df,
-        ["売上成長率", "営業利益成長率", "純利益成長率"],
-        "前年比成長率の推移",
+        pl_rates,
+        ["営業利益率", "売上総利益率", "純利益率"],
+        "利益率の推移",
         unit="%",
     )
     st.plotly_chart(fig, use_container_width=True)
 
-st.divider()
-
-# --- B/S推移 ---
-st.subheader("B/S主要項目の推移")
+    st.divider()
+
+    # --- 成長率推移 ---
+    st.subheader("前年比成長率")
+
+    pl_growth = pl.copy()
+    pl_growth["売上成長率"] = (pl_growth["営業収益"].pct_change() * 100).round(1)
+    pl_growth["営業利益成長率"] = (pl_growth["営業利益"].pct_change() * 100).round(1)
+    pl_growth["純利益成長率"] = (pl_growth["当期純利益"].pct_change() * 100).round(1)
+
+    # 最初の行はNaN
+    growth_df = pl_growth.dropna(subset=["売上成長率"]).reset_index(drop=True)
+
+    if len(growth_df) > 0:
+        fig = create_trend_chart(
+            growth_df,
+            ["売上成長率", "営業利益成長率", "純利益成長率"],
+            "前年比成長率の推移",
+            unit="%",
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    st.divider()
+
+    # --- B/S推移 ---
+    st.subheader("B/S主要項目の推移")
+    st.caption("凡例の項目をクリックすると表示・非表示を切り替えられます。")
+
+    fig = session_memo(
+        "trend_bs", [bs], None,
+        lambda: create_trend_chart(
+            bs,
+            ["資産合計", "純資産合計", "負債合計", "現金及び預金", "利益剰余金"],
+            "B/S主要項目の推移",
+            unit,
+            visible=["資産合計", "純資産合計", "現金及び預金"],
+        ),
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
-bs_cols = st.multiselect(
-    "B/S表示項目を選択",
-    ["資産合計", "純資産合計", "負債合計", "現金及び預金", "利益剰余金"],
-    default=["資産合計", "純資産合計", "現金及び預金"],
-)
+    # 自己資本比率の推移
+    bs_ratio = bs.copy()
+    bs_ratio["自己資本比率"] = (bs_ratio["純資産合計"] / bs_ratio["資産合計"] * 100).round(1)
 
-if bs_cols:
-    fig = create_trend_chart(bs, bs_cols, "B/S主要項目の推移")
+    fig = create_trend_chart(bs_ratio, ["自己資本比率"], "自己資本比率の推移", unit="%")
     st.plotly_chart(fig, use_container_width=True)
 
-# 自己資本比率の推移
-bs_ratio = bs.copy()
-bs_ratio["自己資本比率"] = (bs_ratio["純資産合計"] / bs_ratio["資産合計"] * 100).round(1)
+    st.divider()
 
-fig = create_trend_chart(bs_ratio, ["自己資本比率"], "自己資本比率の推移", unit="%")
-st.plotly_chart(fig, use_container_width=True)
+    # --- CF推移 ---
+    st.subheader("キャッシュフローの推移")
 
-st.divider()
+    fig = create_trend_chart(cf, ["営業CF", "投資CF", "財務CF"], "キャッシュフローの推移", unit)
+    st.plotly_chart(fig, use_container_width=True)
 
-# --- CF推移 ---
-st.subheader("キャッシュフローの推移")
+    # FCF推移
+    cf_fcf = cf.copy()
+    cf_fcf["FCF"] = cf_fcf["営業CF"] + cf_fcf["投資CF"]
 
-fig = create_trend_chart(cf, ["営業CF", "投資CF", "財務CF"], "キャッシュフローの推移")
-st.plotly_chart(fig, use_container_width=True)
+    fig = create_trend_chart(cf_fcf, ["FCF", "期末現金"], "FCF・現金残高の推移", unit)
+    st.plotly_chart(fig, use_container_width=True)
 
-# FCF推移
-cf_fcf = cf.copy()
-cf_fcf["FCF"] = cf_fcf["営業CF"] + cf_fcf["投資CF"]
+    st.divider()
 
-fig = create_trend_chart(cf_fcf, ["FCF", "期末現金"], "FCF・現金残高の推移")
-st.plotly_chart(fig, use_container_width=True)
+    # --- トレンドアノテーション ---
+    st.subheader("トレンドハイライト")
 
-st.divider()
+    # 最新期と前期の比較
+    latest = pl.iloc[-1]
+    prev = pl.iloc[-2]
+    latest_label = get_period_label(latest["期"])
 
-# --- トレンドアノテーション ---
-st.subheader("トレンドハイライト")
+    highlights = []
 
-# 最新期と前期の比較
-latest = pl.iloc[-1]
-prev = pl.iloc[-2]
-latest_label = get_period_label(latest["期"])
+    rev_growth = (latest["営業収益"] - prev["営業収益"]) / prev["営業収益"] * 100
+    highlights.append(f"売上高成長率 **{rev_growth:.1f}%** ({latest_label})")
 
-highlights = []
+    op_growth = (latest["営業利益"] - prev["営業利益"]) / prev["営業利益"] * 100
+    highlights.append(f"営業利益成長率 **{op_growth:.1f}%** ({latest_label})")
 
-rev_growth = (latest["営業収益"] - prev["営業収益"]) / prev["営業収益"] * 100
-highlights.append(f"売上高成長率 **{rev_growth:.1f}%** ({latest_label})")
+    op_margin = latest["営業利益"] / latest["営業収益"] * 100
+    prev_margin = prev["営業利益"] / prev["営業収益"] * 100
+    margin_change = op_margin - prev_margin
+    direction = "改善" if margin_change > 0 else "悪化"
+    highlights.append(f"営業利益率 **{op_margin:.1f}%** (前期比 {margin_change:+.1f}pt {direction})")
 
-op_growth = (latest["営業利益"] - prev["営業利益"]) / prev["営業利益"] * 100
-highlights.append(f"営業利益成長率 **{op_growth:.1f}%** ({latest_label})")
+    latest_bs = bs.iloc[-1]
+    equity_ratio = latest_bs["純資産合計"] / latest_bs["資産合計"] * 100
+    highlights.append(f"自己資本比率 **{equity_ratio:.1f}%**")
 
-op_margin = latest["営業利益"] / latest["営業収益"] * 100
-prev_margin = prev["営業利益"] / prev["営業収益"] * 100
-margin_change = op_margin - prev_margin
-direction = "改善" if margin_change > 0 else "悪化"
-highlights.append(f"営業利益率 **{op_margin:.1f}%** (前期比 {margin_change:+.1f}pt {direction})")
+    latest_cf = cf.iloc[-1]
+    fcf = latest_cf["営業CF"] + latest_cf["投資CF"]
+    highlights.append(
+        f"FCF **{format_amount(fcf, unit)}** (営業CF {format_amount(latest_cf['営業CF'], unit, suffix=False)}"
+        f" + 投資CF {format_amount(latest_cf['投資CF'], unit, suffix=False)})"
+    )
 
-latest_bs = bs.iloc[-1]
-equity_ratio = latest_bs["純資産合計"] / latest_bs["資産合計"] * 100
-highlights.append(f"自己資本比率 **{equity_ratio:.1f}%**")
+    for h in highlights:
+        st.markdown(f"- {h}")
 
-latest_cf = cf.iloc[-1]
-fcf = latest_cf["営業CF"] + latest_cf["投資CF"]
-highlights.append(f"FCF **{int(fcf):,} 百万円** (営業CF {int(latest_cf['営業CF']):,} + 投資CF {int(latest_cf['投資CF']):,})")
+    st.divider()
+    st.caption("※ 推定値を含むデータがあります。有価証券報告書から正確な数値に差し替え可能です。")
 
-for h in highlights:
-    st.markdown(f"- {h}")
 
-st.divider()
-st.caption("※ 推定値を含むデータがあります。有価証券報告書から正確な数値に差し替え可能です。")
+if frequency == "四半期":
+    quarterly_view(code, unit)
+else:
+    annual_view(pl, bs, cf, unit)
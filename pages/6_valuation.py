@@ -0,0 +1,209 @@
+"""バリュエーション - DCF による企業価値の試算・感応度分析・全社スクリーニング。"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.data_loader import (
+    load_company_info,
+    load_pl,
+    load_bs,
+    load_cf,
+    load_universe,
+    get_period_label,
+)
+from utils.charts import create_heatmap, create_tornado, create_trend_chart
+from utils.periods import period_labels
+from utils.session_cache import display_unit, session_memo
+from utils.valuation import (
+    DEFAULT_DISCOUNT_RATE,
+    DEFAULT_TERMINAL_GROWTH,
+    GROWTH_BOUNDS,
+    MARGIN_BOUNDS,
+    DcfAssumptions,
+    enterprise_value,
+    estimate_assumptions,
+    fcf_history,
+    net_cash,
+    sensitivity_grid,
+    tornado,
+    valuation_screen,
+)
+from utils.units import format_amount, scaled_view
+
+st.set_page_config(page_title="Valuation バリュエーション", page_icon="📊", layout="wide")
+
+code = st.session_state.get("selected_code", "5139")
+info = load_company_info(code)
+st.title(f"バリュエーション（DCF） - {info['name']}")
+
+# 金額は表示単位に換算（企業価値は売上に比例するので、換算後の値から試算してよい）
+unit = display_unit()
+pl = scaled_view(load_pl(code), unit)
+bs = scaled_view(load_bs(code), unit)
+cf = scaled_view(load_cf(code), unit)
+
+# 感応度グリッドの軸（割引率 45 × 永久成長率 41 × FCFマージン 40）
+DISCOUNT_RATES = np.round(np.arange(0.04, 0.1501, 0.0025), 4)
+TERMINAL_GROWTHS = np.round(np.arange(-0.01, 0.0301, 0.001), 4)
+FCF_MARGINS = np.round(np.arange(0.01, 0.4001, 0.01), 4)
+
+
+def _nearest(axis: np.ndarray, value: float) -> int:
+    """軸の中で値に最も近い位置を返す。"""
+    return int(np.abs(axis - value).argmin())
+
+
+@st.fragment
+def valuation_view(pl: pd.DataFrame, bs: pd.DataFrame, cf: pd.DataFrame, unit: str) -> None:
+    """基準期選択以降の表示。前提を変えたときはこの範囲だけ再実行する。"""
+    periods = pl["期"].tolist()
+    selected_period = st.selectbox("基準期", periods[::-1], format_func=get_period_label)
+    period_label = get_period_label(selected_period)
+
+    history = fcf_history(pl, cf)
+    history = history[history["期"] <= selected_period]
+    row_bs = bs[bs["期"] == selected_period].iloc[0]
+    base_revenue = float(history["営業収益"].iloc[-1])
+    estimated = estimate_assumptions(history)
+
+    tab_dcf, tab_screen = st.tabs(
+        ["DCF・感応度分析", "全社スクリーニング"],
+        key="valuation_tab",
+        on_change="rerun",
+    )
+
+    # --- DCF・感応度分析 ---
+    with tab_dcf:
+        if tab_dcf.open:
+            st.subheader("FCF の実績")
+            fig = session_memo(
+                "valuation_fcf", [pl, cf], selected_period,
+                lambda: create_trend_chart(history, ["営業CF", "投資CF", "FCF"], "FCF（営業CF + 投資CF）の推移", unit),
+            )
+            st.plotly_chart(fig, use_container_width=True, key="valuation_fcf_chart")
+
+            st.subheader(f"DCF の前提 ({period_label} 起点・予測5年)")
+            st.caption("売上成長率と FCF マージンの初期値は実績（期間 CAGR・中央値）から推定しています。")
+            col1, col2 = st.columns(2)
+            with col1:
+                # 初期値は推定時に同じ範囲へ切り詰めてある
+                growth = st.slider("売上成長率(%)", GROWTH_BOUNDS[0] * 100, GROWTH_BOUNDS[1] * 100,
+                                   round(estimated.revenue_growth * 100, 1), 0.5)
+                margin = st.slider("FCFマージン(%)", MARGIN_BOUNDS[0] * 100, MARGIN_BOUNDS[1] * 100,
+                                   round(estimated.fcf_margin * 100, 1), 0.5)
+            with col2:
+                rate = st.slider("割引率(%)", 4.0, 15.0, DEFAULT_DISCOUNT_RATE * 100, 0.25)
+                terminal = st.slider("永久成長率(%)", -1.0, 3.0, DEFAULT_TERMINAL_GROWTH * 100, 0.1)
+
+            assumptions = DcfAssumptions(
+                revenue_growth=growth / 100,
+                discount_rate=rate / 100,
+                terminal_growth=terminal / 100,
+                fcf_margin=margin / 100,
+            )
+            ev = float(enterprise_value(
+                base_revenue,
+                assumptions.revenue_growth,
+                assumptions.discount_rate,
+                assumptions.terminal_growth,
+                assumptions.fcf_margin,
+            ))
+            cash = net_cash(row_bs)
+
+            cols = st.columns(3)
+            with cols[0]:
+                st.metric("企業価値", format_amount(ev, unit))
+            with cols[1]:
+                st.metric("ネットキャッシュ", format_amount(cash, unit))
+            with cols[2]:
+                st.metric("株主価値", format_amount(ev + cash, unit))
+
+            st.divider()
+
+            # --- 感応度分析 ---
+            st.subheader("感応度分析")
+            grid = session_memo(
+                "valuation_grid", [pl, cf], (selected_period, assumptions.revenue_growth),
+                lambda: sensitivity_grid(base_revenue, assumptions, DISCOUNT_RATES, TERMINAL_GROWTHS, FCF_MARGINS),
+            )
+            rate_labels = [f"{r:.2%}" for r in DISCOUNT_RATES]
+            m = _nearest(FCF_MARGINS, assumptions.fcf_margin)
+            g = _nearest(TERMINAL_GROWTHS, assumptions.terminal_growth)
+
+            col1, col2 = st.columns(2)
+            with col1:
+                fig = create_heatmap(
+                    grid[:, :, m],
+                    [f"{t:.1%}" for t in TERMINAL_GROWTHS],
+                    rate_labels,
+                    f"割引率 × 永久成長率（FCFマージン {FCF_MARGINS[m]:.0%}）",
+                    "永久成長率",
+                    "割引率",
+                    unit,
+                )
+                st.plotly_chart(fig, use_container_width=True, key="valuation_heatmap_growth")
+            with col2:
+                fig = create_heatmap(
+                    grid[:, g, :],
+                    [f"{v:.0%}" for v in FCF_MARGINS],
+                    rate_labels,
+                    f"割引率 × FCFマージン（永久成長率 {TERMINAL_GROWTHS[g]:.1%}）",
+                    "FCFマージン",
+                    "割引率",
+                    unit,
+                )
+                st.plotly_chart(fig, use_container_width=True, key="valuation_heatmap_margin")
+            st.caption(f"グリッド全体: {grid.size:,} 通りの組み合わせ（割引率 ≤ 永久成長率のセルは空白）")
+
+            swings = tornado(base_revenue, assumptions)
+            fig = create_tornado(
+                swings["前提"].tolist(),
+                swings["下限時企業価値"].tolist(),
+                swings["上限時企業価値"].tolist(),
+                ev,
+                "前提ごとの企業価値への影響",
+                low_texts=[f"{v:.1%}" for v in swings["下限"]],
+                high_texts=[f"{v:.1%}" for v in swings["上限"]],
+                unit=unit,
+            )
+            st.plotly_chart(fig, use_container_width=True, key="valuation_tornado")
+
+    # --- 全社スクリーニング ---
+    with tab_screen:
+        if tab_screen.open:
+            st.subheader("全社の DCF 試算")
+            st.caption("各社の最新期を基準に、売上成長率と FCF マージンは各社の実績から推定し、割引率・永久成長率は共通の値で試算します。")
+            col1, col2 = st.columns(2)
+            with col1:
+                screen_rate = st.slider("割引率(%)", 4.0, 15.0, DEFAULT_DISCOUNT_RATE * 100, 0.25, key="screen_rate")
+            with col2:
+                screen_terminal = st.slider("永久成長率(%)", -1.0, 3.0, DEFAULT_TERMINAL_GROWTH * 100, 0.1, key="screen_terminal")
+
+            screen = session_memo(
+                "valuation_screen",
+                [load_universe("pl"), load_universe("bs"), load_universe("cf")],
+                (screen_rate, screen_terminal),
+                lambda: valuation_screen(screen_rate / 100, screen_terminal / 100),
+            )
+            screen = scaled_view(screen, unit, ["営業収益", "企業価値", "ネットキャッシュ", "株主価値"])
+            st.dataframe(
+                screen.sort_values("株主価値/純資産").assign(期=lambda d: period_labels(d["期"])),
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "売上成長率": st.column_config.NumberColumn(format="%.1f%%"),
+                    "FCFマージン": st.column_config.NumberColumn(format="%.1f%%"),
+                    "企業価値": st.column_config.NumberColumn(format="localized"),
+                    "ネットキャッシュ": st.column_config.NumberColumn(format="localized"),
+                    "株主価値": st.column_config.NumberColumn(format="localized"),
+                    "EV/営業利益": st.column_config.NumberColumn(format="%.1f"),
+                    "株主価値/純資産": st.column_config.NumberColumn(format="%.2f"),
+                },
+            )
+
+    st.divider()
+    st.caption(f"※ 簡易的な DCF 試算です。投資判断の根拠とするものではありません。　|　単位: {unit}")
+
+
+valuation_view(pl, bs, cf, unit)
@@ -0,0 +1,84 @@
+"""データチェック - 全社の財務データの要確認箇所の一覧。"""
+
+import pandas as pd
+import streamlit as st
+
+from utils.data_loader import list_companies
+from utils.anomalies import SCANNED_KINDS
+from utils.jobs import show_job, submit
+from utils.periods import period_labels
+
+st.set_page_config(page_title="データチェック", page_icon="📊", layout="wide")
+
+st.title("データチェック - 要確認箇所の一覧")
+st.markdown(
+    "全社・全期・全項目の前期比を検査し、他社と比べて極端な変化（外れ値）、"
+    "10倍以上の急変、符号の反転、利益率が過去の範囲から外れた期を一覧にしています。"
+)
+
+# 全社の検査はワーカープロセスで行う（終わるまでは進捗バーを表示する）
+job = submit("anomalies")
+anomalies = show_job(job)
+
+companies = {c["code"]: c for c in list_companies()}
+
+cols = st.columns(3)
+with cols[0]:
+    st.metric("検出件数", f"{len(anomalies):,} 件")
+with cols[1]:
+    st.metric("対象企業", f"{anomalies['code'].nunique():,} / {len(companies):,} 社")
+with cols[2]:
+    st.metric("検査時間", f"{job.elapsed:.2f} 秒")
+
+
+@st.fragment
+def anomaly_table(anomalies: pd.DataFrame) -> None:
+    """絞り込み条件を変えたときは一覧だけ再描画する。"""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        kinds = st.multiselect("財務諸表", list(SCANNED_KINDS), default=list(SCANNED_KINDS),
+                               format_func=str.upper)
+    with col2:
+        labels = sorted(anomalies["種別"].unique())
+        selected_labels = st.multiselect("種別", labels, default=labels)
+    with col3:
+        markets = sorted({c["market"] for c in companies.values()})
+        market = st.selectbox("市場", ["すべて"] + markets)
+
+    mask = anomalies["種類"].isin(kinds) & anomalies["種別"].isin(selected_labels)
+    if market != "すべて":
+        codes = [code for code, c in companies.items() if c["market"] == market]
+        mask &= anomalies["code"].isin(codes)
+    shown = anomalies.loc[mask]
+
+    if shown.empty:
+        st.info("条件に該当する要確認箇所はありません。")
+        return
+
+    st.dataframe(
+        pd.DataFrame({
+            "コード": shown["code"],
+            "企業名": shown["code"].map(lambda c: companies.get(c, {}).get("name", "")),
+            "期": period_labels(shown["期"]),
+            "種類": shown["種類"].str.upper(),
+            "項目": shown["項目"],
+            "種別": shown["種別"],
+            "詳細": shown["詳細"],
+            "z": shown["z"],
+        }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={"z": st.column_config.NumberColumn(format="%+.1f")},
+    )
+    st.download_button(
+        "CSV をダウンロード",
+        shown.to_csv(index=False).encode("utf-8-sig"),
+        file_name="anomalies.csv",
+        mime="text/csv",
+    )
+
+
+anomaly_table(anomalies)
+
+st.divider()
+st.caption("※ 実際の業績変化による場合もあります。検査はデータが更新されたときだけ再実行されます。")
@@ -0,0 +1,147 @@
+"""企業クラスタ分析 - 財務の形が似た企業のグループと指標の相関。"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.charts import create_cluster_scatter, create_matrix_heatmap
+from utils.clusters import (
+    CF_PATTERNS,
+    FEATURE_GROUPS,
+    FEATURES,
+    METHODS,
+    correlation_matrix,
+)
+from utils.data_loader import list_companies
+from utils.jobs import show_job, submit
+from utils.periods import fiscal_year_label, period_labels
+
+st.set_page_config(page_title="企業クラスタ分析", page_icon="📊", layout="wide")
+
+st.title("企業クラスタ分析 - 財務の形が似た企業")
+st.markdown(
+    "全社の収益構造・成長・資産と資本の構成・キャッシュフローの型から "
+    f"{len(FEATURES)} 個の比率を求め、外れ値を抑えて標準化したうえで、財務の形が似た企業をグループに分けます。"
+)
+
+code = st.session_state.get("selected_code", "5139")
+companies = {c["code"]: c for c in list_companies()}
+# 特徴量の計算とクラスタリングはワーカープロセスで行う（終わるまでは進捗バーを表示する）
+features = show_job(submit("cluster_features"))
+years = sorted(int(y) for y in features["年度"].unique())
+
+
+@st.fragment
+def cluster_view(code: str) -> None:
+    """条件を変えたときはこの範囲だけ再実行する（結果は条件ごとにキャッシュされる）。"""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        method = st.radio("手法", list(METHODS), format_func=METHODS.get, horizontal=True)
+    with col2:
+        k = st.slider("クラスタ数", 2, 12, 6)
+    with col3:
+        year = st.selectbox(
+            "比べる期", [None] + years[::-1],
+            format_func=lambda y: "各社の最新期" if y is None else fiscal_year_label(y),
+        )
+
+    job = submit("clusters", k, method, year)
+    try:
+        result = show_job(job)
+    except ValueError as e:
+        st.warning(str(e))
+        return
+
+    codes = result.features.index
+    sizes = np.bincount(result.labels, minlength=result.k)
+    cols = st.columns(3)
+    with cols[0]:
+        st.metric("対象企業", f"{len(codes):,} 社")
+    with cols[1]:
+        st.metric("特徴量", f"{len(FEATURES)} 個")
+    with cols[2]:
+        st.metric("計算時間", f"{job.elapsed:.2f} 秒")
+
+    highlight = int(codes.get_loc(code)) if code in codes else None
+    if highlight is not None:
+        cluster = int(result.labels[highlight])
+        name = companies.get(code, {}).get("name", code)
+        st.info(
+            f"**{name}** はクラスタ {cluster + 1}（{result.names[cluster]}、{sizes[cluster]:,} 社）に属します。"
+        )
+
+    tab_map, tab_profile, tab_members, tab_corr = st.tabs(
+        ["散布図", "クラスタの特徴", "企業一覧", "指標の相関"],
+        key="cluster_tab",
+        on_change="rerun",
+    )
+
+    with tab_map:
+        if tab_map.open:
+            hover = [f"{c} {companies.get(c, {}).get('name', '')}" for c in codes]
+            fig = create_cluster_scatter(
+                result.coords,
+                result.labels,
+                result.names,
+                hover,
+                f"財務の形の分布（{METHODS[method]}・{result.k} クラスタ）",
+                (f"第1主成分（{result.explained[0] * 100:.0f}%）", f"第2主成分（{result.explained[1] * 100:.0f}%）"),
+                highlight,
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            st.caption("主成分分析で全特徴量を2次元に縮約した位置です。近い企業ほど財務の形が似ています。")
+
+    with tab_profile:
+        if tab_profile.open:
+            centroids = result.centroids.copy()
+            centroids.index = [f"{i + 1}: {n}（{s:,}社）" for i, (n, s) in enumerate(zip(result.names, sizes))]
+            fig = create_matrix_heatmap(centroids, "クラスタごとの特徴（全社平均からの標準偏差）", limit=2.0)
+            st.plotly_chart(fig, use_container_width=True)
+
+            st.subheader("クラスタごとの中央値（%）")
+            profile = result.profile.copy()
+            profile.index = [f"{i + 1}" for i in profile.index]
+            st.dataframe(profile.round(1), use_container_width=True)
+
+            st.subheader("クラスタと CF パターン")
+            crosstab = pd.crosstab(
+                pd.Series(result.labels + 1, name="クラスタ"),
+                pd.Series(result.features["CFパターン"].to_numpy(), name="CFパターン"),
+            ).reindex(columns=list(CF_PATTERNS), fill_value=0)
+            st.dataframe(crosstab, use_container_width=True)
+
+    with tab_members:
+        if tab_members.open:
+            cluster = st.selectbox(
+                "クラスタ", list(range(result.k)),
+                index=int(result.labels[highlight]) if highlight is not None else 0,
+                format_func=lambda i: f"{i + 1}: {result.names[i]}（{sizes[i]:,}社）",
+            )
+            group = st.selectbox("表示する指標", list(FEATURE_GROUPS))
+            members = result.members(cluster)
+            st.dataframe(
+                pd.DataFrame({
+                    "コード": members.index,
+                    "企業名": [companies.get(c, {}).get("name", "") for c in members.index],
+                    "市場": [companies.get(c, {}).get("market", "") for c in members.index],
+                    "期": period_labels(members["期"]).to_numpy(),
+                    "CFパターン": members["CFパターン"].to_numpy(),
+                    **{f: members[f].round(1).to_numpy() for f in FEATURE_GROUPS[group]},
+                }),
+                use_container_width=True,
+                hide_index=True,
+            )
+
+    with tab_corr:
+        if tab_corr.open:
+            corr_method = st.radio("相関", ["spearman", "pearson"], horizontal=True,
+                                   format_func={"spearman": "順位相関", "pearson": "ピアソン"}.get)
+            corr = correlation_matrix(result.features[FEATURES], corr_method)
+            fig = create_matrix_heatmap(corr, "指標の相関行列")
+            st.plotly_chart(fig, use_container_width=True)
+
+
+cluster_view(code)
+
+st.divider()
+st.caption("※ 比率は各社の開示値から計算しています。結果はデータが更新されたときだけ再計算されます。")
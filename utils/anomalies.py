@@ -0,0 +1,341 @@
+"""全社の財務データの異常値（要確認箇所）の検出。
+
+データ更新のたびに全社・全期・全項目を検査し、次のような箇所を洗い出す。
+
+- 外れ値: 前期からの変化率が、同じ年度の他社の同じ項目と比べて極端（ロバスト z スコア）
+  （決算月の異なる企業も年度にそろえて比べる）
+- 急変: 前期の10倍以上、または1/10以下
+- 符号反転: 通常は符号が変わらない項目（投資CF など）の符号が前期と逆
+- 範囲外: 利益率が自社の過去の範囲から大きく外れている
+
+財務諸表の種類ごとに全社分を1つの配列として一括で計算する。
+実際の事業上の変化と、推定値の差し替え時の入力ミスの両方が含まれるため、
+結果は「要確認」として表示する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.data_loader import data_version, load_universe, set_backend
+from utils.metrics import calc_metrics
+from utils.periods import fiscal_year
+
+
+# 検査する財務諸表
+SCANNED_KINDS: tuple[str, ...] = ("pl", "bs", "cf")
+
+# 異常の種別
+OUTLIER = "外れ値"
+JUMP = "急変"
+SIGN_FLIP = "符号反転"
+OUT_OF_RANGE = "範囲外"
+
+# ロバスト z スコアの閾値と、MAD を標準偏差相当に換算する係数
+Z_THRESHOLD = 5.0
+MAD_SCALE = 1.4826
+
+# 前期比の倍率がこれ以上（または逆数以下）なら急変とする
+JUMP_RATIO = 10.0
+
+# 前期・当期とも絶対値がこれ未満（百万円）の変化は検査しない
+MIN_AMOUNT = 10
+
+# 符号反転を検査する項目（利益や財務CFなど、符号が変わりうる項目は除く）
+SIGN_CHECKED: dict[str, list[str]] = {
+    "pl": ["営業収益", "売上原価", "販管費"],
+    "bs": ["現金及び預金", "売掛金", "流動資産合計", "資産合計", "負債合計"],
+    "cf": ["営業CF", "投資CF"],
+}
+
+# 過去の範囲と比較する利益率と、許容する幅（%pt）
+RANGE_CHECKED: list[str] = ["営業利益率", "売上総利益率"]
+RANGE_TOLERANCE = 10.0
+
+# 範囲の比較に必要な過去の期数
+MIN_HISTORY = 2
+
+RESULT_COLUMNS: list[str] = ["code", "期", "種類", "項目", "種別", "値", "前期値", "倍率", "z", "詳細"]
+
+
+def _signed_log(values: np.ndarray) -> np.ndarray:
+    """符号付き対数（0 や負の値も扱える変化率の尺度）。"""
+    return np.sign(values) * np.log1p(np.abs(values))
+
+
+def _robust_z(change: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """列ごと・グループ（年度）ごとのロバスト z スコアを求める。"""
+    frame = pd.DataFrame(change)
+    grouped = frame.groupby(groups)
+    median = grouped.transform("median").to_numpy()
+    deviation = np.abs(change - median)
+    mad = pd.DataFrame(deviation).groupby(groups).transform("median").to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(mad > 0, (change - median) / (MAD_SCALE * mad), np.nan)
+
+
+def _collect(
+    mask: np.ndarray,
+    kind: str,
+    label: str,
+    keys: pd.DataFrame,
+    items: list[str],
+    values: np.ndarray,
+    prev: np.ndarray,
+    ratio: np.ndarray,
+    z: np.ndarray,
+) -> pd.DataFrame:
+    """フラグが立ったセルを縦持ちの結果表に変換する。"""
+    rows, cols = np.nonzero(mask)
+    return pd.DataFrame({
+        "code": keys["code"].to_numpy()[rows],
+        "期": keys["期"].to_numpy()[rows],
+        "種類": kind,
+        "項目": np.asarray(items, dtype=object)[cols],
+        "種別": label,
+        "値": values[rows, cols],
+        "前期値": prev[rows, cols],
+        "倍率": ratio[rows, cols],
+        "z": z[rows, cols],
+    })
+
+
+def scan_statement(df: pd.DataFrame, kind: str) -> pd.DataFrame:
+    """1種類の財務諸表の全社・全期・全項目の前期比を検査する。
+
+    Args:
+        df: load_universe で読んだ全社分の DataFrame。
+        kind: "pl", "bs", "cf" のいずれか。
+
+    Returns:
+        RESULT_COLUMNS（詳細を除く）を持つ検出結果。
+    """
+    df = df.sort_values(["code", "期"], kind="stable").reset_index(drop=True)
+    items = [c for c in df.columns if c not in ("code", "期")]
+    values = df[items].to_numpy(dtype=float)
+    prev = df.groupby("code", observed=True)[items].shift(1).to_numpy(dtype=float)
+
+    magnitude = np.fmax(np.abs(values), np.abs(prev))
+    material = ~np.isnan(prev) & (magnitude >= MIN_AMOUNT)
+
+    change = np.where(material, _signed_log(values) - _signed_log(prev), np.nan)
+    z = _robust_z(change, fiscal_year(df["期"]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(material & (prev != 0), values / prev, np.nan)
+
+    outlier = np.abs(np.nan_to_num(z)) >= Z_THRESHOLD
+    abs_ratio = np.abs(np.nan_to_num(ratio, nan=1.0))
+    jump = material & (values != 0) & ((abs_ratio >= JUMP_RATIO) | (abs_ratio <= 1 / JUMP_RATIO))
+    checked = np.isin(items, SIGN_CHECKED.get(kind, []))[None, :]
+    flip = material & checked & (np.sign(values) * np.sign(prev) < 0)
+
+    keys = df[["code", "期"]]
+    found = [(flip, SIGN_FLIP), (jump & ~flip, JUMP), (outlier & ~jump & ~flip, OUTLIER)]
+    return pd.concat(
+        [_collect(mask, kind, label, keys, items, values, prev, ratio, z) for mask, label in found],
+        ignore_index=True,
+    )
+
+
+def scan_margins(pl: pd.DataFrame, bs: pd.DataFrame) -> pd.DataFrame:
+    """利益率が自社の過去の範囲から外れている期を検出する。
+
+    Args:
+        pl: 全社分の損益計算書。
+        bs: 全社分の貸借対照表。
+
+    Returns:
+        RESULT_COLUMNS（詳細を除く）を持つ検出結果。値は当期、前期値は前期の利益率。
+    """
+    metrics = calc_metrics(pl, bs).sort_values(["code", "期"], kind="stable").reset_index(drop=True)
+    grouped = metrics.groupby("code", observed=True)[RANGE_CHECKED]
+    prior_max = metrics[RANGE_CHECKED].groupby(metrics["code"], observed=True).cummax()
+    prior_min = metrics[RANGE_CHECKED].groupby(metrics["code"], observed=True).cummin()
+    # 当期を含まない過去の範囲にするため1期ずらす
+    prior_max = prior_max.groupby(metrics["code"], observed=True).shift(1).to_numpy(dtype=float)
+    prior_min = prior_min.groupby(metrics["code"], observed=True).shift(1).to_numpy(dtype=float)
+    history = metrics.groupby("code", observed=True).cumcount().to_numpy()[:, None]
+
+    values = metrics[RANGE_CHECKED].to_numpy(dtype=float)
+    prev = grouped.shift(1).to_numpy(dtype=float)
+    outside = (history >= MIN_HISTORY) & (
+        (values > prior_max + RANGE_TOLERANCE) | (values < prior_min - RANGE_TOLERANCE)
+    )
+    nan = np.full(values.shape, np.nan)
+    return _collect(outside, "pl", OUT_OF_RANGE, metrics[["code", "期"]], RANGE_CHECKED, values, prev, nan, nan)
+
+
+def _describe(result: pd.DataFrame) -> pd.Series:
+    """検出結果ごとの説明文を作る（件数は少ないので行ごとに整形する）。"""
+    texts = []
+    for label, value, prev, ratio, z in result[["種別", "値", "前期値", "倍率", "z"]].itertuples(index=False):
+        if label == OUT_OF_RANGE:
+            texts.append(f"{value:.1f}%（前期 {prev:.1f}%）が過去の範囲から{RANGE_TOLERANCE:.0f}pt以上乖離")
+        elif label == SIGN_FLIP:
+            texts.append(f"{prev:,.0f} → {value:,.0f}（符号が反転）")
+        elif label == JUMP:
+            texts.append(f"{prev:,.0f} → {value:,.0f}（前期比 {ratio:.1f}倍）")
+        else:
+            texts.append(f"{prev:,.0f} → {value:,.0f}（他社と比べた変化の z = {z:+.1f}）")
+    return pd.Series(texts, index=result.index, dtype=object)
+
+
+def scan_universe() -> pd.DataFrame:
+    """全社・全期・全項目の異常値を検出する。
+
+    Returns:
+        RESULT_COLUMNS を持ち、z スコアの絶対値が大きい順に並んだ DataFrame。
+    """
+    frames = {kind: load_universe(kind) for kind in SCANNED_KINDS}
+    parts = [scan_statement(frames[kind], kind) for kind in SCANNED_KINDS]
+    parts.append(scan_margins(frames["pl"], frames["bs"]))
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    result = pd.concat(parts, ignore_index=True)
+    result["code"] = result["code"].astype(str)
+    result["期"] = result["期"].astype(np.int32)
+    result = result.iloc[np.argsort(-np.abs(result["z"].fillna(0).to_numpy()), kind="stable")]
+    result = result.reset_index(drop=True)
+    result["詳細"] = _describe(result)
+    return result[RESULT_COLUMNS]
+
+
+_anomalies: tuple[str, pd.DataFrame] | None = None
+_lock = threading.Lock()
+
+
+def get_anomalies() -> pd.DataFrame:
+    """現在のデータ版に対応する検出結果を返す（データ更新時のみ再検査）。
+
+    Returns:
+        scan_universe() の結果。
+    """
+    global _anomalies
+    version = data_version(SCANNED_KINDS)
+    with _lock:
+        if _anomalies is None or _anomalies[0] != version:
+            _anomalies = (version, scan_universe())
+        return _anomalies[1]
+
+
+def set_anomalies(version: str, result: pd.DataFrame) -> None:
+    """別プロセスで検査した結果を取り込む（同じデータ版では get_anomalies が再検査しない）。
+
+    Args:
+        version: 検査したデータの版（data_version(SCANNED_KINDS)）。
+        result: scan_universe() の結果。
+    """
+    global _anomalies
+    with _lock:
+        _anomalies = (version, result)
+
+
+def company_anomalies(
+    code: str,
+    period: int | None = None,
+    kinds: Sequence[str] | None = None,
+    anomalies: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """1社分の検出結果を返す。
+
+    Args:
+        code: 証券コード。
+        period: 対象の期コード。None なら全期。
+        kinds: 対象の財務諸表種別。None なら全種別。
+        anomalies: 全社の検出結果。None なら get_anomalies() を使う。
+
+    Returns:
+        検出結果の該当行。
+    """
+    result = get_anomalies() if anomalies is None else anomalies
+    mask = result["code"] == code
+    if period is not None:
+        mask &= result["期"] == int(period)
+    if kinds is not None:
+        mask &= result["種類"].isin(kinds)
+    return result.loc[mask]
+
+
+# show_anomaly_badges が投入した検査ジョブを保持するセッションのキー
+_JOB_STATE_KEY = "_anomalies_job"
+
+
+def show_anomaly_badges(code: str, period: int, kinds: Sequence[str]) -> None:
+    """選択中の期に要確認箇所があればバッジと明細を表示する。
+
+    全社の検査は jobs モジュールのワーカーで行う。検査が終わっていなければ何も表示せずに
+    ページの表示を続け、終わった時点でページを再実行してバッジを出す。
+    ジョブはデータ版ごとにセッションに保持し、再実行のたびに投入し直さない
+    （失敗したジョブだけは次の再実行で投入し直す）。
+
+    Args:
+        code: 証券コード。
+        period: 表示中の期。
+        kinds: 対象の財務諸表種別。
+    """
+    from utils.jobs import rerun_when_done, submit
+
+    job = st.session_state.get(_JOB_STATE_KEY)
+    if job is None or job.version != data_version(SCANNED_KINDS) or job.error is not None:
+        job = submit("anomalies")
+        st.session_state[_JOB_STATE_KEY] = job
+    if not job.done():
+        rerun_when_done(job)
+        return
+    if job.error is not None:
+        # バッジは補助的な表示なので、検査に失敗してもページの表示は続ける
+        return
+    found = company_anomalies(code, period, kinds, job.result())
+    if found.empty:
+        return
+    badges = " ".join(f":orange-badge[:material/warning: {item}（{label}）]"
+                      for item, label in found[["項目", "種別"]].itertuples(index=False))
+    st.markdown(badges)
+    with st.expander(f"データの要確認箇所（{len(found)}件）"):
+        for item, detail in found[["項目", "詳細"]].itertuples(index=False):
+            st.markdown(f"**{item}**: {detail}")
+        st.caption("実際の業績変化の場合もあります。推定値を差し替えた際の入力ミスがないか確認してください。")
+
+
+def main(argv: list[str] | None = None) -> None:
+    """データ更新後に全社を検査して結果を表示・保存する CLI。"""
+    from utils.storage import CsvBackend, SqliteBackend
+
+    parser = argparse.ArgumentParser(description="全社の財務データの異常値を検出する")
+    parser.add_argument("--data-dir", type=Path, help="企業別CSVディレクトリ（既定: data/）")
+    parser.add_argument("--db", type=Path, help="SQLite データベース（--data-dir より優先）")
+    parser.add_argument("--output", type=Path, help="検出結果を書き出す CSV ファイル")
+    args = parser.parse_args(argv)
+    if args.db is not None:
+        set_backend(SqliteBackend(args.db))
+    elif args.data_dir is not None:
+        set_backend(CsvBackend(args.data_dir))
+
+    # 読み込みと検査の時間を分けて表示する（scan_universe は読み込み済みの全社分を再利用する）
+    started = time.perf_counter()
+    for kind in SCANNED_KINDS:
+        load_universe(kind)
+    loaded = time.perf_counter()
+    result = scan_universe()
+    scanned = time.perf_counter()
+    print(
+        f"{result['code'].nunique()} 社・{len(result)} 件を検出しました"
+        f"（読み込み {loaded - started:.2f} 秒・検査 {scanned - loaded:.2f} 秒）。"
+    )
+    for label, count in result["種別"].value_counts().items():
+        print(f"  {label}: {count}")
+    if args.output is not None:
+        result.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""財務データ・経営指標・チャート定義を返すローカル JSON API サーバー。
+
+Streamlit ページと同じ `utils.data_loader` / `utils.charts` を使い、
+画面を経由せずに他のツールから数値や Plotly の figure JSON を取得できるようにする。
+
+起動::
+
+    python -m utils.api --port 8502
+
+エンドポイント（いずれも GET）:
+    /companies                                    企業一覧
+    /companies/<code>                             企業基本情報
+    /companies/<code>/<pl|bs|cf|segment|factors>  財務諸表（レコード形式）
+    /companies/<code>/metrics                     経営指標
+    /companies/<code>/figures/<name>?period=...   チャートの figure JSON
+
+レスポンスにはデータ内容から求めた ETag を付け、If-None-Match が一致すれば 304 を返す。
+クライアントが gzip を受け付ける場合は圧縮して返す。
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from utils import data_loader
+from utils.charts import (
+    bs_block_spec,
+    cf_sankey_spec,
+    figure_to_json,
+    gauges_spec,
+    pl_sankey_spec,
+    trend_chart_spec,
+)
+from utils.metrics import calc_metrics
+from utils.peers import GAUGE_RANGES, get_peer_distributions
+from utils.periods import to_period
+from utils.storage import STATEMENT_KINDS
+
+
+# これより小さいレスポンスは圧縮しない
+GZIP_MIN_BYTES = 1024
+
+
+class NotFound(Exception):
+    """存在しないリソースへのリクエスト。"""
+
+
+class BadRequest(Exception):
+    """パラメータが不正なリクエスト。"""
+
+
+@dataclass(frozen=True)
+class Response:
+    """生成済みレスポンス（圧縮版と ETag を含む）。"""
+
+    body: bytes
+    etag: str
+    gzipped: bytes | None
+    content_type: str = "application/json; charset=utf-8"
+
+    @classmethod
+    def from_json_text(cls, text: str) -> Response:
+        body = text.encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        gzipped = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+        return cls(body=body, etag=etag, gzipped=gzipped)
+
+
+def _dump(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _records(df: pd.DataFrame) -> str:
+    return df.to_json(orient="records", force_ascii=False)
+
+
+def _period_row(code: str, df: pd.DataFrame, query: dict[str, list[str]]) -> tuple[pd.Series, str]:
+    """?period= で指定された期の行を返す（省略時は最新期）。
+
+    期は "2024.10" 形式と期コード（202410）のどちらでも指定できる。
+    """
+    if "period" not in query:
+        row = df.iloc[-1]
+    else:
+        try:
+            period = to_period(query["period"][0], data_loader.company_fiscal_month(code))
+        except ValueError:
+            raise BadRequest(f"period が不正です: {query['period'][0]}") from None
+        match = df[df["期"] == period]
+        if match.empty:
+            raise NotFound(f"期が見つかりません: {query['period'][0]}")
+        row = match.iloc[0]
+    return row, data_loader.get_period_label(row["期"])
+
+
+def _figure_pl_sankey(code: str, query: dict[str, list[str]]) -> str:
+    row, label = _period_row(code, data_loader.load_pl(code), query)
+    return figure_to_json(pl_sankey_spec(row, label))
+
+
+def _figure_bs_block(code: str, query: dict[str, list[str]]) -> str:
+    row, label = _period_row(code, data_loader.load_bs(code), query)
+    return figure_to_json(bs_block_spec(row, label))
+
+
+def _figure_cf_sankey(code: str, query: dict[str, list[str]]) -> str:
+    row, label = _period_row(code, data_loader.load_cf(code), query)
+    return figure_to_json(cf_sankey_spec(row, label))
+
+
+def _figure_trend(code: str, query: dict[str, list[str]]) -> str:
+    kind = query.get("kind", ["pl"])[0]
+    if kind not in ("pl", "bs", "cf"):
+        raise BadRequest(f"kind は pl, bs, cf のいずれかです: {kind}")
+    df = data_loader.load_statement(code, kind)
+    columns = [c for c in query.get("columns", [""])[0].split(",") if c]
+    if not columns:
+        raise BadRequest("columns を指定してください（例: columns=営業収益,営業利益）")
+    unknown = [c for c in columns if c not in df.columns]
+    if unknown:
+        raise BadRequest(f"未知の列です: {', '.join(unknown)}")
+    title = query.get("title", ["時系列推移"])[0]
+    return figure_to_json(trend_chart_spec(df, columns, title))
+
+
+def _figure_gauges(code: str, query: dict[str, list[str]]) -> str:
+    metrics = calc_metrics(data_loader.load_pl(code), data_loader.load_bs(code))
+    row, _ = _period_row(code, metrics, query)
+    # ダッシュボードの既定（全上場企業との比較）と同じ色分けにする
+    peers = get_peer_distributions()
+    return figure_to_json(gauges_spec([
+        (name, round(row[name], 1), peers.gauge_ranges(name, row["期"])) for name in GAUGE_RANGES
+    ]))
+
+
+FIGURES: dict[str, Callable[[str, dict[str, list[str]]], str]] = {
+    "pl_sankey": _figure_pl_sankey,
+    "bs_block": _figure_bs_block,
+    "cf_sankey": _figure_cf_sankey,
+    "trend": _figure_trend,
+    "gauges": _figure_gauges,
+}
+
+
+def render(path: str, query: dict[str, list[str]]) -> str:
+    """パスとクエリから JSON テキストを生成する。
+
+    Args:
+        path: リクエストパス（クエリ文字列を除く）。
+        query: parse_qs 形式のクエリ。
+
+    Returns:
+        レスポンスボディの JSON テキスト。
+
+    Raises:
+        NotFound: 該当するリソースがない場合。
+        BadRequest: パラメータが不正な場合。
+    """
+    parts = [p for p in path.split("/") if p]
+    if parts == ["companies"]:
+        return _dump(data_loader.list_companies())
+    if len(parts) < 2 or parts[0] != "companies":
+        raise NotFound(path)
+
+    code = parts[1]
+    try:
+        info = data_loader.load_company_info(code)
+    except (FileNotFoundError, KeyError) as e:
+        raise NotFound(f"企業データがありません: {code}") from e
+
+    if len(parts) == 2:
+        return _dump(info)
+    if len(parts) == 3 and parts[2] in STATEMENT_KINDS:
+        return _records(data_loader.load_statement(code, parts[2]))
+    if len(parts) == 3 and parts[2] == "metrics":
+        return _records(calc_metrics(data_loader.load_pl(code), data_loader.load_bs(code)))
+    if len(parts) == 4 and parts[2] == "figures" and parts[3] in FIGURES:
+        return FIGURES[parts[3]](code, query)
+    raise NotFound(path)
+
+
+class ResponseCache:
+    """URL ごとの生成済みレスポンスを TTL 付きで保持する LRU キャッシュ。
+
+    キーにはデータ版を含めるので、データ更新後は TTL を待たずに作り直される。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 60.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Response]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Response]) -> Response:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and now - hit[0] < self.ttl:
+                self._entries.move_to_end(key)
+                return hit[1]
+        response = factory()
+        with self._lock:
+            self._entries[key] = (now, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return response
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """GET リクエストを render() に振り分けるハンドラ。"""
+
+    server_version = "FinanceVisualizerAPI/1.0"
+    cache: ResponseCache = ResponseCache()
+
+    def do_GET(self) -> None:  # noqa: N802 - BaseHTTPRequestHandler の命名規約
+        self._handle(send_body=True)
+
+    def do_HEAD(self) -> None:  # noqa: N802
+        self._handle(send_body=False)
+
+    def _handle(self, send_body: bool) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        # データ版をキーに含める（更新前の本文・ETag を返し続けないため）。
+        # 版は VERSION の読み込みだけで求まる（storage.bump_version）ので、304 を返す場合も安価
+        key = (data_loader.data_version(), self.path)
+        try:
+            response = self.cache.get_or_create(
+                key, lambda: Response.from_json_text(render(url.path, query))
+            )
+        except NotFound as e:
+            self._send_error(HTTPStatus.NOT_FOUND, str(e))
+            return
+        except BadRequest as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        except Exception as e:  # noqa: BLE001 - 接続を切らずにエラーとして返す
+            self.log_error("%s の生成に失敗しました: %r", self.path, e)
+            traceback.print_exc()
+            self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, f"{type(e).__name__}: {e}")
+            return
+
+        if response.etag in _parse_if_none_match(self.headers.get("If-None-Match")):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._send_cache_headers(response)
+            self.end_headers()
+            return
+
+        body = response.body
+        use_gzip = response.gzipped is not None and "gzip" in self.headers.get("Accept-Encoding", "")
+        if use_gzip:
+            body = response.gzipped
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", response.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self._send_cache_headers(response)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _send_cache_headers(self, response: Response) -> None:
+        self.send_header("ETag", response.etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+
+    def _send_error(self, status: HTTPStatus, message: str) -> None:
+        body = _dump({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _parse_if_none_match(value: str | None) -> set[str]:
+    if not value:
+        return set()
+    tags = {t.strip() for t in value.split(",")}
+    # 弱い ETag (W/"...") も同一視する
+    return {t[2:] if t.startswith("W/") else t for t in tags}
+
+
+def main(argv: list[str] | None = None) -> None:
+    """API サーバーを起動する。"""
+    parser = argparse.ArgumentParser(description="財務データ JSON API サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--cache-ttl", type=float, default=60.0,
+                        help="生成済みレスポンスを再利用する秒数")
+    args = parser.parse_args(argv)
+
+    ApiHandler.cache = ResponseCache(ttl=args.cache_ttl)
+    server = ThreadingHTTPServer((args.host, args.port), ApiHandler)
+    print(f"http://{args.host}:{args.port}/companies で待ち受けています。")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
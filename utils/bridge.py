@@ -0,0 +1,122 @@
+"""任意の2期間の増減（ブリッジ）の計算。
+
+各項目の期末値は期ごとの増減の累積和なので、任意の2期の増減は値の引き算1回で求まる。
+変動要因（factors）は期ごとの金額を項目別に累積しておき、
+複数期にまたがるブリッジでも累積値の引き算で各項目の合計を求める。
+
+期の区間は「開始期（含まない）〜終了期（含む）」で表す。
+開始期 2022.12・終了期 2025.12 なら 2023.12〜2025.12 の3期分の増減。
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def parse_amount(value: object) -> float:
+    """変動要因の金額（"+562", "−177", "1,234" など）を数値に変換する。
+
+    Args:
+        value: factors.csv の金額列の値。
+
+    Returns:
+        金額（企業の金額単位のまま）。
+    """
+    return float(str(value).replace(",", "").replace("−", "-").replace("+", ""))
+
+
+class LineItemBridge:
+    """財務諸表の各項目の任意の2期間の増減。"""
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        """期ごとの値の配列を構築する。
+
+        Args:
+            df: 期列を含む財務諸表の DataFrame（1社分）。
+        """
+        self.periods: list[int] = df["期"].tolist()
+        self._position = {p: i for i, p in enumerate(self.periods)}
+        self.columns: list[str] = [
+            c for c in df.columns if c != "期" and pd.api.types.is_numeric_dtype(df[c])
+        ]
+        self._values = df[self.columns].to_numpy(dtype=float)
+
+    def span(self, start: int, end: int) -> int:
+        """区間に含まれる期数を返す。"""
+        return self._position[end] - self._position[start]
+
+    def delta(self, start: int, end: int, columns: list[str] | None = None) -> pd.Series:
+        """開始期から終了期までの各項目の増減を返す。
+
+        Args:
+            start: 開始期（比較元）。
+            end: 終了期（比較先）。
+            columns: 対象の項目。None なら全項目。
+
+        Returns:
+            項目名をインデックスとする増減の Series。
+        """
+        diff = pd.Series(
+            self._values[self._position[end]] - self._values[self._position[start]],
+            index=self.columns,
+        )
+        return diff if columns is None else diff[columns]
+
+
+class FactorBridge:
+    """営業利益の変動要因を任意の期間で集計する。"""
+
+    def __init__(self, factors: pd.DataFrame, periods: list[int], scale: float = 1.0) -> None:
+        """項目別の変動要因の累積和を構築する。
+
+        Args:
+            factors: 変動要因の DataFrame（1社分）。
+            periods: 期の一覧（P/L の期列の順）。
+            scale: 金額に掛ける倍率。金額は文字列のまま読み込まれ単位換算されていないため、
+                企業の金額単位から表示単位への倍率（units.unit_factor）を渡す。
+        """
+        self.periods = list(periods)
+        self._position = {p: i for i, p in enumerate(self.periods)}
+        self._factors = factors.assign(
+            金額=factors["金額"].map(parse_amount) * scale,
+            _pos=factors["期"].astype(int).map(self._position),
+        ).dropna(subset=["_pos"])
+        self.items: list[str] = list(dict.fromkeys(self._factors["項目"].astype(str)))
+
+        amounts = np.zeros((len(self.periods), len(self.items)))
+        np.add.at(
+            amounts,
+            (self._factors["_pos"].to_numpy(dtype=int),
+             self._factors["項目"].astype(str).map(self.items.index).to_numpy(dtype=int)),
+            self._factors["金額"].to_numpy(dtype=float),
+        )
+        # 先頭に0の行を置き、cum[i + 1] が i 番目の期までの累積になるようにする
+        self._cumulative = np.vstack([np.zeros(len(self.items)), amounts.cumsum(axis=0)])
+        has_factors = np.zeros(len(self.periods), dtype=int)
+        has_factors[np.unique(self._factors["_pos"].to_numpy(dtype=int))] = 1
+        self._covered = np.concatenate([[0], has_factors.cumsum()])
+
+    def covers(self, start: int, end: int) -> bool:
+        """区間内のすべての期に変動要因のデータがあるかを返す。"""
+        i, j = self._position[start] + 1, self._position[end] + 1
+        return bool(self._covered[j] - self._covered[i] == j - i)
+
+    def by_item(self, start: int, end: int) -> pd.Series:
+        """区間内の変動要因を項目別に合計する。
+
+        Args:
+            start: 開始期（含まない）。
+            end: 終了期（含む）。
+
+        Returns:
+            項目（売上増加・原価増加など）をインデックスとする金額の Series。
+        """
+        i, j = self._position[start] + 1, self._position[end] + 1
+        return pd.Series(self._cumulative[j] - self._cumulative[i], index=self.items)
+
+    def details(self, start: int, end: int) -> pd.DataFrame:
+        """区間内の変動要因の明細（金額は数値に変換済み）を返す。"""
+        i, j = self._position[start], self._position[end]
+        mask = (self._factors["_pos"] > i) & (self._factors["_pos"] <= j)
+        return self._factors.loc[mask].drop(columns="_pos")
@@ -1,12 +1,30 @@
-"""Plotlyチャート生成関数群。"""
+"""Plotlyチャート生成関数群。
+
+各図は「図の定義」（plotly.js にそのまま渡せる dict。*_spec）として組み立て、
+create_* はそれを Figure に包んで返す。go.Bar(...) などのオブジェクトを経由すると
+プロパティごとの検証が図の生成時間の大半を占めるため、通常は検証せずに包む
+（環境変数 FINANCE_VALIDATE_FIGURES=1 のとき、または validate_spec で検証する）。
+REST API など JSON だけが必要な経路は *_spec を figure_to_json に直接渡す。
+"""
 
 from __future__ import annotations
 
+import base64
+import os
+from collections.abc import Callable, Sequence
 from typing import Any
 
+import numpy as np
 import plotly.graph_objects as go
+import plotly.io as pio
 import pandas as pd
 
+from utils.periods import period_label, period_labels
+from utils.units import CANONICAL_UNIT, amount_format, format_amount
+
+
+# 図の定義（plotly.js の figure と同じ形の dict）
+FigureSpec = dict[str, Any]
 
 # 共通カラーパレット
 COLORS = {
@@ -27,16 +45,164 @@ COLORS = {
     "subtotal": "#42A5F5",
 }
 
+# plotly 既定テンプレート（約7KB）は再描画のたびに WebSocket で送られるため、
+# 全チャートで必要最小限の共通テンプレートを使う
+SLIM_TEMPLATE: dict[str, Any] = {"layout": {
+    "colorway": ["#2196F3", "#4CAF50", "#FF9800", "#9C27B0", "#F44336", "#00BCD4"],
+    "paper_bgcolor": "white",
+    "plot_bgcolor": "white",
+    "xaxis": {"gridcolor": "#EEEEEE", "zeroline": False, "automargin": True},
+    "yaxis": {"gridcolor": "#EEEEEE", "zerolinecolor": "#BDBDBD", "automargin": True},
+}}
+
+# 図の種類ごとのシリアライズ後サイズの上限（バイト）。
+# 実測値に余裕を持たせた値で、超えた図は figure_bench --check が失敗する
+# （全期分のフレームを持つ図は5期分、cluster_scatter は2,000社分の値）
+FIGURE_BYTE_BUDGETS: dict[str, int] = {
+    "pl_sankey": 2_000,
+    "pl_sankey_frames": 10_000,
+    "bs_block": 4_000,
+    "bs_block_frames": 20_000,
+    "cf_sankey": 1_500,
+    "cf_sankey_frames": 7_000,
+    "waterfall": 2_500,
+    "treemap": 1_500,
+    "trend": 2_000,
+    "gauge": 1_200,
+    "gauges": 4_000,
+    "fan_chart": 3_000,
+    "heatmap": 14_000,
+    "tornado": 2_000,
+    "cluster_scatter": 60_000,
+    "matrix_heatmap": 4_000,
+}
+
+# 推移チャートで1系列あたりに送る点の上限（超える場合は間引く）
+TREND_MAX_POINTS = 120
+
+# 全期分のフレームを持つ図（create_*_frames）の再生ボタンで、1期を表示する時間（ミリ秒）
+FRAME_DURATION = 800
+
+# 全期分のフレームを持つ図で、期ごとの注記（_with_period_frames の note）のために上部に空ける高さ（px）
+NOTE_HEIGHT = 30
+
+# create_* で Figure を作るときに plotly のプロパティ検証を行うか（テスト・開発時に有効にする）
+VALIDATE_FIGURES = os.environ.get("FINANCE_VALIDATE_FIGURES", "") not in ("", "0")
+
+
+def _slim_template(**data: dict[str, Any]) -> dict[str, Any]:
+    """共通テンプレートにトレース共通の既定値を加えたテンプレートを返す。
+
+    全トレースで同じ属性（hovertemplate など）をトレースごとに持たせず、
+    テンプレートに1回だけ書くことでペイロードを減らす。
+    """
+    return {
+        "layout": SLIM_TEMPLATE["layout"],
+        "data": {trace_type: [defaults] for trace_type, defaults in data.items()},
+    }
+
+
+def _title(text: str, size: int = 16) -> dict[str, Any]:
+    """図のタイトル。"""
+    return {"text": text, "font": {"size": size}}
+
 
-def create_pl_sankey(row: pd.Series, period_label: str) -> go.Figure:
-    """P/Lサンキーダイアグラムを生成する。
+def _typed_array(values: Any, dtype: str | None = None) -> dict[str, str]:
+    """数値の配列を plotly.js の型付き配列（base64）にする。
+
+    検証済みの Figure を JSON にしたときと同じ形で、数値をテキストで並べるより小さい。
+
+    Args:
+        values: 数値の配列。
+        dtype: 要素の型（"f8"・"f4" など。有効数字で十分な値は "f4"）。
+            省略時は整数で int32 に収まれば "i4"、それ以外は "f8"（plotly と同じ）。
+
+    Returns:
+        {"dtype": ..., "bdata": ...}。
+    """
+    array = np.asarray(values)
+    if dtype is None:
+        info = np.iinfo(np.int32)
+        fits = array.dtype.kind in "iu" and (array.size == 0 or (array.min() >= info.min and array.max() <= info.max))
+        dtype = "i4" if fits else "f8"
+    array = np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder("<"))
+    return {"dtype": dtype, "bdata": base64.b64encode(array.tobytes()).decode("ascii")}
+
+
+def figure_from_spec(spec: FigureSpec) -> go.Figure:
+    """図の定義を Figure に包む（VALIDATE_FIGURES が偽なら検証しない）。
+
+    Args:
+        spec: 図の定義。
+
+    Returns:
+        Plotly Figure。st.plotly_chart は検証済みの Figure として扱い、再検証しない。
+    """
+    if VALIDATE_FIGURES:
+        return go.Figure(spec)
+    # plotly は _validate=False でもフレームだけは常に検証する（全期分のフレームを持つ図では
+    # 生成時間の大半になる）。公開 API の frames 引数で渡し、データとレイアウトの検証だけを省く
+    return go.Figure(
+        data=spec.get("data", []),
+        layout=spec.get("layout", {}),
+        frames=spec.get("frames"),
+        _validate=False,
+    )
+
+
+def validate_spec(spec: FigureSpec) -> go.Figure:
+    """図の定義を plotly のプロパティ検証にかける（テスト・ベンチマークでの確認用）。
+
+    Args:
+        spec: 図の定義。
+
+    Returns:
+        検証済みの Figure。
+
+    Raises:
+        ValueError: plotly が受け付けないプロパティや値がある場合。
+    """
+    return go.Figure(spec)
+
+
+def figure_to_json(fig: go.Figure | FigureSpec) -> str:
+    """Figure または図の定義をブラウザ送信用の JSON 文字列に変換する。
+
+    orjson がインストールされていれば plotly が自動的に使う。
+    numpy 配列は Figure なら plotly 6 以降で、図の定義なら _typed_array で
+    型付き配列（base64）として出力される。
+
+    Args:
+        fig: Plotly Figure または図の定義。
+
+    Returns:
+        JSON 文字列。
+    """
+    return pio.to_json(fig, validate=False)
+
+
+def payload_size(fig: go.Figure | FigureSpec) -> int:
+    """Figure をシリアライズしたときのバイト数を返す。
+
+    Args:
+        fig: Plotly Figure または図の定義。
+
+    Returns:
+        UTF-8 エンコード後のバイト数。FIGURE_BYTE_BUDGETS と比較して使う。
+    """
+    return len(figure_to_json(fig).encode("utf-8"))
+
+
+def pl_sankey_spec(row: pd.Series, period_label: str, unit: str = CANONICAL_UNIT) -> FigureSpec:
+    """P/Lサンキーダイアグラムの定義を生成する。
 
     Args:
         row: P/Lの1期分のデータ行。
         period_label: 表示用期間ラベル。
+        unit: 値の単位。
 
     Returns:
-        Plotly Figure。
+        図の定義。
     """
     labels = [
         "営業収益",          # 0
@@ -79,7 +245,7 @@ def create_pl_sankey(row: pd.Series, period_label: str) -> go.Figure:
     ]
 
     # 負の値をゼロにクランプ
-    values = [max(0, v) for v in values]
+    values = [max(0.0, float(v)) for v in values]
 
     link_colors = [
         "rgba(255,87,34,0.3)",   # 原価
@@ -93,43 +259,52 @@ def create_pl_sankey(row: pd.Series, period_label: str) -> go.Figure:
         "rgba(76,175,80,0.3)",   # 純利益
     ]
 
-    fig = go.Figure(data=[go.Sankey(
-        node=dict(
-            pad=20,
-            thickness=25,
-            label=[f"{l}<br>{int(row.get(l, 0)):,}" if l in row.index else l
-                   for l in labels],
-            color=node_colors,
-            hovertemplate="%{label}<extra></extra>",
-        ),
-        link=dict(
-            source=source,
-            target=target,
-            value=values,
-            color=link_colors,
-            hovertemplate="%{source.label} → %{target.label}<br>%{value:,} 百万円<extra></extra>",
-        ),
-    )])
-
-    fig.update_layout(
-        title=dict(text=f"損益計算書フロー ({period_label})", font=dict(size=16)),
-        font=dict(size=11),
-        height=700,
-        margin=dict(l=30, r=150, t=50, b=40),
-    )
-    fig.update_traces(node=dict(pad=25))
-    return fig
-
-
-def create_waterfall(
+    return {
+        "data": [{
+            "type": "sankey",
+            "node": {
+                "pad": 25,
+                "thickness": 25,
+                "label": [f"{l}<br>{format_amount(row[l], unit, suffix=False)}" if l in row.index else l
+                          for l in labels],
+                "color": node_colors,
+                "hovertemplate": "%{label}<extra></extra>",
+            },
+            "link": {
+                "source": source,
+                "target": target,
+                "value": values,
+                "color": link_colors,
+                "hovertemplate": (
+                    "%{source.label} → %{target.label}<br>%{value:" + amount_format(unit) + "} "
+                    + unit + "<extra></extra>"
+                ),
+            },
+        }],
+        "layout": {
+            "template": SLIM_TEMPLATE,
+            "title": _title(f"損益計算書フロー ({period_label})"),
+            "font": {"size": 11},
+            "height": 700,
+            "margin": {"l": 30, "r": 150, "t": 50, "b": 40},
+        },
+    }
+
+
+def create_pl_sankey(row: pd.Series, period_label: str, unit: str = CANONICAL_UNIT) -> go.Figure:
+    """P/Lサンキーダイアグラムを生成する（引数は pl_sankey_spec と同じ）。"""
+    return figure_from_spec(pl_sankey_spec(row, period_label, unit))
+
+
+def waterfall_spec(
     categories: list[str],
     values: list[float],
     title: str,
     measures: list[str] | None = None,
-    unit: str = "百万円",
+    unit: str = CANONICAL_UNIT,
     hover_texts: list[str] | None = None,
-) -> go.Figure:
-    """ウォーターフォールチャートを生成する。
+) -> FigureSpec:
+    """ウォーターフォールチャートの定義を生成する。
 
     Args:
         categories: カテゴリラベルのリスト。
@@ -140,57 +315,69 @@ def create_waterfall(
         hover_texts: 各バーのホバー時に表示する説明テキスト。
 
     Returns:
-        Plotly Figure。
+        図の定義。
     """
     if measures is None:
         measures = ["absolute"] + ["relative"] * (len(categories) - 2) + ["total"]
 
-    colors_increasing = COLORS["positive"]
-    colors_decreasing = COLORS["negative"]
-    colors_total = COLORS["total"]
-
-    waterfall_kwargs: dict[str, Any] = dict(
-        orientation="v",
-        measure=measures,
-        x=categories,
-        y=values,
-        text=[f"{v:+,.0f}" if m == "relative" else f"{v:,.0f}"
-              for v, m in zip(values, measures)],
-        textposition="outside",
-        increasing=dict(marker=dict(color=colors_increasing)),
-        decreasing=dict(marker=dict(color=colors_decreasing)),
-        totals=dict(marker=dict(color=colors_total)),
-        connector=dict(line=dict(color="rgba(0,0,0,0.3)", width=1)),
-    )
+    trace: dict[str, Any] = {
+        "type": "waterfall",
+        "orientation": "v",
+        "measure": measures,
+        "x": categories,
+        "y": [float(v) for v in values],
+        "text": [format_amount(v, unit, signed=m == "relative", suffix=False)
+                 for v, m in zip(values, measures)],
+        "textposition": "outside",
+        "increasing": {"marker": {"color": COLORS["positive"]}},
+        "decreasing": {"marker": {"color": COLORS["negative"]}},
+        "totals": {"marker": {"color": COLORS["total"]}},
+        "connector": {"line": {"color": "rgba(0,0,0,0.3)", "width": 1}},
+    }
 
     if hover_texts is not None:
-        waterfall_kwargs["hovertext"] = hover_texts
-        waterfall_kwargs["hovertemplate"] = (
-            "<b>%{x}</b><br>%{hovertext}<br>金額: %{y:,.0f} " + unit + "<extra></extra>"
+        trace["hovertext"] = hover_texts
+        trace["hovertemplate"] = (
+            "<b>%{x}</b><br>%{hovertext}<br>金額: %{y:" + amount_format(unit) + "} " + unit
+            + "<extra></extra>"
         )
     else:
-        waterfall_kwargs["hovertemplate"] = "%{x}<br>%{y:,.0f} " + unit + "<extra></extra>"
+        trace["hovertemplate"] = "%{x}<br>%{y:" + amount_format(unit) + "} " + unit + "<extra></extra>"
 
-    fig = go.Figure(go.Waterfall(**waterfall_kwargs))
+    return {
+        "data": [trace],
+        "layout": {
+            "template": SLIM_TEMPLATE,
+            "title": _title(title),
+            "yaxis": {"title": {"text": unit}},
+            "height": 450,
+            "margin": {"l": 60, "r": 20, "t": 50, "b": 80},
+            "showlegend": False,
+        },
+    }
 
-    fig.update_layout(
-        title=dict(text=title, font=dict(size=16)),
-        yaxis_title=unit,
-        height=450,
-        margin=dict(l=60, r=20, t=50, b=80),
-        showlegend=False,
-    )
-    return fig
 
+def create_waterfall(
+    categories: list[str],
+    values: list[float],
+    title: str,
+    measures: list[str] | None = None,
+    unit: str = CANONICAL_UNIT,
+    hover_texts: list[str] | None = None,
+) -> go.Figure:
+    """ウォーターフォールチャートを生成する（引数は waterfall_spec と同じ）。"""
+    return figure_from_spec(waterfall_spec(categories, values, title, measures, unit, hover_texts))
 
-def create_treemap(
+
+def treemap_spec(
     labels: list[str],
     parents: list[str],
     values: list[float],
     title: str,
     color_values: list[float] | None = None,
-) -> go.Figure:
-    """ツリーマップを生成する。
+    unit: str = CANONICAL_UNIT,
+) -> FigureSpec:
+    """ツリーマップの定義を生成する。
 
     Args:
         labels: ノードラベル。
@@ -198,62 +385,72 @@ def create_treemap(
         values: 各ノードのサイズ値。
         title: チャートタイトル。
         color_values: 色付け用の値（前年比率など）。
+        unit: 値の単位。
 
     Returns:
-        Plotly Figure。
+        図の定義。
     """
-    marker: dict[str, Any] = {}
-    if color_values is not None:
-        marker = dict(
-            colors=color_values,
-            colorscale="RdYlGn",
-            cmid=0,
-            colorbar=dict(title="前年比(%)"),
-        )
-
-    treemap_kwargs: dict[str, Any] = dict(
-        labels=labels,
-        parents=parents,
-        values=values,
-        marker=marker,
-        hovertemplate="<b>%{label}</b><br>売上: %{value:,} 百万円<br>構成比: %{percentParent:.1%}<extra></extra>",
-    )
+    value = "%{value:" + amount_format(unit) + "} " + unit
+    trace: dict[str, Any] = {
+        "type": "treemap",
+        "labels": labels,
+        "parents": parents,
+        "values": [float(v) for v in values],
+        "hovertemplate": "<b>%{label}</b><br>売上: " + value + "<br>構成比: %{percentParent:.1%}<extra></extra>",
+    }
 
     if color_values is not None:
+        color_values = [float(v) for v in color_values]
+        trace["marker"] = {
+            "colors": color_values,
+            "colorscale": "RdYlGn",
+            "cmid": 0,
+            "colorbar": {"title": {"text": "前年比(%)"}},
+        }
         # 前年比を直接ブロック内に表示
-        treemap_kwargs["customdata"] = color_values
-        treemap_kwargs["texttemplate"] = (
-            "<b>%{label}</b><br>%{value:,} 百万円<br>前年比: %{customdata:+.1f}%"
-        )
-        treemap_kwargs["hovertemplate"] = (
-            "<b>%{label}</b><br>売上: %{value:,} 百万円<br>"
+        trace["customdata"] = color_values
+        trace["texttemplate"] = "<b>%{label}</b><br>" + value + "<br>前年比: %{customdata:+.1f}%"
+        trace["hovertemplate"] = (
+            "<b>%{label}</b><br>売上: " + value + "<br>"
             "構成比: %{percentParent:.1%}<br>前年比: %{customdata:+.1f}%<extra></extra>"
         )
     else:
-        treemap_kwargs["textinfo"] = "label+value+percent parent"
+        trace["textinfo"] = "label+value+percent parent"
 
-    fig = go.Figure(go.Treemap(**treemap_kwargs))
+    return {
+        "data": [trace],
+        "layout": {
+            "template": SLIM_TEMPLATE,
+            "title": _title(title),
+            "height": 450,
+            "margin": {"l": 10, "r": 10, "t": 50, "b": 10},
+        },
+    }
 
-    fig.update_layout(
-        title=dict(text=title, font=dict(size=16)),
-        height=450,
-        margin=dict(l=10, r=10, t=50, b=10),
-    )
-    return fig
 
+def create_treemap(
+    labels: list[str],
+    parents: list[str],
+    values: list[float],
+    title: str,
+    color_values: list[float] | None = None,
+    unit: str = CANONICAL_UNIT,
+) -> go.Figure:
+    """ツリーマップを生成する（引数は treemap_spec と同じ）。"""
+    return figure_from_spec(treemap_spec(labels, parents, values, title, color_values, unit))
 
-def create_bs_block(row: pd.Series, period_label: str) -> go.Figure:
-    """B/Sブロック図（横棒積み上げ）を生成する。
+
+def bs_block_spec(row: pd.Series, period_label: str, unit: str = CANONICAL_UNIT) -> FigureSpec:
+    """B/Sブロック図（横棒積み上げ）の定義を生成する。
 
     Args:
         row: B/Sの1期分のデータ行。
         period_label: 表示用期間ラベル。
+        unit: 値の単位。
 
     Returns:
-        Plotly Figure。
+        図の定義。
     """
-    fig = go.Figure()
-
     # 資産側（左）
     asset_items = [
         ("現金及び預金", row["現金及び預金"], "#64B5F6"),
@@ -276,67 +473,84 @@ def create_bs_block(row: pd.Series, period_label: str) -> go.Figure:
     ]
 
     categories = ["資産", "負債・純資産"]
+    data: list[dict[str, Any]] = []
 
+    total_assets = sum(v for _, v, _ in asset_items)
     for name, val, color in asset_items:
-        fig.add_trace(go.Bar(
-            name=name,
-            x=[val, 0],
-            y=categories,
-            orientation="h",
-            marker_color=color,
-            text=[f"{name}<br>{int(val):,}", ""],
-            textposition="inside",
-            hovertemplate=f"{name}: {int(val):,} 百万円<extra></extra>",
-        ))
+        pct = val / total_assets * 100 if total_assets else 0
+        data.append({
+            "type": "bar",
+            "name": name,
+            "x": [float(val), 0],
+            "y": categories,
+            "marker": {"color": color},
+            "text": [f"{name}<br>{format_amount(val, unit, suffix=False)}", ""],
+            "customdata": [round(float(pct), 1)] * 2,
+        })
 
     total_le = sum(v for _, v, _ in le_items)
     for name, val, color in le_items:
         pct = val / total_le * 100 if total_le else 0
         # 構成比が小さい項目はラベルを短縮
         if pct < 5:
-            label = f"{int(val):,}"
+            label = format_amount(val, unit, suffix=False)
         else:
-            label = f"{name}<br>{int(val):,}"
-        fig.add_trace(go.Bar(
-            name=name,
-            x=[0, val],
-            y=categories,
-            orientation="h",
-            marker_color=color,
-            text=["", label],
-            textposition="inside",
-            insidetextanchor="middle",
-            hovertemplate=f"<b>{name}</b>: {int(val):,} 百万円 ({pct:.1f}%)<extra></extra>",
-        ))
-
-    fig.update_layout(
-        barmode="stack",
-        title=dict(text=f"貸借対照表 ({period_label})", font=dict(size=16)),
-        height=350,
-        xaxis_title="百万円",
-        margin=dict(l=110, r=20, t=50, b=40),
-        showlegend=False,
-        uniformtext=dict(minsize=8, mode="hide"),
-    )
-    return fig
-
-
-def create_cf_sankey(row: pd.Series, period_label: str) -> go.Figure:
-    """CFサンキーダイアグラムを生成する。
+            label = f"{name}<br>{format_amount(val, unit, suffix=False)}"
+        data.append({
+            "type": "bar",
+            "name": name,
+            "x": [0, float(val)],
+            "y": categories,
+            "marker": {"color": color},
+            "text": ["", label],
+            "customdata": [round(float(pct), 1)] * 2,
+        })
+
+    return {
+        "data": data,
+        "layout": {
+            "template": _slim_template(bar={
+                "orientation": "h",
+                "textposition": "inside",
+                "insidetextanchor": "middle",
+                "hovertemplate": (
+                    "<b>%{fullData.name}</b>: %{x:" + amount_format(unit) + "} " + unit
+                    + " (%{customdata:.1f}%)<extra></extra>"
+                ),
+            }),
+            "barmode": "stack",
+            "title": _title(f"貸借対照表 ({period_label})"),
+            "height": 350,
+            "xaxis": {"title": {"text": unit}},
+            "margin": {"l": 110, "r": 20, "t": 50, "b": 40},
+            "showlegend": False,
+            "uniformtext": {"minsize": 8, "mode": "hide"},
+        },
+    }
+
+
+def create_bs_block(row: pd.Series, period_label: str, unit: str = CANONICAL_UNIT) -> go.Figure:
+    """B/Sブロック図（横棒積み上げ）を生成する（引数は bs_block_spec と同じ）。"""
+    return figure_from_spec(bs_block_spec(row, period_label, unit))
+
+
+def cf_sankey_spec(row: pd.Series, period_label: str, unit: str = CANONICAL_UNIT) -> FigureSpec:
+    """CFサンキーダイアグラムの定義を生成する。
 
     Args:
         row: CFの1期分のデータ行。
         period_label: 表示用期間ラベル。
+        unit: 値の単位。
 
     Returns:
-        Plotly Figure。
+        図の定義。
     """
     labels = [
-        f"期首現金<br>{int(row['期首現金']):,}",   # 0
-        f"営業CF<br>{int(row['営業CF']):+,}",       # 1
-        f"投資CF<br>{int(row['投資CF']):+,}",       # 2
-        f"財務CF<br>{int(row['財務CF']):+,}",       # 3
-        f"期末現金<br>{int(row['期末現金']):,}",     # 4
+        f"期首現金<br>{format_amount(row['期首現金'], unit, suffix=False)}",            # 0
+        f"営業CF<br>{format_amount(row['営業CF'], unit, signed=True, suffix=False)}",  # 1
+        f"投資CF<br>{format_amount(row['投資CF'], unit, signed=True, suffix=False)}",  # 2
+        f"財務CF<br>{format_amount(row['財務CF'], unit, signed=True, suffix=False)}",  # 3
+        f"期末現金<br>{format_amount(row['期末現金'], unit, suffix=False)}",            # 4
     ]
 
     node_colors = [
@@ -355,111 +569,383 @@ def create_cf_sankey(row: pd.Series, period_label: str) -> go.Figure:
     # 期首現金 → 期末現金（ベースフロー）
     source.append(0)
     target.append(4)
-    values.append(row["期首現金"])
+    values.append(float(row["期首現金"]))
     link_colors.append("rgba(33,150,243,0.2)")
 
     # 営業CF（通常プラス）
     if row["営業CF"] > 0:
         source.append(1)
         target.append(4)
-        values.append(row["営業CF"])
+        values.append(float(row["営業CF"]))
         link_colors.append("rgba(76,175,80,0.4)")
 
     # 投資CF（通常マイナス＝流出）
     if row["投資CF"] < 0:
         source.append(0)
         target.append(2)
-        values.append(abs(row["投資CF"]))
+        values.append(float(abs(row["投資CF"])))
         link_colors.append("rgba(255,152,0,0.4)")
 
     # 財務CF
     if row["財務CF"] < 0:
         source.append(0)
         target.append(3)
-        values.append(abs(row["財務CF"]))
+        values.append(float(abs(row["財務CF"])))
         link_colors.append("rgba(156,39,176,0.4)")
     elif row["財務CF"] > 0:
         source.append(3)
         target.append(4)
-        values.append(row["財務CF"])
+        values.append(float(row["財務CF"]))
         link_colors.append("rgba(156,39,176,0.4)")
 
-    fig = go.Figure(data=[go.Sankey(
-        node=dict(
-            pad=20,
-            thickness=25,
-            label=labels,
-            color=node_colors,
-        ),
-        link=dict(
-            source=source,
-            target=target,
-            value=values,
-            color=link_colors,
-            hovertemplate="%{source.label} → %{target.label}<br>%{value:,} 百万円<extra></extra>",
-        ),
-    )])
-
-    fig.update_layout(
-        title=dict(text=f"キャッシュフロー ({period_label})", font=dict(size=16)),
-        font=dict(size=12),
-        height=450,
-        margin=dict(l=20, r=20, t=50, b=20),
+    return {
+        "data": [{
+            "type": "sankey",
+            "node": {
+                "pad": 20,
+                "thickness": 25,
+                "label": labels,
+                "color": node_colors,
+            },
+            "link": {
+                "source": source,
+                "target": target,
+                "value": values,
+                "color": link_colors,
+                "hovertemplate": (
+                    "%{source.label} → %{target.label}<br>%{value:" + amount_format(unit) + "} "
+                    + unit + "<extra></extra>"
+                ),
+            },
+        }],
+        "layout": {
+            "template": SLIM_TEMPLATE,
+            "title": _title(f"キャッシュフロー ({period_label})"),
+            "font": {"size": 12},
+            "height": 450,
+            "margin": {"l": 20, "r": 20, "t": 50, "b": 20},
+        },
+    }
+
+
+def create_cf_sankey(row: pd.Series, period_label: str, unit: str = CANONICAL_UNIT) -> go.Figure:
+    """CFサンキーダイアグラムを生成する（引数は cf_sankey_spec と同じ）。"""
+    return figure_from_spec(cf_sankey_spec(row, period_label, unit))
+
+
+def _with_period_frames(
+    df: pd.DataFrame,
+    build: Callable[[pd.Series, str], FigureSpec],
+    active_period: int | None = None,
+    note: Callable[[pd.Series], str] | None = None,
+) -> FigureSpec:
+    """1期分の図の定義を作る関数から、全期分をフレームに持つ図の定義を作る。
+
+    期の切り替え（スライダー）と再生（ボタン）はブラウザ内で完結し、サーバーでの再実行が要らない。
+    フレームごとに全トレースを描き直す（サンキーはリンクの本数が期ごとに異なるため）。
+    ペイロードはおおむね 1期分 ×（期数 + 1）になる。
+    期ごとの要約（合計値など）は図の外に出すとスライダーと食い違うため、note で図の上部に注記として持たせる。
+
+    Args:
+        df: 期列を含む財務諸表（1社分）。
+        build: 1期分の行と期ラベルから図の定義を作る関数（pl_sankey_spec など）。
+        active_period: 最初に表示する期。省略時は最新期。
+        note: 1期分の行から注記の文字列を作る関数。省略時は注記なし。
+
+    Returns:
+        図の定義。
+    """
+    periods = df["期"].tolist()
+    labels = [period_label(int(p)) for p in periods]
+    specs = [build(df.iloc[i], label) for i, label in enumerate(labels)]
+    active = periods.index(active_period) if active_period in periods else len(periods) - 1
+    frame_layouts = [{"title": spec["layout"]["title"]} for spec in specs]
+    if note is not None:
+        for i, frame_layout in enumerate(frame_layouts):
+            frame_layout["annotations"] = [_note_annotation(note(df.iloc[i]))]
+
+    base = specs[active]
+    layout = dict(base["layout"])
+    if note is not None:
+        margin = layout.get("margin", {})
+        layout.update(
+            annotations=frame_layouts[active]["annotations"],
+            height=layout.get("height", 450) + NOTE_HEIGHT,
+            margin={**margin, "t": margin.get("t", 0) + NOTE_HEIGHT},
+        )
+    jump = {"mode": "immediate", "frame": {"duration": 0, "redraw": True}, "transition": {"duration": 0}}
+    play = {"frame": {"duration": FRAME_DURATION, "redraw": True}, "transition": {"duration": 0}, "fromcurrent": True}
+    layout.update(
+        height=layout.get("height", 450) + 80,
+        margin={**layout.get("margin", {}), "b": layout.get("margin", {}).get("b", 0) + 80},
+        sliders=[{
+            "active": active,
+            "currentvalue": {"prefix": "表示期間: ", "font": {"size": 12}},
+            "pad": {"t": 10, "b": 10},
+            "x": 0.1,
+            "len": 0.9,
+            "y": 0,
+            "yanchor": "top",
+            "steps": [{"method": "animate", "label": label, "args": [[label], jump]} for label in labels],
+        }],
+        updatemenus=[{
+            "type": "buttons",
+            "direction": "left",
+            "showactive": False,
+            "x": 0,
+            "y": 0,
+            "xanchor": "left",
+            "yanchor": "top",
+            "pad": {"t": 20},
+            "buttons": [
+                {"label": "▶", "method": "animate", "args": [None, play]},
+                {"label": "❚❚", "method": "animate", "args": [[None], jump]},
+            ],
+        }],
+    )
+    return {
+        "data": base["data"],
+        "layout": layout,
+        "frames": [
+            {"name": label, "data": spec["data"], "layout": frame_layout}
+            for label, spec, frame_layout in zip(labels, specs, frame_layouts)
+        ],
+    }
+
+
+def _note_annotation(text: str) -> dict[str, Any]:
+    """図の上部（タイトルの下）に置く注記。"""
+    return {
+        "text": text,
+        "xref": "paper",
+        "yref": "paper",
+        "x": 0,
+        "y": 1,
+        "xanchor": "left",
+        "yanchor": "bottom",
+        "yshift": 8,
+        "align": "left",
+        "showarrow": False,
+        "font": {"size": 12},
+    }
+
+
+def _bs_totals_note(row: pd.Series, unit: str) -> str:
+    """B/S の合計値の注記。"""
+    return "　".join(
+        f"{name}: <b>{format_amount(row[name], unit)}</b>" for name in ("資産合計", "負債合計", "純資産合計")
     )
-    return fig
 
 
-def create_trend_chart(
+def pl_sankey_frames_spec(
+    df: pd.DataFrame, unit: str = CANONICAL_UNIT, active_period: int | None = None
+) -> FigureSpec:
+    """全期分の P/L サンキーダイアグラムを、ブラウザ内で期を切り替えられる1つの図の定義にする。
+
+    Args:
+        df: P/L（1社分）。
+        unit: 値の単位。
+        active_period: 最初に表示する期。省略時は最新期。
+
+    Returns:
+        図の定義（期ごとのフレームとスライダー付き）。
+    """
+    return _with_period_frames(df, lambda row, label: pl_sankey_spec(row, label, unit), active_period)
+
+
+def create_pl_sankey_frames(
+    df: pd.DataFrame, unit: str = CANONICAL_UNIT, active_period: int | None = None
+) -> go.Figure:
+    """全期分の P/L サンキーダイアグラムを生成する（引数は pl_sankey_frames_spec と同じ）。"""
+    return figure_from_spec(pl_sankey_frames_spec(df, unit, active_period))
+
+
+def bs_block_frames_spec(
+    df: pd.DataFrame, unit: str = CANONICAL_UNIT, active_period: int | None = None
+) -> FigureSpec:
+    """全期分の B/S ブロック図を、ブラウザ内で期を切り替えられる1つの図の定義にする。
+
+    Args:
+        df: B/S（1社分）。
+        unit: 値の単位。
+        active_period: 最初に表示する期。省略時は最新期。
+
+    Returns:
+        図の定義（期ごとのフレームとスライダー付き）。
+    """
+    return _with_period_frames(
+        df,
+        lambda row, label: bs_block_spec(row, label, unit),
+        active_period,
+        note=lambda row: _bs_totals_note(row, unit),
+    )
+
+
+def create_bs_block_frames(
+    df: pd.DataFrame, unit: str = CANONICAL_UNIT, active_period: int | None = None
+) -> go.Figure:
+    """全期分の B/S ブロック図を生成する（引数は bs_block_frames_spec と同じ）。"""
+    return figure_from_spec(bs_block_frames_spec(df, unit, active_period))
+
+
+def cf_sankey_frames_spec(
+    df: pd.DataFrame,
+    unit: str = CANONICAL_UNIT,
+    active_period: int | None = None,
+    note: Callable[[pd.Series], str] | None = None,
+) -> FigureSpec:
+    """全期分の CF サンキーダイアグラムを、ブラウザ内で期を切り替えられる1つの図の定義にする。
+
+    Args:
+        df: CF（1社分）。
+        unit: 値の単位。
+        active_period: 最初に表示する期。省略時は最新期。
+        note: 1期分の行から注記の文字列を作る関数（clusters.cf_pattern_note など）。省略時は注記なし。
+
+    Returns:
+        図の定義（期ごとのフレームとスライダー付き）。
+    """
+    return _with_period_frames(df, lambda row, label: cf_sankey_spec(row, label, unit), active_period, note)
+
+
+def create_cf_sankey_frames(
+    df: pd.DataFrame,
+    unit: str = CANONICAL_UNIT,
+    active_period: int | None = None,
+    note: Callable[[pd.Series], str] | None = None,
+) -> go.Figure:
+    """全期分の CF サンキーダイアグラムを生成する（引数は cf_sankey_frames_spec と同じ）。"""
+    return figure_from_spec(cf_sankey_frames_spec(df, unit, active_period, note))
+
+
+def _downsample_index(n: int, max_points: int) -> np.ndarray:
+    """n 点から等間隔に max_points 点を選ぶ位置（最初と最後の点は必ず含める）。"""
+    if n <= max_points:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, max_points).round().astype(np.int64))
+
+
+def trend_chart_spec(
     df: pd.DataFrame,
     columns: list[str],
     title: str,
-    unit: str = "百万円",
-) -> go.Figure:
-    """時系列推移チャートを生成する。
+    unit: str = CANONICAL_UNIT,
+    visible: list[str] | None = None,
+    max_points: int = TREND_MAX_POINTS,
+    x_labels: Sequence[str] | None = None,
+) -> FigureSpec:
+    """時系列推移チャートの定義を生成する。
+
+    visible を指定すると、columns の全系列を送ったうえで visible 以外を凡例だけに表示する。
+    凡例のクリックで系列の表示・非表示をブラウザ内で切り替えられるので、
+    表示項目の変更でサーバーに問い合わせる必要がない。
 
     Args:
         df: 期列を含む DataFrame。
         columns: プロットする列名リスト。
         title: チャートタイトル。
         unit: 値の単位。
+        visible: 最初に表示する列。省略時は全列。
+        max_points: 1系列あたりの点の上限。期数が多い場合は等間隔に間引く。
+        x_labels: 各行の横軸ラベル（四半期のラベルなど）。省略時は期列から作る決算期のラベル。
 
     Returns:
-        Plotly Figure。
+        図の定義。
     """
     palette = ["#2196F3", "#4CAF50", "#FF9800", "#9C27B0", "#F44336", "#00BCD4"]
-    fig = go.Figure()
 
-    period_labels = [str(p) for p in df["期"]]
+    index = _downsample_index(len(df), max_points)
+    if len(index) < len(df):
+        df = df.iloc[index]
+        if x_labels is not None:
+            x_labels = [x_labels[i] for i in index.tolist()]
+    labels = list(x_labels) if x_labels is not None else period_labels(df["期"]).tolist()
 
+    data = []
     for i, col in enumerate(columns):
-        color = palette[i % len(palette)]
-        fig.add_trace(go.Scatter(
-            x=period_labels,
-            y=df[col],
-            mode="lines+markers+text",
-            name=col,
-            line=dict(color=color, width=2),
-            marker=dict(size=8),
-            text=[f"{int(v):,}" for v in df[col]],
-            textposition="top center",
-            textfont=dict(size=10),
-            hovertemplate=f"{col}: %{{y:,.0f}} {unit}<extra></extra>",
-        ))
+        trace: dict[str, Any] = {
+            "type": "scatter",
+            "x": labels,
+            "y": _typed_array(df[col].to_numpy()),
+            "name": col,
+            "line": {"color": palette[i % len(palette)]},
+        }
+        if visible is not None and col not in visible:
+            trace["visible"] = "legendonly"
+        data.append(trace)
+
+    return {
+        "data": data,
+        "layout": {
+            "template": _slim_template(scatter={
+                "mode": "lines+markers+text",
+                "line": {"width": 2},
+                "marker": {"size": 8},
+                "texttemplate": "%{y:" + amount_format(unit) + "}",
+                "textposition": "top center",
+                "textfont": {"size": 10},
+                "hovertemplate": "%{fullData.name}: %{y:" + amount_format(unit) + "} " + unit + "<extra></extra>",
+            }),
+            "title": _title(title),
+            "yaxis": {"title": {"text": unit}},
+            "height": 400,
+            "margin": {"l": 60, "r": 20, "t": 50, "b": 40},
+            "legend": {"orientation": "h", "yanchor": "bottom", "y": 1.02, "xanchor": "right", "x": 1},
+            "hovermode": "x unified",
+        },
+    }
 
-    fig.update_layout(
-        title=dict(text=title, font=dict(size=16)),
-        yaxis_title=unit,
-        height=400,
-        margin=dict(l=60, r=20, t=50, b=40),
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-        hovermode="x unified",
-    )
-    return fig
 
+def create_trend_chart(
+    df: pd.DataFrame,
+    columns: list[str],
+    title: str,
+    unit: str = CANONICAL_UNIT,
+    visible: list[str] | None = None,
+    max_points: int = TREND_MAX_POINTS,
+    x_labels: Sequence[str] | None = None,
+) -> go.Figure:
+    """時系列推移チャートを生成する（引数は trend_chart_spec と同じ）。"""
+    return figure_from_spec(trend_chart_spec(df, columns, title, unit, visible, max_points, x_labels))
 
-def create_gauge(value: float, title: str, suffix: str = "%",
-                 ranges: list[tuple[float, float, str]] | None = None) -> go.Figure:
-    """ゲージチャートを生成する。
+
+def _gauge_trace(
+    title: str,
+    value: float,
+    suffix: str,
+    ranges: list[tuple[float, float, str]],
+    domain: dict[str, list[float]] | None = None,
+) -> dict[str, Any]:
+    """ゲージ1つ分のトレース。"""
+    trace: dict[str, Any] = {
+        "type": "indicator",
+        "mode": "gauge+number",
+        "value": float(value),
+        "number": {"suffix": suffix, "font": {"size": 24}},
+        "title": {"text": title, "font": {"size": 14}},
+        "gauge": {
+            "axis": {"range": [0, max(r[1] for r in ranges)]},
+            "bar": {"color": "#1565C0"},
+            "steps": [{"range": [r[0], r[1]], "color": r[2]} for r in ranges],
+            "threshold": {
+                "line": {"color": "red", "width": 2},
+                "thickness": 0.75,
+                "value": float(value),
+            },
+        },
+    }
+    if domain is not None:
+        trace["domain"] = domain
+    return trace
+
+
+# ゲージの既定の色分け
+_DEFAULT_GAUGE_RANGES = [(0, 10, "#FF5722"), (10, 20, "#FF9800"), (20, 50, "#4CAF50")]
+
+
+def gauge_spec(value: float, title: str, suffix: str = "%",
+               ranges: list[tuple[float, float, str]] | None = None) -> FigureSpec:
+    """ゲージチャートの定義を生成する。
 
     Args:
         value: 表示する値。
@@ -468,33 +954,440 @@ def create_gauge(value: float, title: str, suffix: str = "%",
         ranges: (min, max, color) のリスト。
 
     Returns:
-        Plotly Figure。
+        図の定義。
     """
-    if ranges is None:
-        ranges = [(0, 10, "#FF5722"), (10, 20, "#FF9800"), (20, 50, "#4CAF50")]
-
-    steps = [dict(range=[r[0], r[1]], color=r[2]) for r in ranges]
-    max_val = max(r[1] for r in ranges)
-
-    fig = go.Figure(go.Indicator(
-        mode="gauge+number",
-        value=value,
-        number=dict(suffix=suffix, font=dict(size=24)),
-        title=dict(text=title, font=dict(size=14)),
-        gauge=dict(
-            axis=dict(range=[0, max_val]),
-            bar=dict(color="#1565C0"),
-            steps=steps,
-            threshold=dict(
-                line=dict(color="red", width=2),
-                thickness=0.75,
-                value=value,
+    return {
+        "data": [_gauge_trace(title, value, suffix, ranges or _DEFAULT_GAUGE_RANGES)],
+        "layout": {
+            "template": SLIM_TEMPLATE,
+            "height": 200,
+            "margin": {"l": 20, "r": 20, "t": 50, "b": 10},
+        },
+    }
+
+
+def create_gauge(value: float, title: str, suffix: str = "%",
+                 ranges: list[tuple[float, float, str]] | None = None) -> go.Figure:
+    """ゲージチャートを生成する（引数は gauge_spec と同じ）。"""
+    return figure_from_spec(gauge_spec(value, title, suffix, ranges))
+
+
+def gauges_spec(
+    indicators: list[tuple[str, float, list[tuple[float, float, str]] | None]],
+    suffix: str = "%",
+    columns: int | None = None,
+) -> FigureSpec:
+    """複数のゲージを1つにまとめた図の定義を生成する。
+
+    gauge_spec を指標ごとに呼ぶ代わりに、domain で区切ったグリッドへ並べる。
+    Figure・JSON・描画マウントが1つで済む。
+
+    Args:
+        indicators: (指標名, 値, ranges) のリスト。ranges は gauge_spec と同じ形式。
+        suffix: 値の接尾辞。
+        columns: 1行あたりのゲージ数。None なら全指標を1行に並べる。
+
+    Returns:
+        図の定義。
+    """
+    n = len(indicators)
+    columns = columns or max(n, 1)
+    rows = -(-n // columns)
+    gap = 0.02
+
+    data = []
+    for i, (title, value, ranges) in enumerate(indicators):
+        r, c = divmod(i, columns)
+        data.append(_gauge_trace(
+            title, value, suffix, ranges or _DEFAULT_GAUGE_RANGES,
+            domain={
+                "x": [c / columns + gap, (c + 1) / columns - gap],
+                "y": [1 - (r + 1) / rows + gap, 1 - r / rows - gap],
+            },
+        ))
+
+    return {
+        "data": data,
+        "layout": {
+            "template": SLIM_TEMPLATE,
+            "height": 200 * rows,
+            "margin": {"l": 20, "r": 20, "t": 50, "b": 10},
+        },
+    }
+
+
+def create_gauges(
+    indicators: list[tuple[str, float, list[tuple[float, float, str]] | None]],
+    suffix: str = "%",
+    columns: int | None = None,
+) -> go.Figure:
+    """複数のゲージを1つの Figure にまとめて生成する（引数は gauges_spec と同じ）。"""
+    return figure_from_spec(gauges_spec(indicators, suffix, columns))
+
+
+def fan_chart_spec(
+    history_labels: list[str],
+    history_values: list[float],
+    future_labels: list[str],
+    bands: dict[float, np.ndarray],
+    title: str,
+    unit: str = CANONICAL_UNIT,
+) -> FigureSpec:
+    """実績と将来分布（分位帯）を重ねたファンチャートの定義を生成する。
+
+    Args:
+        history_labels: 実績期のラベル。
+        history_values: 実績値。
+        future_labels: 予測期のラベル。
+        bands: 分位 → 予測期ごとの値（中央値 0.5 と対称な分位の組を含む）。
+        title: チャートタイトル。
+        unit: 値の単位。
+
+    Returns:
+        図の定義。
+    """
+    data: list[dict[str, Any]] = []
+    # 帯を実績の最終期から始めるため、最終実績を各分位の先頭に付ける
+    x = [history_labels[-1]] + list(future_labels)
+    last = history_values[-1]
+    outer = sorted(q for q in bands if q < 0.5)
+    for i, lower_q in enumerate(outer):
+        upper_q = round(1 - lower_q, 10)
+        if upper_q not in bands:
+            continue
+        opacity = 0.15 + 0.2 * i / max(len(outer) - 1, 1)
+        data.append({
+            "type": "scatter",
+            "x": x + x[::-1],
+            "y": _typed_array(np.concatenate([[last], bands[upper_q], bands[lower_q][::-1], [last]])),
+            "fill": "toself",
+            "fillcolor": f"rgba(33,150,243,{opacity:.2f})",
+            "line": {"width": 0},
+            "name": f"{lower_q:.0%}–{upper_q:.0%}",
+            "hoverinfo": "skip",
+        })
+
+    data.append({
+        "type": "scatter",
+        "x": history_labels,
+        "y": _typed_array(history_values),
+        "mode": "lines+markers",
+        "name": "実績",
+        "line": {"color": COLORS["total"], "width": 2},
+        "hovertemplate": "%{x}<br>実績: %{y:" + amount_format(unit) + "} " + unit + "<extra></extra>",
+    })
+    if 0.5 in bands:
+        data.append({
+            "type": "scatter",
+            "x": x,
+            "y": _typed_array(np.concatenate([[last], bands[0.5]])),
+            "mode": "lines+markers",
+            "name": "中央値",
+            "line": {"color": COLORS["total"], "width": 2, "dash": "dash"},
+            "hovertemplate": "%{x}<br>中央値: %{y:" + amount_format(unit) + "} " + unit + "<extra></extra>",
+        })
+
+    return {
+        "data": data,
+        "layout": {
+            "template": SLIM_TEMPLATE,
+            "title": _title(title),
+            "yaxis": {"title": {"text": unit}},
+            "height": 420,
+            "margin": {"l": 60, "r": 20, "t": 50, "b": 40},
+            "legend": {"orientation": "h", "yanchor": "bottom", "y": 1.02, "xanchor": "right", "x": 1},
+        },
+    }
+
+
+def create_fan_chart(
+    history_labels: list[str],
+    history_values: list[float],
+    future_labels: list[str],
+    bands: dict[float, np.ndarray],
+    title: str,
+    unit: str = CANONICAL_UNIT,
+) -> go.Figure:
+    """実績と将来分布を重ねたファンチャートを生成する（引数は fan_chart_spec と同じ）。"""
+    return figure_from_spec(fan_chart_spec(history_labels, history_values, future_labels, bands, title, unit))
+
+
+def heatmap_spec(
+    z: np.ndarray,
+    x_labels: list[str],
+    y_labels: list[str],
+    title: str,
+    x_title: str,
+    y_title: str,
+    unit: str = CANONICAL_UNIT,
+) -> FigureSpec:
+    """感応度分析などのヒートマップの定義を生成する。
+
+    Args:
+        z: 形状 (len(y_labels), len(x_labels)) の値。NaN のセルは空白になる。
+        x_labels: 横軸のラベル。
+        y_labels: 縦軸のラベル。
+        title: チャートタイトル。
+        x_title: 横軸のタイトル。
+        y_title: 縦軸のタイトル。
+        unit: 値の単位。
+
+    Returns:
+        図の定義。
+    """
+    z = np.asarray(z, dtype=np.float32)
+    return {
+        "data": [{
+            "type": "heatmap",
+            # 値は有効数字で十分なので float32 の型付き配列で送る
+            "z": {**_typed_array(z, "f4"), "shape": f"{z.shape[0]}, {z.shape[1]}"},
+            "x": x_labels,
+            "y": y_labels,
+            "colorscale": "RdYlGn",
+            "colorbar": {"title": {"text": unit}},
+            "hovertemplate": (
+                y_title + ": %{y}<br>" + x_title + ": %{x}<br>%{z:" + amount_format(unit) + "} "
+                + unit + "<extra></extra>"
             ),
-        ),
-    ))
+        }],
+        "layout": {
+            "template": SLIM_TEMPLATE,
+            "title": _title(title),
+            "xaxis": {"title": {"text": x_title}},
+            "yaxis": {"title": {"text": y_title}},
+            "height": 450,
+            "margin": {"l": 60, "r": 20, "t": 50, "b": 50},
+        },
+    }
+
+
+def create_heatmap(
+    z: np.ndarray,
+    x_labels: list[str],
+    y_labels: list[str],
+    title: str,
+    x_title: str,
+    y_title: str,
+    unit: str = CANONICAL_UNIT,
+) -> go.Figure:
+    """感応度分析などのヒートマップを生成する（引数は heatmap_spec と同じ）。"""
+    return figure_from_spec(heatmap_spec(z, x_labels, y_labels, title, x_title, y_title, unit))
+
+
+def tornado_spec(
+    labels: list[str],
+    low_values: list[float],
+    high_values: list[float],
+    base_value: float,
+    title: str,
+    low_texts: list[str] | None = None,
+    high_texts: list[str] | None = None,
+    unit: str = CANONICAL_UNIT,
+) -> FigureSpec:
+    """前提ごとの感応度を示すトルネードチャートの定義を生成する。
+
+    各前提について、前提を下げた場合と上げた場合の値を基準値からの横棒で表す。
+
+    Args:
+        labels: 前提名（影響が大きい順）。
+        low_values: 前提を下げたときの値。
+        high_values: 前提を上げたときの値。
+        base_value: 基準値。
+        title: チャートタイトル。
+        low_texts: 下げたときの前提値の説明（ホバー表示用）。
+        high_texts: 上げたときの前提値の説明（ホバー表示用）。
+        unit: 値の単位。
 
-    fig.update_layout(
-        height=200,
-        margin=dict(l=20, r=20, t=50, b=10),
+    Returns:
+        図の定義。
+    """
+    base_value = float(base_value)
+    data = []
+    for name, values, texts, color in [
+        ("下げた場合", low_values, low_texts, COLORS["negative"]),
+        ("上げた場合", high_values, high_texts, COLORS["positive"]),
+    ]:
+        values = np.asarray(values, dtype=float)
+        trace: dict[str, Any] = {
+            "type": "bar",
+            "y": labels,
+            "x": _typed_array(values - base_value),
+            "base": base_value,
+            "customdata": _typed_array(values),
+            "name": name,
+            "marker": {"color": color},
+        }
+        if texts is not None:
+            trace["hovertext"] = texts
+        data.append(trace)
+
+    return {
+        "data": data,
+        "layout": {
+            "template": _slim_template(bar={
+                "orientation": "h",
+                "hovertemplate": (
+                    "%{y} %{hovertext}<br>%{customdata:" + amount_format(unit) + "} " + unit
+                    + "<extra></extra>"
+                ),
+            }),
+            "title": _title(title),
+            "xaxis": {"title": {"text": unit}},
+            "barmode": "overlay",
+            "height": 120 + 50 * len(labels),
+            "margin": {"l": 100, "r": 20, "t": 50, "b": 40},
+            "yaxis": {"autorange": "reversed"},
+            "legend": {"orientation": "h", "yanchor": "bottom", "y": 1.02, "xanchor": "right", "x": 1},
+            "shapes": [{
+                "type": "line", "x0": base_value, "x1": base_value, "y0": 0, "y1": 1, "yref": "paper",
+                "line": {"color": "rgba(0,0,0,0.5)", "width": 1, "dash": "dot"},
+            }],
+        },
+    }
+
+
+def create_tornado(
+    labels: list[str],
+    low_values: list[float],
+    high_values: list[float],
+    base_value: float,
+    title: str,
+    low_texts: list[str] | None = None,
+    high_texts: list[str] | None = None,
+    unit: str = CANONICAL_UNIT,
+) -> go.Figure:
+    """トルネードチャートを生成する（引数は tornado_spec と同じ）。"""
+    return figure_from_spec(
+        tornado_spec(labels, low_values, high_values, base_value, title, low_texts, high_texts, unit)
     )
-    return fig
+
+
+def cluster_scatter_spec(
+    coords: np.ndarray,
+    labels: np.ndarray,
+    names: list[str],
+    hover_texts: list[str],
+    title: str,
+    axis_titles: tuple[str, str],
+    highlight: int | None = None,
+) -> FigureSpec:
+    """クラスタごとに色分けした散布図（主成分の2次元座標）の定義を生成する。
+
+    Args:
+        coords: 形状 (企業数, 2) の座標。
+        labels: 各社のクラスタ番号。
+        names: クラスタの説明（クラスタ番号順）。
+        hover_texts: 各社のホバー表示（社名など）。
+        title: チャートタイトル。
+        axis_titles: 横軸・縦軸のタイトル。
+        highlight: 強調する企業の位置（選択中の企業）。
+
+    Returns:
+        図の定義。
+    """
+    palette = ["#2196F3", "#4CAF50", "#FF9800", "#9C27B0", "#F44336", "#00BCD4",
+               "#795548", "#607D8B", "#E91E63", "#CDDC39", "#3F51B5", "#009688"]
+    xy = np.asarray(coords, dtype=np.float32)
+    texts = np.asarray(hover_texts, dtype=object)
+    data = []
+    for cluster, name in enumerate(names):
+        mask = labels == cluster
+        # 座標は有効数字で十分なので float32 の型付き配列で送る
+        data.append({
+            "type": "scattergl",
+            "x": _typed_array(xy[mask, 0], "f4"),
+            "y": _typed_array(xy[mask, 1], "f4"),
+            "name": f"{cluster + 1}: {name}",
+            "hovertext": texts[mask].tolist(),
+            "marker": {"color": palette[cluster % len(palette)]},
+        })
+    if highlight is not None:
+        data.append({
+            "type": "scattergl",
+            "x": _typed_array(xy[[highlight], 0], "f4"),
+            "y": _typed_array(xy[[highlight], 1], "f4"),
+            "name": "選択中の企業",
+            "hovertext": [texts[highlight]],
+            "marker": {"color": "black", "size": 16, "symbol": "star"},
+        })
+
+    return {
+        "data": data,
+        "layout": {
+            "template": _slim_template(scattergl={
+                "mode": "markers",
+                "marker": {"size": 6, "opacity": 0.7},
+                "hovertemplate": "%{hovertext}<extra>%{fullData.name}</extra>",
+            }),
+            "title": _title(title),
+            "xaxis": {"title": {"text": axis_titles[0]}},
+            "yaxis": {"title": {"text": axis_titles[1]}},
+            "height": 550,
+            "margin": {"l": 60, "r": 20, "t": 50, "b": 40},
+            "legend": {"orientation": "v", "x": 1.01, "y": 1},
+        },
+    }
+
+
+def create_cluster_scatter(
+    coords: np.ndarray,
+    labels: np.ndarray,
+    names: list[str],
+    hover_texts: list[str],
+    title: str,
+    axis_titles: tuple[str, str],
+    highlight: int | None = None,
+) -> go.Figure:
+    """クラスタごとに色分けした散布図を生成する（引数は cluster_scatter_spec と同じ）。"""
+    return figure_from_spec(cluster_scatter_spec(coords, labels, names, hover_texts, title, axis_titles, highlight))
+
+
+def matrix_heatmap_spec(
+    matrix: pd.DataFrame,
+    title: str,
+    limit: float = 1.0,
+    value_format: str = ".2f",
+) -> FigureSpec:
+    """相関行列やクラスタの特徴（標準化した平均）など、0 を中心に正負がある行列のヒートマップの定義を生成する。
+
+    Args:
+        matrix: 行・列にラベルを持つ DataFrame。
+        title: チャートタイトル。
+        limit: 色の範囲（-limit〜+limit。超える値は端の色）。
+        value_format: ホバーに表示する値の書式（d3-format）。
+
+    Returns:
+        図の定義。
+    """
+    z = np.asarray(matrix, dtype=np.float32)
+    return {
+        "data": [{
+            "type": "heatmap",
+            "z": {**_typed_array(z, "f4"), "shape": f"{z.shape[0]}, {z.shape[1]}"},
+            "x": [str(c) for c in matrix.columns],
+            "y": [str(i) for i in matrix.index],
+            "colorscale": "RdBu",
+            "reversescale": True,
+            "zmid": 0,
+            "zmin": -limit,
+            "zmax": limit,
+            "hovertemplate": "%{y} × %{x}<br>%{z:" + value_format + "}<extra></extra>",
+        }],
+        "layout": {
+            "template": SLIM_TEMPLATE,
+            "title": _title(title),
+            "height": max(350, 120 + 28 * len(matrix.index)),
+            "margin": {"l": 120, "r": 20, "t": 50, "b": 100},
+            "yaxis": {"autorange": "reversed"},
+        },
+    }
+
+
+def create_matrix_heatmap(
+    matrix: pd.DataFrame,
+    title: str,
+    limit: float = 1.0,
+    value_format: str = ".2f",
+) -> go.Figure:
+    """0 を中心に正負がある行列のヒートマップを生成する（引数は matrix_heatmap_spec と同じ）。"""
+    return figure_from_spec(matrix_heatmap_spec(matrix, title, limit, value_format))
@@ -0,0 +1,485 @@
+"""財務の形（収益構造・成長・資産と資本の構成・CF の型）による企業のクラスタ分析と指標の相関。
+
+全社の財務諸表から企業ごとに比率の特徴量を作り、外れ値を抑えて標準化した行列に対して
+k-means と階層クラスタリング（Ward 法）を NumPy のベクトル演算で行う。
+数千社 × 数十特徴量でも対話的に使えるよう、階層クラスタリングは k-means で作った
+小クラスタ（最大 WARD_MAX_LEAVES 個）の重心を葉として結合する。
+
+特徴量の行列はデータ版ごとに1回だけ作り、クラスタリングの結果は
+（データ版, 年度, 手法, クラスタ数）ごとにキャッシュする。
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import data_version, load_universe
+from utils.periods import fiscal_year
+
+
+# 特徴量（グループ → 列名）。いずれも規模によらない比率（%）
+FEATURE_GROUPS: dict[str, list[str]] = {
+    "収益構造": ["売上総利益率", "販管費率", "営業利益率", "純利益率"],
+    "成長": ["売上高成長率", "総資産成長率"],
+    "資産構成": ["現預金比率", "売上債権比率", "固定資産比率"],
+    "資本構成": ["自己資本比率", "借入金比率"],
+    "収益性": ["ROE", "ROA"],
+    "キャッシュフロー": ["営業CFマージン", "投資CFマージン", "財務CFマージン", "FCFマージン"],
+}
+
+FEATURES: list[str] = [f for group in FEATURE_GROUPS.values() for f in group]
+
+# CF の符号の組み合わせによる分類（営業CF・投資CF・財務CF）
+CF_PATTERNS: dict[str, str] = {
+    "優良型": "本業で稼いだ資金で投資と借入返済・配当を行っている健全なパターン。",
+    "積極投資型": "本業の稼ぎに加え、借入で資金調達し積極的に投資している成長企業のパターン。",
+    "リストラ型": "本業で稼ぎつつ、資産売却で投資回収し借入返済に充てているパターン。",
+    "その他": "一般的な分類に当てはまらないパターン。個別の事情を確認してください。",
+}
+
+# クラスタリングの手法
+METHODS: dict[str, str] = {"kmeans": "k-means", "ward": "階層（Ward 法）"}
+
+# 標準化の前に値を切り詰める分位（%）
+CLIP_PERCENTILES = (1.0, 99.0)
+
+# 階層クラスタリングで結合する葉の最大数（これを超える企業数では k-means の小クラスタを葉にする）
+WARD_MAX_LEAVES = 200
+
+# キャッシュするクラスタリング結果の数
+MAX_RESULTS = 16
+
+
+def cf_pattern(operating: np.ndarray, investing: np.ndarray, financing: np.ndarray) -> np.ndarray:
+    """営業CF・投資CF・財務CF の符号から CF_PATTERNS の分類名を求める。
+
+    Args:
+        operating: 営業CF。
+        investing: 投資CF。
+        financing: 財務CF。
+
+    Returns:
+        分類名の配列。
+    """
+    op = np.asarray(operating) > 0
+    inv = np.asarray(investing) < 0
+    fin = np.asarray(financing) < 0
+    return np.select(
+        [op & inv & fin, op & inv & ~fin, op & ~inv & fin],
+        ["優良型", "積極投資型", "リストラ型"],
+        default="その他",
+    )
+
+
+def cf_pattern_note(row: pd.Series) -> str:
+    """1期分の CF の行から、CF パターンとその解説の注記（charts.create_cf_sankey_frames の note）を作る。"""
+    pattern = str(cf_pattern(row["営業CF"], row["投資CF"], row["財務CF"]))
+    return f"CFパターン: <b>{pattern}</b>　{CF_PATTERNS[pattern]}"
+
+
+def _pct(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    """百分率を計算する（分母が0の期は欠損）。"""
+    return (numerator / denominator * 100).where(denominator != 0)
+
+
+def universe_features() -> pd.DataFrame:
+    """全社・全期の特徴量を計算する。
+
+    Returns:
+        code, 期, 年度, CFパターン 列と FEATURES の各列を持つ DataFrame（code・期の順）。
+    """
+    frames = []
+    for kind in ("pl", "bs", "cf"):
+        df = load_universe(kind)
+        frames.append(df.assign(code=df["code"].astype(str), 期=df["期"].astype(np.int32)))
+    keys = ["code", "期"]
+    merged = (
+        frames[0].merge(frames[1], on=keys, how="inner")
+        .merge(frames[2], on=keys, how="left")
+        .sort_values(keys, kind="stable")
+        .reset_index(drop=True)
+    )
+    revenue = merged["営業収益"].astype(float)
+    assets = merged["資産合計"].astype(float)
+    by_code = merged.groupby("code", sort=False)
+    debt = merged["短期借入金"] + merged["長期借入金"]
+
+    features = pd.DataFrame({
+        "売上総利益率": _pct(merged["売上総利益"], revenue),
+        "販管費率": _pct(merged["販管費"], revenue),
+        "営業利益率": _pct(merged["営業利益"], revenue),
+        "純利益率": _pct(merged["当期純利益"], revenue),
+        "売上高成長率": by_code["営業収益"].pct_change() * 100,
+        "総資産成長率": by_code["資産合計"].pct_change() * 100,
+        "現預金比率": _pct(merged["現金及び預金"], assets),
+        "売上債権比率": _pct(merged["売掛金"], assets),
+        "固定資産比率": _pct(merged["固定資産合計"], assets),
+        "自己資本比率": _pct(merged["純資産合計"], assets),
+        "借入金比率": _pct(debt, assets),
+        "ROE": _pct(merged["当期純利益"], merged["純資産合計"]),
+        "ROA": _pct(merged["当期純利益"], assets),
+        "営業CFマージン": _pct(merged["営業CF"], revenue),
+        "投資CFマージン": _pct(merged["投資CF"], revenue),
+        "財務CFマージン": _pct(merged["財務CF"], revenue),
+        "FCFマージン": _pct(merged["営業CF"] + merged["投資CF"], revenue),
+    }).astype(float)
+    features = features.replace([np.inf, -np.inf], np.nan)
+    return pd.concat([
+        merged[keys],
+        pd.DataFrame({
+            "年度": fiscal_year(merged["期"]),
+            "CFパターン": pd.Categorical(
+                cf_pattern(merged["営業CF"], merged["投資CF"], merged["財務CF"]),
+                categories=list(CF_PATTERNS),
+            ),
+        }),
+        features[FEATURES],
+    ], axis=1)
+
+
+def select_period(features: pd.DataFrame, year: int | None = None) -> pd.DataFrame:
+    """企業ごとに1期を選ぶ。
+
+    Args:
+        features: universe_features() の結果。
+        year: 年度。None なら企業ごとの最新期。
+
+    Returns:
+        code を索引とする1社1行の DataFrame。
+    """
+    if year is not None:
+        features = features[features["年度"] == year]
+    return features.drop_duplicates("code", keep="last").set_index("code")
+
+
+def normalize(values: np.ndarray) -> np.ndarray:
+    """特徴量の行列を、外れ値を切り詰めてから列ごとに標準化する。
+
+    欠損は標準化後に 0（列の平均）で埋める。ばらつきのない列は 0 になる。
+
+    Args:
+        values: 形状 (企業数, 特徴量数) の行列。
+
+    Returns:
+        標準化した float64 の行列。
+    """
+    x = np.asarray(values, dtype=float)
+    with np.errstate(all="ignore"):
+        low, high = np.nanpercentile(x, CLIP_PERCENTILES, axis=0)
+        x = np.clip(x, low, high)
+        mean = np.nanmean(x, axis=0)
+        std = np.nanstd(x, axis=0)
+    std = np.where((std > 0) & np.isfinite(std), std, 1.0)
+    z = (x - np.nan_to_num(mean)) / std
+    return np.nan_to_num(z, nan=0.0)
+
+
+def _sq_distances(x: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """各点と各中心の二乗距離（形状 (点の数, 中心の数)）。"""
+    d = (x * x).sum(axis=1)[:, None] - 2 * x @ centers.T + (centers * centers).sum(axis=1)[None, :]
+    return np.maximum(d, 0.0)
+
+
+def _kmeans_once(
+    x: np.ndarray, k: int, rng: np.random.Generator, weights: np.ndarray, max_iter: int
+) -> tuple[np.ndarray, np.ndarray, float]:
+    n = len(x)
+    # k-means++ の初期値（既存の中心からの距離の二乗に比例して次の中心を選ぶ）
+    centers = np.empty((k, x.shape[1]))
+    centers[0] = x[rng.choice(n, p=weights / weights.sum())]
+    closest = _sq_distances(x, centers[:1])[:, 0]
+    for i in range(1, k):
+        p = closest * weights
+        index = rng.choice(n, p=p / p.sum()) if p.sum() > 0 else rng.integers(n)
+        centers[i] = x[index]
+        closest = np.minimum(closest, _sq_distances(x, centers[i:i + 1])[:, 0])
+
+    labels = np.full(n, -1)
+    for _ in range(max_iter):
+        distances = _sq_distances(x, centers)
+        new_labels = distances.argmin(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        onehot = (labels[:, None] == np.arange(k)[None, :]) * weights[:, None]
+        mass = onehot.sum(axis=0)
+        sums = onehot.T @ x
+        empty = mass == 0
+        if empty.any():
+            # 空になったクラスタは、いまの中心から最も遠い点に置き直す
+            far = np.argsort(-distances[np.arange(n), labels])[: empty.sum()]
+            sums[empty], mass[empty] = x[far], 1.0
+        centers = sums / mass[:, None]
+    inertia = float((_sq_distances(x, centers)[np.arange(n), labels] * weights).sum())
+    return labels, centers, inertia
+
+
+def kmeans(
+    x: np.ndarray,
+    k: int,
+    seed: int = 0,
+    n_init: int = 4,
+    max_iter: int = 100,
+    weights: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, float]:
+    """k-means（k-means++ 初期化、n_init 回のうち最良の結果）。
+
+    Args:
+        x: 形状 (点の数, 次元) の行列。
+        k: クラスタ数（点の数を超える場合は点の数）。
+        seed: 乱数の種。
+        n_init: 初期値を変えて試す回数。
+        max_iter: 1回あたりの反復の上限。
+        weights: 点の重み（階層クラスタリングの葉など）。省略時はすべて1。
+
+    Returns:
+        (各点のクラスタ番号, 中心, クラスタ内二乗和)。
+    """
+    x = np.asarray(x, dtype=float)
+    k = min(k, len(x))
+    weights = np.ones(len(x)) if weights is None else np.asarray(weights, dtype=float)
+    rng = np.random.default_rng(seed)
+    best = None
+    for _ in range(n_init):
+        result = _kmeans_once(x, k, rng, weights, max_iter)
+        if best is None or result[2] < best[2]:
+            best = result
+    return best
+
+
+def ward(x: np.ndarray, k: int, seed: int = 0) -> np.ndarray:
+    """Ward 法の階層クラスタリングで k 個のクラスタに分ける。
+
+    点が WARD_MAX_LEAVES を超える場合は k-means の小クラスタを重み付きの葉として結合する。
+    結合のコストは Lance-Williams の更新式で葉の数に比例する手間で更新する。
+
+    Args:
+        x: 形状 (点の数, 次元) の行列。
+        k: クラスタ数。
+        seed: 小クラスタを作る k-means の乱数の種。
+
+    Returns:
+        各点のクラスタ番号。
+    """
+    x = np.asarray(x, dtype=float)
+    if len(x) > WARD_MAX_LEAVES:
+        leaf_of, centers, _ = kmeans(x, WARD_MAX_LEAVES, seed=seed, n_init=1)
+        sizes = np.bincount(leaf_of, minlength=len(centers)).astype(float)
+    else:
+        leaf_of, centers, sizes = np.arange(len(x)), x, np.ones(len(x))
+    m = len(centers)
+    k = min(k, m)
+
+    # Ward の結合コスト ni·nj/(ni+nj)·|ci−cj|²
+    d = _sq_distances(centers, centers) * (sizes[:, None] * sizes[None, :]) / (sizes[:, None] + sizes[None, :])
+    np.fill_diagonal(d, np.inf)
+    active = np.ones(m, dtype=bool)
+    group = np.arange(m)
+    for _ in range(m - k):
+        i, j = np.unravel_index(np.argmin(d), d.shape)
+        ni, nj, nk = sizes[i], sizes[j], sizes
+        merged = ((ni + nk) * d[i] + (nj + nk) * d[j] - nk * d[i, j]) / (ni + nj + nk)
+        d[i], d[:, i] = merged, merged
+        d[i, i] = np.inf
+        d[j], d[:, j] = np.inf, np.inf
+        sizes[i] += nj
+        active[j] = False
+        group[group == j] = i
+    _, labels = np.unique(group, return_inverse=True)
+    return labels[leaf_of]
+
+
+def project_2d(z: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """主成分分析で2次元に射影する（散布図用）。
+
+    Args:
+        z: 標準化した行列。
+
+    Returns:
+        (形状 (点の数, 2) の座標, 第1・第2主成分の寄与率)。
+    """
+    centered = z - z.mean(axis=0)
+    _, s, vt = np.linalg.svd(centered, full_matrices=False)
+    variance = s ** 2
+    ratio = variance[:2] / variance.sum() if variance.sum() > 0 else np.zeros(2)
+    coords = centered @ vt[:2].T
+    if coords.shape[1] < 2:
+        coords = np.pad(coords, ((0, 0), (0, 2 - coords.shape[1])))
+    return coords, np.pad(ratio, (0, 2 - len(ratio)))
+
+
+def correlation_matrix(features: pd.DataFrame, method: str = "spearman") -> pd.DataFrame:
+    """特徴量どうしの相関行列を求める。
+
+    欠損は列の平均で埋めてから、行列の積1回でまとめて計算する。
+
+    Args:
+        features: 特徴量の列を持つ DataFrame。
+        method: "spearman"（順位相関。外れ値に強い）または "pearson"。
+
+    Returns:
+        特徴量 × 特徴量の相関係数。
+    """
+    x = features.rank() if method == "spearman" else features
+    x = np.asarray(x, dtype=float)
+    with np.errstate(all="ignore"):
+        x = x - np.nanmean(x, axis=0)
+        x = np.nan_to_num(x, nan=0.0)
+        norm = np.sqrt((x * x).sum(axis=0))
+        corr = (x.T @ x) / np.outer(norm, norm)
+    corr = np.where(np.isfinite(corr), corr, np.nan)
+    np.fill_diagonal(corr, 1.0)
+    return pd.DataFrame(corr, index=features.columns, columns=features.columns)
+
+
+@dataclass
+class ClusterResult:
+    """クラスタリングの結果。"""
+
+    method: str
+    k: int
+    year: int | None
+    # code を索引とする1社1行の特徴量（FEATURES の元の値と 年度・期・CFパターン）
+    features: pd.DataFrame
+    # 各社のクラスタ番号（企業数の多い順に 0, 1, ...）
+    labels: np.ndarray
+    # クラスタ × 特徴量の標準化した平均（クラスタの特徴づけ用）
+    centroids: pd.DataFrame
+    # クラスタ × 特徴量の元の値の中央値
+    profile: pd.DataFrame
+    # クラスタの短い説明（平均から最も離れた特徴量）
+    names: list[str]
+    # 主成分の2次元座標と寄与率
+    coords: np.ndarray
+    explained: np.ndarray
+    # クラスタ内二乗和（標準化した空間）
+    inertia: float
+
+    def members(self, cluster: int) -> pd.DataFrame:
+        """クラスタに属する企業の特徴量を返す。"""
+        return self.features[self.labels == cluster]
+
+
+def _describe(centroids: pd.DataFrame, top: int = 2) -> list[str]:
+    """各クラスタで平均から最も離れた特徴量を「営業利益率↑・借入金比率↓」の形で並べる。"""
+    names = []
+    for _, row in centroids.iterrows():
+        strongest = row.abs().sort_values(ascending=False).index[:top]
+        names.append("・".join(f"{f}{'↑' if row[f] > 0 else '↓'}" for f in strongest))
+    return names
+
+
+def cluster_companies(
+    features: pd.DataFrame,
+    k: int,
+    method: str = "kmeans",
+    year: int | None = None,
+    seed: int = 0,
+) -> ClusterResult:
+    """企業を財務の形でクラスタに分ける。
+
+    Args:
+        features: universe_features() の結果。
+        k: クラスタ数。
+        method: METHODS のキー。
+        year: 比べる年度。None なら企業ごとの最新期。
+        seed: 乱数の種。
+
+    Returns:
+        ClusterResult。
+
+    Raises:
+        ValueError: 手法が不明な場合、または対象の企業がない場合。
+    """
+    if method not in METHODS:
+        raise ValueError(f"不明なクラスタリング手法です: {method}")
+    table = select_period(features, year)
+    if table.empty:
+        raise ValueError(f"対象の企業がありません（年度: {year}）")
+    z = normalize(table[FEATURES].to_numpy())
+
+    if method == "kmeans":
+        labels, _, _ = kmeans(z, k, seed=seed)
+    else:
+        labels = ward(z, k, seed=seed)
+    # クラスタ番号は企業数の多い順に振り直す（空のクラスタは詰める）
+    _, labels = np.unique(labels, return_inverse=True)
+    counts = np.bincount(labels)
+    order = np.argsort(-counts, kind="stable")
+    labels = np.argsort(order)[labels]
+    n_clusters = len(order)
+
+    onehot = labels[:, None] == np.arange(n_clusters)[None, :]
+    means = (onehot.T @ z) / onehot.sum(axis=0)[:, None]
+    inertia = float(((z - means[labels]) ** 2).sum())
+    centroids = pd.DataFrame(means, columns=FEATURES)
+    profile = table[FEATURES].groupby(labels).median()
+    coords, explained = project_2d(z)
+    return ClusterResult(
+        method=method,
+        k=n_clusters,
+        year=year,
+        features=table,
+        labels=labels,
+        centroids=centroids,
+        profile=profile,
+        names=_describe(centroids),
+        coords=coords,
+        explained=explained,
+        inertia=inertia,
+    )
+
+
+_features: tuple[str, pd.DataFrame] | None = None
+_results: OrderedDict[tuple, ClusterResult] = OrderedDict()
+_lock = threading.Lock()
+
+
+def _current_features() -> tuple[str, pd.DataFrame]:
+    global _features
+    version = data_version(("pl", "bs", "cf"))
+    with _lock:
+        if _features is None or _features[0] != version:
+            _features = (version, universe_features())
+            _results.clear()
+        return _features
+
+
+def get_features() -> pd.DataFrame:
+    """現在のデータ版に対応する全社の特徴量を返す（データ更新時のみ再計算）。
+
+    Returns:
+        universe_features() の結果。
+    """
+    return _current_features()[1]
+
+
+def get_clusters(k: int, method: str = "kmeans", year: int | None = None) -> ClusterResult:
+    """現在のデータ版に対応するクラスタリングの結果を返す（同じ条件の結果は再利用する）。
+
+    Args:
+        k: クラスタ数。
+        method: METHODS のキー。
+        year: 比べる年度。None なら企業ごとの最新期。
+
+    Returns:
+        ClusterResult。
+    """
+    version, features = _current_features()
+    key = (version, k, method, year)
+    with _lock:
+        hit = _results.get(key)
+        if hit is not None:
+            _results.move_to_end(key)
+            return hit
+    result = cluster_companies(features, k, method, year)
+    with _lock:
+        _results[key] = result
+        while len(_results) > MAX_RESULTS:
+            _results.popitem(last=False)
+    return result
@@ -2,29 +2,211 @@
 
 from __future__ import annotations
 
-import json
+import hashlib
+import os
+from collections.abc import Hashable, Iterable, Sequence
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 import pandas as pd
 
+from utils.periods import (
+    DEFAULT_FISCAL_MONTH,
+    parse_fiscal_month,
+    parse_periods,
+    period_label,
+    period_labels,
+    to_period,
+)
+from utils.schema import apply_schema
+from utils.shared_store import SharedStore, Snapshot
+from utils.storage import QUARTERLY_KINDS, STATEMENT_KINDS, CsvBackend, SqliteBackend, StorageBackend
+from utils.units import CANONICAL_UNIT, normalize_amounts, unit_yen
+
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 
+# FINANCE_DB に SQLite ファイルのパスを指定すると CSV の代わりにそちらを読む
+_backend: StorageBackend | None = None
+
+# FINANCE_SHARED にローダープロセスの公開ディレクトリを指定すると、変換済みの全社データを
+# メモリマップで共有して読む（shared_store モジュール）。set_backend で明示したときは使わない
+_shared: SharedStore | None = None
+_shared_enabled = True
+
+# (証券コード, 財務諸表種別) → ((更新検知値, 金額単位の円換算), 単位換算・スキーマ適用済み DataFrame)
+_statement_cache: dict[tuple[str, str], tuple[Hashable, pd.DataFrame]] = {}
+
+# 財務諸表種別 → (更新検知値, 全社分の DataFrame)
+_universe_cache: dict[str, tuple[Hashable, pd.DataFrame]] = {}
+
+# (更新検知値, 企業一覧)
+_companies_cache: tuple[Hashable, list[dict[str, str]]] | None = None
+
+# 証券コード → (company.json の更新検知値, (金額単位の円換算, 決算月))
+_settings_cache: dict[str, tuple[Hashable, tuple[int, int]]] = {}
+
+
+def get_backend() -> StorageBackend:
+    """現在のストレージバックエンドを返す（初回呼び出し時に生成）。
+
+    Returns:
+        環境変数 FINANCE_DB があれば SqliteBackend、なければ DATA_DIR の CsvBackend。
+    """
+    global _backend
+    if _backend is None:
+        db_path = os.environ.get("FINANCE_DB")
+        _backend = SqliteBackend(Path(db_path)) if db_path else CsvBackend(DATA_DIR)
+    return _backend
+
+
+def set_backend(backend: StorageBackend) -> None:
+    """ストレージバックエンドを差し替える。
+
+    Args:
+        backend: 以降の load_* が使うバックエンド。
+    """
+    global _backend, _shared_enabled
+    _backend = backend
+    _shared_enabled = False
+    clear_cache()
+
+
+def explicit_backend() -> StorageBackend | None:
+    """set_backend で差し替えたバックエンドを返す。
+
+    別プロセスで同じデータを読むときに渡す（jobs モジュールのワーカーなど）。
+
+    Returns:
+        差し替えたバックエンド。環境変数で決まる既定のままなら None。
+    """
+    return None if _shared_enabled else _backend
+
+
+def shared_snapshot() -> Snapshot | None:
+    """共有スナップショットの現在の版を返す。
+
+    Returns:
+        FINANCE_SHARED が設定され、公開済みの版があれば Snapshot。なければ None
+        （バックエンドから読む）。
+    """
+    global _shared
+    if not _shared_enabled:
+        return None
+    if _shared is None:
+        root = os.environ.get("FINANCE_SHARED")
+        if not root:
+            return None
+        _shared = SharedStore(Path(root))
+    return _shared.current()
+
+
+def clear_cache() -> None:
+    """読み込み済みの財務諸表・企業一覧のキャッシュを破棄する。"""
+    global _companies_cache
+    _statement_cache.clear()
+    _universe_cache.clear()
+    _settings_cache.clear()
+    _companies_cache = None
+
+
+def _company_settings(code: str) -> tuple[int, int]:
+    """企業の金額単位の円換算と決算月を company.json から読む（更新時のみ読み直す）。"""
+    snapshot = shared_snapshot()
+    stamp = snapshot.version if snapshot is not None else get_backend().info_stamp(code)
+    cached = _settings_cache.get(code)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        info = load_company_info(code)
+    except (FileNotFoundError, KeyError):
+        info = {}
+    settings = (unit_yen(info.get("currency")), parse_fiscal_month(info.get("fiscal_month")))
+    _settings_cache[code] = (stamp, settings)
+    return settings
+
+
+def company_unit_yen(code: str) -> int:
+    """企業が company.json の currency で宣言した金額単位の円換算を返す。
+
+    企業基本情報がない・単位の宣言がない企業は共通単位とみなす。
+
+    Args:
+        code: 証券コード。
+
+    Returns:
+        金額1単位あたりの円（百万円なら 1,000,000）。
+    """
+    return _company_settings(code)[0]
+
+
+def company_fiscal_month(code: str) -> int:
+    """企業の決算月（company.json の fiscal_month。宣言がなければ12月）を返す。
+
+    Args:
+        code: 証券コード。
+
+    Returns:
+        決算月（1〜12）。
+    """
+    return _company_settings(code)[1]
+
+
+def load_statement(code: str, kind: str) -> pd.DataFrame:
+    """財務諸表を種別指定で読み込む（load_pl などの共通実装）。
+
+    期を期コード（periods モジュール）に、金額を共通単位（units.CANONICAL_UNIT）に換算し、
+    スキーマを適用した結果をキャッシュする。共有スナップショットがあれば変換済みの行を切り出して返す。
+    返す DataFrame はキャッシュと共有しているため、呼び出し側で破壊的に変更しないこと。
+
+    Args:
+        code: 証券コード。
+        kind: "pl", "bs", "cf", "segment", "factors" または四半期の "pl_q", "bs_q", "cf_q"。
+
+    Returns:
+        財務諸表の DataFrame。
+
+    Raises:
+        FileNotFoundError: 企業の財務諸表がない場合（四半期は has_statement で確かめる）。
+    """
+    snapshot = shared_snapshot()
+    if snapshot is not None:
+        return snapshot.statement(code, kind)
+    backend = get_backend()
+    key = (code, kind)
+    settings = _company_settings(code)
+    stamp = (backend.stamp(code, kind), settings)
+    cached = _statement_cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    yen, fiscal_month = settings
+    df = backend.load_statement(code, kind)
+    df = df.assign(期=parse_periods(df["期"], fiscal_month, kind in QUARTERLY_KINDS))
+    df = normalize_amounts(df, kind, yen)
+    df = apply_schema(df, kind)
+    _statement_cache[key] = (stamp, df)
+    return df
+
 
 def list_companies() -> list[dict[str, str]]:
     """利用可能な企業一覧を返す。
 
+    結果はキャッシュし、企業の追加・削除や company.json の更新時だけ読み直す。
+    返すリストはキャッシュと共有しているため、破壊的に変更しないこと。
+
     Returns:
         企業コードと名前の辞書リスト。
     """
-    companies: list[dict[str, str]] = []
-    for d in sorted(DATA_DIR.iterdir()):
-        info_path = d / "company.json"
-        if d.is_dir() and info_path.exists():
-            info = json.loads(info_path.read_text(encoding="utf-8"))
-            companies.append({"code": info["code"], "name": info["name"]})
-    return companies
+    global _companies_cache
+    snapshot = shared_snapshot()
+    if snapshot is not None:
+        return snapshot.companies
+    backend = get_backend()
+    stamp = backend.metadata_stamp()
+    if _companies_cache is None or _companies_cache[0] != stamp:
+        _companies_cache = (stamp, backend.list_companies())
+    return _companies_cache[1]
 
 
 def load_company_info(code: str) -> dict[str, Any]:
@@ -36,8 +218,10 @@ def load_company_info(code: str) -> dict[str, Any]:
     Returns:
         company.json の内容。
     """
-    path = DATA_DIR / code / "company.json"
-    return json.loads(path.read_text(encoding="utf-8"))
+    snapshot = shared_snapshot()
+    if snapshot is not None:
+        return snapshot.info(code)
+    return get_backend().load_company_info(code)
 
 
 def load_pl(code: str) -> pd.DataFrame:
@@ -49,8 +233,7 @@ def load_pl(code: str) -> pd.DataFrame:
     Returns:
         損益計算書の DataFrame。
     """
-    path = DATA_DIR / code / "pl.csv"
-    return pd.read_csv(path, encoding="utf-8")
+    return load_statement(code, "pl")
 
 
 def load_bs(code: str) -> pd.DataFrame:
@@ -62,8 +245,7 @@ def load_bs(code: str) -> pd.DataFrame:
     Returns:
         貸借対照表の DataFrame。
     """
-    path = DATA_DIR / code / "bs.csv"
-    return pd.read_csv(path, encoding="utf-8")
+    return load_statement(code, "bs")
 
 
 def load_cf(code: str) -> pd.DataFrame:
@@ -75,8 +257,59 @@ def load_cf(code: str) -> pd.DataFrame:
     Returns:
         キャッシュフロー計算書の DataFrame。
     """
-    path = DATA_DIR / code / "cf.csv"
-    return pd.read_csv(path, encoding="utf-8")
+    return load_statement(code, "cf")
+
+
+def has_statement(code: str, kind: str) -> bool:
+    """企業の財務諸表があるかを返す（四半期の財務諸表は任意のため、読み込む前に確かめる）。
+
+    Args:
+        code: 証券コード。
+        kind: 財務諸表種別（"pl_q" など）。
+
+    Returns:
+        load_statement で読み込めれば True。
+    """
+    snapshot = shared_snapshot()
+    if snapshot is not None:
+        return snapshot.has_statement(code, kind)
+    return get_backend().has_statement(code, kind)
+
+
+def load_pl_q(code: str) -> pd.DataFrame:
+    """四半期のP/Lデータ（各四半期3か月分）を読み込む。
+
+    Args:
+        code: 証券コード。
+
+    Returns:
+        四半期の損益計算書の DataFrame（期は四半期末の期コード）。
+    """
+    return load_statement(code, "pl_q")
+
+
+def load_bs_q(code: str) -> pd.DataFrame:
+    """四半期末のB/Sデータを読み込む。
+
+    Args:
+        code: 証券コード。
+
+    Returns:
+        四半期末の貸借対照表の DataFrame。
+    """
+    return load_statement(code, "bs_q")
+
+
+def load_cf_q(code: str) -> pd.DataFrame:
+    """四半期のCFデータ（各四半期3か月分）を読み込む。
+
+    Args:
+        code: 証券コード。
+
+    Returns:
+        四半期のキャッシュフロー計算書の DataFrame。
+    """
+    return load_statement(code, "cf_q")
 
 
 def load_segment(code: str) -> pd.DataFrame:
@@ -88,8 +321,7 @@ def load_segment(code: str) -> pd.DataFrame:
     Returns:
         セグメント別の DataFrame。
     """
-    path = DATA_DIR / code / "segment.csv"
-    return pd.read_csv(path, encoding="utf-8")
+    return load_statement(code, "segment")
 
 
 def load_factors(code: str) -> pd.DataFrame:
@@ -101,8 +333,146 @@ def load_factors(code: str) -> pd.DataFrame:
     Returns:
         変動要因の DataFrame。
     """
-    path = DATA_DIR / code / "factors.csv"
-    return pd.read_csv(path, encoding="utf-8")
+    return load_statement(code, "factors")
+
+
+def query_statements(
+    kind: str,
+    codes: Sequence[str] | None = None,
+    periods: Iterable[int] | None = None,
+    columns: Sequence[str] | None = None,
+) -> pd.DataFrame:
+    """複数企業の財務諸表をまとめて読み込む。
+
+    SQLite バックエンドでは企業・列の絞り込みを SQL 側で行う。
+    期の保存形式は企業の決算月によって解釈が変わるため、期の絞り込みは期コードに変換してから行う。
+    期と金額は、企業ごとの決算月・単位を行ごとの配列にして全社分を一度に変換する。
+
+    Args:
+        kind: "pl", "bs", "cf", "segment", "factors" のいずれか。
+        codes: 対象の証券コード。None なら全社。
+        periods: 対象の期コード。None なら全期。
+        columns: 取得する列（"期" は常に含む）。None なら全列。
+
+    Returns:
+        先頭に code 列を持つ縦持ちの DataFrame。
+    """
+    snapshot = shared_snapshot()
+    if snapshot is not None:
+        df = snapshot.table(kind)
+        mask = np.ones(len(df), dtype=bool)
+        if codes is not None:
+            mask &= df["code"].isin(list(codes)).to_numpy()
+        if periods is not None:
+            mask &= np.isin(df["期"].to_numpy(), list(periods))
+        wanted = None if columns is None else ["code", "期"] + [c for c in columns if c != "期"]
+        return (df if wanted is None else df[wanted])[mask].reset_index(drop=True)
+    df = get_backend().query(kind, codes=codes, columns=columns)
+    companies = list_companies()
+    yen_by_code = {c["code"]: unit_yen(c.get("currency")) for c in companies}
+    month_by_code = {c["code"]: parse_fiscal_month(c.get("fiscal_month")) for c in companies}
+    yen = df["code"].map(yen_by_code).fillna(unit_yen(CANONICAL_UNIT)).to_numpy(dtype="int64")
+    month = df["code"].map(month_by_code).fillna(DEFAULT_FISCAL_MONTH).to_numpy(dtype="int64")
+    df = df.assign(期=parse_periods(df["期"], month, kind in QUARTERLY_KINDS))
+    if periods is not None:
+        df = df[np.isin(df["期"].to_numpy(), list(periods))].reset_index(drop=True)
+    df = normalize_amounts(df, kind, yen)
+    df = apply_schema(df, kind)
+    df["code"] = df["code"].astype("category")
+    return df
+
+
+def load_universe(kind: str) -> pd.DataFrame:
+    """全社分の財務諸表を縦持ちで読み込む。
+
+    結果はキャッシュし、いずれかの企業のデータが更新されたときだけ読み直す。
+    返す DataFrame はキャッシュと共有しているため、破壊的に変更しないこと。
+
+    Args:
+        kind: "pl", "bs", "cf", "segment", "factors" のいずれか。
+
+    Returns:
+        先頭に code 列を持つ全社分の DataFrame。
+    """
+    snapshot = shared_snapshot()
+    if snapshot is not None:
+        return snapshot.table(kind)
+    backend = get_backend()
+    # 企業の金額単位（company.json）の変更でも読み直す
+    stamp = (backend.universe_stamp(kind), backend.metadata_stamp())
+    cached = _universe_cache.get(kind)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    df = query_statements(kind)
+    _universe_cache[kind] = (stamp, df)
+    return df
+
+
+def load_shared_table(name: str) -> pd.DataFrame | None:
+    """共有スナップショットに公開された集計表（経営指標など）を返す。
+
+    Args:
+        name: 表の名前（shared_store.METRICS_TABLE など）。
+
+    Returns:
+        公開されていれば DataFrame（破壊的に変更しないこと）、なければ None。
+    """
+    snapshot = shared_snapshot()
+    if snapshot is None or not snapshot.has_table(name):
+        return None
+    return snapshot.table(name)
+
+
+def data_version(kinds: Sequence[str] = STATEMENT_KINDS) -> str:
+    """全社データの版を表す文字列を返す。
+
+    集計結果をキャッシュするときのキーに使う。いずれかの企業のデータや
+    企業情報（金額単位など）が更新されると値が変わる。
+
+    Args:
+        kinds: 対象とする財務諸表種別。
+
+    Returns:
+        版を表す短いハッシュ文字列。
+    """
+    snapshot = shared_snapshot()
+    if snapshot is not None:
+        # 公開される版はすべての種別をまとめて更新する
+        return snapshot.version
+    backend = get_backend()
+    stamps = repr([(k, backend.universe_stamp(k)) for k in kinds] + [backend.metadata_stamp()])
+    return hashlib.sha1(stamps.encode("utf-8")).hexdigest()[:16]
+
+
+def memory_report(codes: Sequence[str] | None = None) -> pd.DataFrame:
+    """財務諸表のメモリ使用量を集計する。
+
+    Args:
+        codes: 対象の証券コード。指定した企業は全種別を読み込んで計測する。
+            None ならキャッシュ済みの内容をそのまま計測する。
+
+    Returns:
+        code, kind, rows, bytes 列を持つ DataFrame（bytes は文字列の実体を含む）。
+        企業別・全体の合計は groupby("code")["bytes"].sum() などで求める。
+    """
+    if codes is not None:
+        for code in codes:
+            for kind in STATEMENT_KINDS:
+                load_statement(code, kind)
+        keys = [k for k in _statement_cache if k[0] in set(codes)]
+    else:
+        keys = list(_statement_cache)
+
+    rows = [
+        {
+            "code": code,
+            "kind": kind,
+            "rows": len(df),
+            "bytes": int(df.memory_usage(deep=True).sum()),
+        }
+        for (code, kind), (_, df) in sorted((k, _statement_cache[k]) for k in keys)
+    ]
+    return pd.DataFrame(rows, columns=["code", "kind", "rows", "bytes"])
 
 
 def calc_yoy_change(df: pd.DataFrame, col: str) -> pd.DataFrame:
@@ -121,17 +491,27 @@ def calc_yoy_change(df: pd.DataFrame, col: str) -> pd.DataFrame:
     return df
 
 
-def get_period_label(period: float | str) -> str:
+def get_period_label(period: int | str) -> str:
     """期の値を表示用ラベルに変換する。
 
     Args:
-        period: 期の値（例: 2024.12）。
+        period: 期コード（例: 202412）。"2024.12" のような期の文字列も受け付ける。
 
     Returns:
         表示用ラベル（例: "2024年12月期"）。
     """
-    s = str(period)
-    if "." in s:
-        year, month = s.split(".")
-        return f"{year}年{month}月期"
-    return f"{s}年12月期"
+    return period_label(to_period(period))
+
+
+def to_display_table(df: pd.DataFrame) -> pd.DataFrame:
+    """期を表示用ラベルにして行インデックスにした表示用 DataFrame を返す。
+
+    Args:
+        df: 期列を含む DataFrame。
+
+    Returns:
+        期ラベルをインデックスに持つ新しい DataFrame。
+    """
+    display_df = df.copy()
+    display_df["期"] = period_labels(display_df["期"])
+    return display_df.set_index("期")
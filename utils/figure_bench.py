@@ -0,0 +1,210 @@
+"""チャート生成のベンチマークと図の定義の検証。
+
+utils.charts の各図について、図の定義（*_spec）の組み立て、検証なしの Figure 化
+（create_* と同じ経路）、JSON 化、plotly のプロパティ検証付きの Figure 化の所要時間を測り、
+検証を省いたことによる高速化を図ごとに表示する。
+--check を付けると、定義が plotly の検証を通り、検証なしの図の JSON が検証付き Figure と
+同じ内容になることと、JSON のサイズが charts.FIGURE_BYTE_BUDGETS の上限以内であることも確かめる
+（plotly が受け付けないプロパティや値を定義に書いていないか、送るデータが増えすぎていないかの確認。
+問題があれば終了コード 1）。
+
+    python -m utils.figure_bench --code 5139 --repeat 50
+    python -m utils.figure_bench --check --repeat 1
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from utils import charts
+from utils.charts import FIGURE_BYTE_BUDGETS, FigureSpec, figure_from_spec, figure_to_json, payload_size, validate_spec
+from utils.clusters import cf_pattern_note
+from utils.data_loader import get_period_label, load_bs, load_cf, load_pl
+
+
+@dataclass
+class BenchResult:
+    """1つの図の計測結果（ミリ秒は1回あたりの中央値）。"""
+
+    name: str
+    spec_ms: float
+    figure_ms: float
+    json_ms: float
+    validated_ms: float
+    bytes: int
+    mismatch: str | None = None
+    budget: int | None = None
+
+    @property
+    def over_budget(self) -> bool:
+        """JSON のサイズが FIGURE_BYTE_BUDGETS の上限を超えているか。"""
+        return self.budget is not None and self.bytes > self.budget
+
+    @property
+    def speedup(self) -> float:
+        """検証付き Figure 化に対する、定義の組み立て + 検証なし Figure 化の速さ（倍）。"""
+        fast = self.spec_ms + self.figure_ms
+        return (self.spec_ms + self.validated_ms) / fast if fast else float("nan")
+
+
+def build_cases(code: str) -> dict[str, Callable[[], FigureSpec]]:
+    """企業のデータから、charts の全種類の図の定義を作る関数を用意する。
+
+    Args:
+        code: 証券コード。
+
+    Returns:
+        図の名前 → 図の定義を返す関数。
+    """
+    pl, bs, cf = load_pl(code), load_bs(code), load_cf(code)
+    pl_row, bs_row, cf_row = pl.iloc[-1], bs.iloc[-1], cf.iloc[-1]
+    label = get_period_label(pl_row["期"])
+    labels = [get_period_label(p) for p in pl["期"]]
+    revenue = pl["営業収益"].to_numpy(dtype=float)
+    future = [f"{i}年後" for i in range(1, 6)]
+    growth = np.cumprod(np.full(5, 1.05)) * revenue[-1]
+    bands = {q: growth * (0.8 + 0.4 * q) for q in (0.05, 0.25, 0.5, 0.75, 0.95)}
+    rng = np.random.default_rng(0)
+    matrix = pd.DataFrame(rng.uniform(-1, 1, (17, 17)), index=[f"f{i}" for i in range(17)],
+                          columns=[f"f{i}" for i in range(17)])
+
+    return {
+        "pl_sankey": lambda: charts.pl_sankey_spec(pl_row, label),
+        "pl_sankey_frames": lambda: charts.pl_sankey_frames_spec(pl),
+        "waterfall": lambda: charts.waterfall_spec(
+            ["営業収益", "売上原価", "販管費", "営業利益"],
+            [pl_row["営業収益"], -pl_row["売上原価"], -pl_row["販管費"], pl_row["営業利益"]],
+            "営業利益の内訳",
+        ),
+        "treemap": lambda: charts.treemap_spec(
+            ["全社", "A", "B", "C"], ["", "全社", "全社", "全社"], [0, 5, 3, 2], "セグメント", [0, 3.5, -1.2, 8.0],
+        ),
+        "bs_block": lambda: charts.bs_block_spec(bs_row, label),
+        "bs_block_frames": lambda: charts.bs_block_frames_spec(bs),
+        "cf_sankey": lambda: charts.cf_sankey_spec(cf_row, label),
+        "cf_sankey_frames": lambda: charts.cf_sankey_frames_spec(cf, note=cf_pattern_note),
+        "trend": lambda: charts.trend_chart_spec(
+            pl, ["営業収益", "売上総利益", "営業利益", "経常利益", "当期純利益"], "売上・利益の推移",
+            visible=["営業収益", "営業利益", "当期純利益"],
+        ),
+        "gauge": lambda: charts.gauge_spec(12.3, "ROE"),
+        "gauges": lambda: charts.gauges_spec([(name, 10.0 + i, None) for i, name in enumerate(["ROE", "ROA", "営業利益率"])]),
+        "fan_chart": lambda: charts.fan_chart_spec(labels, revenue, future, bands, "売上高の将来分布"),
+        "heatmap": lambda: charts.heatmap_spec(
+            np.outer(np.linspace(0.8, 1.2, 9), np.linspace(0.9, 1.1, 9)) * revenue[-1],
+            [f"{x:.0f}%" for x in np.linspace(-10, 10, 9)], [f"{y:.0f}%" for y in np.linspace(-20, 20, 9)],
+            "感応度", "成長率", "割引率",
+        ),
+        "tornado": lambda: charts.tornado_spec(
+            ["成長率", "割引率", "利益率"], [90.0, 85.0, 95.0], [110.0, 120.0, 104.0], 100.0, "感応度",
+        ),
+        "cluster_scatter": lambda: charts.cluster_scatter_spec(
+            rng.normal(size=(2000, 2)), rng.integers(0, 6, 2000), [f"c{i}" for i in range(6)],
+            [f"{i:04d}" for i in range(2000)], "クラスタ", ("PC1", "PC2"), highlight=0,
+        ),
+        "matrix_heatmap": lambda: charts.matrix_heatmap_spec(matrix, "相関行列"),
+    }
+
+
+def _median_ms(func: Callable[[], object], repeat: int) -> float:
+    """func を repeat 回実行したときの1回あたりの中央値（ミリ秒）。"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return float(np.median(times)) * 1000
+
+
+def bench(name: str, build: Callable[[], FigureSpec], repeat: int, check: bool = False) -> BenchResult:
+    """1つの図について、各経路の所要時間を測る。
+
+    Args:
+        name: 図の名前。
+        build: 図の定義を返す関数。
+        repeat: 各経路の実行回数。
+        check: 検証付き Figure と検証なしの図の JSON を比べるか。
+
+    Returns:
+        計測結果。
+    """
+    spec = build()
+    mismatch = None
+    if check:
+        # 検証は名前付きカラースケールの展開などの正規化もするため、
+        # 検証なしの JSON を検証し直したものと比べる（送った内容が欠けていないかを見る）
+        try:
+            validated = figure_to_json(validate_spec(spec))
+            roundtrip = figure_to_json(validate_spec(json.loads(figure_to_json(figure_from_spec(spec)))))
+        except ValueError as e:
+            mismatch = str(e).splitlines()[0]
+        else:
+            if json.loads(validated) != json.loads(roundtrip):
+                mismatch = "検証付き Figure と JSON が一致しません"
+
+    # Figure は定義を複製して取り込むので、同じ定義を使い回して包む時間だけを測る
+    return BenchResult(
+        name=name,
+        spec_ms=_median_ms(build, repeat),
+        figure_ms=_median_ms(lambda: figure_from_spec(spec), repeat),
+        json_ms=_median_ms(lambda: figure_to_json(spec), repeat),
+        validated_ms=_median_ms(lambda: validate_spec(spec), repeat),
+        bytes=payload_size(spec),
+        mismatch=mismatch,
+        budget=FIGURE_BYTE_BUDGETS.get(name),
+    )
+
+
+def format_results(results: list[BenchResult]) -> str:
+    """計測結果を表にする。"""
+    header = (
+        f"{'図':<18}{'定義 ms':>9}{'Figure ms':>11}{'JSON ms':>9}{'検証付き ms':>12}{'倍率':>7}{'バイト':>9}"
+    )
+    lines = [header]
+    for r in results:
+        lines.append(
+            f"{r.name:<18}{r.spec_ms:>9.2f}{r.figure_ms:>11.2f}{r.json_ms:>9.2f}"
+            f"{r.validated_ms:>14.2f}{r.speedup:>8.1f}{r.bytes:>10,}"
+        )
+        if r.mismatch:
+            lines.append(f"    ! {r.mismatch[:120]}")
+        if r.over_budget:
+            lines.append(f"    ! サイズが上限を超えています（{r.bytes:,} > {r.budget:,} バイト）")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """チャート生成のベンチマークを実行して結果を表示する CLI。"""
+    parser = argparse.ArgumentParser(description="チャート生成のベンチマーク")
+    parser.add_argument("--code", default="5139", help="データを使う企業の証券コード")
+    parser.add_argument("--repeat", type=int, default=20, help="各経路の実行回数")
+    parser.add_argument("--figure", action="append", help="対象の図（複数指定可。省略時はすべて）")
+    parser.add_argument("--check", action="store_true",
+                        help="検証付き Figure と検証なしの図の JSON の一致と、サイズの上限も確かめる")
+    args = parser.parse_args(argv)
+
+    cases = build_cases(args.code)
+    unknown = set(args.figure or []) - set(cases)
+    if unknown:
+        parser.error(f"未知の図: {', '.join(sorted(unknown))}（{', '.join(cases)}）")
+
+    results = [bench(name, cases[name], args.repeat, args.check) for name in (args.figure or list(cases))]
+    print(format_results(results))
+    total_fast = sum(r.spec_ms + r.figure_ms for r in results)
+    total_validated = sum(r.spec_ms + r.validated_ms for r in results)
+    print(f"合計: 検証なし {total_fast:.1f} ms / 検証付き {total_validated:.1f} ms")
+
+    if args.check and any(r.mismatch or r.over_budget for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""全社分の財務諸表ダンプ（1ファイル）を企業別 CSV に分割して取り込む。
+
+ベンダーから届く「code 列 + 財務諸表の列」の CSV を一定行数ずつ読み、
+企業ごとにバッファしてから `<data_dir>/<code>/<kind>.csv` にまとめて書き出す。
+全体を一度にメモリへ読み込まないため、使用メモリは入力の大きさによらず
+（チャンク行数・バッファ量・企業数で）一定に収まる::
+
+    python -m utils.importer dump_pl.csv --kind pl --data-dir data
+
+列構成は utils.schema.SCHEMAS（ローダーが想定する列）と照合し、
+金額列の数値・期の形式・企業ごとの期の並び順も検査する。
+バッファを書き出すたびに進捗（処理済み行数と企業別ファイルのサイズ）をチェックポイントに記録し、
+データの版（storage.bump_version）を更新する。中断後に同じコマンドを再実行すると続きから取り込む。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.periods import PERIOD_PATTERN, parse_fiscal_month, parse_periods, period_label
+from utils.schema import AMOUNT, PERIOD, SCHEMAS
+from utils.storage import QUARTERLY_KINDS, bump_version
+
+
+# 1回に読み込む行数
+DEFAULT_CHUNK_ROWS = 100_000
+
+# 企業別バッファの合計がこれを超えたらファイルに書き出す（バイト）
+DEFAULT_BUFFER_BYTES = 32 * 1024 * 1024
+
+# 企業コードの列名と、ディレクトリ名として受け付けるコード
+CODE_COLUMN = "code"
+_CODE_PATTERN = r"[0-9A-Za-z]+"
+
+# 金額の形式（空欄は欠損値として許容する）。期の形式はローダーと同じ periods.PERIOD_PATTERN
+_AMOUNT_PATTERN = r"\s*([-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?)?\s*"
+
+# CSV で引用符が必要な文字
+_NEEDS_QUOTE = r'[",\r\n]'
+
+
+class DumpFormatError(ValueError):
+    """ダンプの列構成や値がローダーの想定と合わない。"""
+
+
+@dataclass
+class ImportSummary:
+    """取り込み結果。"""
+
+    kind: str
+    rows: int = 0
+    companies: int = 0
+    resumed_rows: int = 0
+    ignored_columns: list[str] = field(default_factory=list)
+    missing_info: list[str] = field(default_factory=list)
+
+
+def detect_kind(columns: list[str]) -> str:
+    """ヘッダーの列構成から財務諸表の種類を推定する。
+
+    四半期の財務諸表は年次と列構成が同じため推定しない（--kind pl_q などで指定する）。
+
+    Args:
+        columns: ダンプのヘッダー。
+
+    Returns:
+        SCHEMAS のキー。
+
+    Raises:
+        DumpFormatError: 列構成に合う種類がない、または複数ある場合。
+    """
+    present = set(columns) - {CODE_COLUMN}
+    matches = [
+        kind for kind, schema in SCHEMAS.items() if kind not in QUARTERLY_KINDS and set(schema) <= present
+    ]
+    if len(matches) != 1:
+        raise DumpFormatError("列構成から財務諸表の種類を判定できません。--kind を指定してください。")
+    return matches[0]
+
+
+def _validate_header(columns: list[str], kind: str) -> list[str]:
+    """必須列がそろっているかを確認し、スキーマにない列の一覧を返す。"""
+    if CODE_COLUMN not in columns:
+        raise DumpFormatError(f"{CODE_COLUMN} 列がありません。")
+    missing = [c for c in SCHEMAS[kind] if c not in columns]
+    if missing:
+        raise DumpFormatError(f"{kind} に必要な列がありません: {', '.join(missing)}")
+    return [c for c in columns if c != CODE_COLUMN and c not in SCHEMAS[kind]]
+
+
+def _validate_chunk(chunk: pd.DataFrame, kind: str, first_row: int) -> None:
+    """チャンク内の値を検査する（first_row はチャンク先頭のデータ行番号）。"""
+    def fail(mask: pd.Series, message: str) -> None:
+        rows = (first_row + mask.to_numpy().nonzero()[0][:5]).tolist()
+        raise DumpFormatError(f"{message}（データ行 {', '.join(map(str, rows))} など）")
+
+    bad = ~chunk[CODE_COLUMN].str.fullmatch(_CODE_PATTERN)
+    if bad.any():
+        fail(bad, "企業コードが不正です")
+    for col, role in SCHEMAS[kind].items():
+        values = chunk[col]
+        if role == PERIOD:
+            bad = ~values.str.fullmatch(PERIOD_PATTERN)
+            if bad.any():
+                fail(bad, f"{col} の形式が不正です")
+        elif role == AMOUNT:
+            # pd.to_numeric より正規表現の一括照合のほうが速い
+            bad = ~values.str.fullmatch(_AMOUNT_PATTERN)
+            if bad.any():
+                fail(bad, f"{col} に数値でない値があります")
+
+
+def _fiscal_months(data_dir: Path, codes: pd.Series, known: dict[str, int]) -> np.ndarray:
+    """各行の企業の決算月（取り込み先の company.json。まだなければ既定の決算月）。
+
+    ローダーと同じ決算月で期を読み、並び順の検査と読み込み後の並びを一致させる。
+    known は企業コード → 決算月で、読んだ企業を記録してチャンクをまたいで使い回す。
+    """
+    for code in codes.unique():
+        if code not in known:
+            path = data_dir / code / "company.json"
+            info = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+            known[code] = parse_fiscal_month(info.get("fiscal_month"))
+    return codes.map(known).to_numpy(dtype=np.int64)
+
+
+def _to_lines(chunk: pd.DataFrame, kind: str) -> list[str]:
+    """チャンクをスキーマの列順の CSV 行（改行なし）のリストにする。
+
+    期と金額は検査済みで引用符が要らないため、文字列の列だけを必要に応じて引用符で囲み、
+    列を文字列のまま連結する（DataFrame.to_csv より速い）。
+    """
+    columns: list[pd.Series] = []
+    for col, role in SCHEMAS[kind].items():
+        values = chunk[col]
+        if role not in (PERIOD, AMOUNT):
+            quoted = '"' + values.str.replace('"', '""', regex=False) + '"'
+            values = values.where(~values.str.contains(_NEEDS_QUOTE), quoted)
+        columns.append(values)
+    return [",".join(values) for values in zip(*(c.tolist() for c in columns))]
+
+
+class _Checkpoint:
+    """中断後の再開に使う進捗の記録。
+
+    企業ごとに、最後に記録した時点のファイルサイズと期を持つ。
+    再開時は各ファイルをそのサイズまで切り詰め、記録より後の行を読み直す。
+    """
+
+    def __init__(self, path: Path, source: Path, kind: str) -> None:
+        self.path = path
+        st = source.stat()
+        self.source = {"path": str(source.resolve()), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        self.kind = kind
+        self.rows = 0
+        self.companies: dict[str, tuple[int, int]] = {}
+
+    def load(self) -> bool:
+        """同じダンプの取り込み途中の記録があれば読み込む。"""
+        if not self.path.exists():
+            return False
+        saved = json.loads(self.path.read_text(encoding="utf-8"))
+        if saved["source"] != self.source or saved["kind"] != self.kind:
+            raise DumpFormatError(
+                f"別のダンプの取り込み途中の記録があります: {self.path}（--restart で最初から取り込めます）"
+            )
+        self.rows = saved["rows"]
+        self.companies = {code: (size, last) for code, (size, last) in saved["companies"].items()}
+        return True
+
+    def save(self) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps({
+                "source": self.source,
+                "kind": self.kind,
+                "rows": self.rows,
+                "companies": self.companies,
+            }, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        tmp.replace(self.path)
+
+    def delete(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+class _CompanyWriter:
+    """企業別の出力をバッファし、まとめてファイルに追記する。"""
+
+    def __init__(self, data_dir: Path, kind: str, checkpoint: _Checkpoint, buffer_bytes: int) -> None:
+        self.data_dir = data_dir
+        self.kind = kind
+        self.checkpoint = checkpoint
+        self.buffer_bytes = buffer_bytes
+        self.header = ",".join(SCHEMAS[kind]) + "\n"
+        self._buffers: dict[str, list[str]] = {}
+        self._last: dict[str, int] = {}
+        self._buffered = 0
+
+    def add(self, code: str, text: str, first: int, last: int) -> None:
+        """1社分の行（CSV テキスト）をバッファに追加する。first・last は先頭・末尾の期コード。"""
+        previous = self._last.get(code, self.checkpoint.companies.get(code, (0, 0))[1])
+        if first < previous:
+            raise DumpFormatError(
+                f"{code} の期が昇順に並んでいません（{period_label(previous)} の後に {period_label(first)}）。"
+            )
+        self._last[code] = last
+        self._buffers.setdefault(code, []).append(text)
+        self._buffered += len(text)
+
+    @property
+    def full(self) -> bool:
+        return self._buffered >= self.buffer_bytes
+
+    def flush(self, rows: int) -> None:
+        """バッファを書き出し、処理済み行数 rows までをチェックポイントに記録する。"""
+        for code, texts in self._buffers.items():
+            path = self.data_dir / code / f"{self.kind}.csv"
+            if code in self.checkpoint.companies:
+                mode = "a"
+            else:
+                # この取り込みで初めて出てきた企業は既存ファイルを置き換える
+                path.parent.mkdir(parents=True, exist_ok=True)
+                mode = "w"
+                texts.insert(0, self.header)
+            with open(path, mode, encoding="utf-8", newline="") as f:
+                f.write("".join(texts))
+                size = f.tell()
+            self.checkpoint.companies[code] = (size, self._last[code])
+        self.checkpoint.rows = rows
+        self.checkpoint.save()
+        bump_version(self.data_dir)
+        self._buffers.clear()
+        self._last.clear()
+        self._buffered = 0
+
+
+def import_dump(
+    source: Path,
+    data_dir: Path,
+    kind: str | None = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    buffer_bytes: int = DEFAULT_BUFFER_BYTES,
+    encoding: str = "utf-8-sig",
+    restart: bool = False,
+) -> ImportSummary:
+    """全社分のダンプを企業別の CSV に分割して書き出す。
+
+    ダンプに含まれる企業の `<kind>.csv` は置き換え、含まれない企業のファイルは変更しない。
+    各企業の行はダンプ内の順に書き出すため、企業ごとには期の昇順に並んでいる必要がある
+    （企業をまたいだ並び順は問わない）。
+
+    Args:
+        source: ダンプの CSV ファイル（code 列 + 財務諸表の列）。
+        data_dir: 企業別 CSV ディレクトリ。
+        kind: 財務諸表種別。None ならヘッダーから推定する。
+        chunk_rows: 1回に読み込む行数。
+        buffer_bytes: 書き出す前にバッファしておく量（バイト）。
+        encoding: ダンプの文字コード。
+        restart: True なら取り込み途中の記録を破棄して最初から取り込む。
+
+    Returns:
+        ImportSummary。
+
+    Raises:
+        DumpFormatError: 列構成や値が不正な場合（それまでに書き出した分から再開できる）。
+    """
+    source = Path(source)
+    data_dir = Path(data_dir)
+    columns = pd.read_csv(source, nrows=0, encoding=encoding).columns.tolist()
+    if kind is None:
+        kind = detect_kind(columns)
+    elif kind not in SCHEMAS:
+        raise ValueError(f"未知の財務諸表種別です: {kind}")
+    summary = ImportSummary(kind=kind, ignored_columns=_validate_header(columns, kind))
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = _Checkpoint(data_dir / f".import_{kind}.json", source, kind)
+    if restart:
+        checkpoint.delete()
+    elif checkpoint.load():
+        # 最後の記録より後に書きかけた分を捨てる
+        for code, (size, _) in checkpoint.companies.items():
+            os.truncate(data_dir / code / f"{kind}.csv", size)
+        bump_version(data_dir)
+        summary.resumed_rows = checkpoint.rows
+
+    writer = _CompanyWriter(data_dir, kind, checkpoint, buffer_bytes)
+    skip = checkpoint.rows
+    reader = pd.read_csv(
+        source,
+        usecols=[CODE_COLUMN, *SCHEMAS[kind]],
+        dtype=str,
+        keep_default_na=False,
+        encoding=encoding,
+        chunksize=chunk_rows,
+        # 再開時は記録済みの行を読み飛ばす（0 行目はヘッダー）
+        skiprows=(lambda i: 0 < i <= skip) if skip else None,
+    )
+    rows = checkpoint.rows
+    fiscal_months: dict[str, int] = {}
+    with reader:
+        for chunk in reader:
+            _validate_chunk(chunk, kind, rows + 1)
+            # 期はローダーと同じく企業の決算月で期コードにして比べる
+            # （浮動小数だと 2024.9 と 2024.10 の順が逆になる）
+            months = _fiscal_months(data_dir, chunk[CODE_COLUMN], fiscal_months)
+            try:
+                periods = parse_periods(chunk["期"], months, kind in QUARTERLY_KINDS)
+            except ValueError as e:
+                raise DumpFormatError(str(e)) from None
+            lines = _to_lines(chunk, kind)
+            # 企業ごとにまとめる（安定ソートなので企業内の行の順は保たれる）
+            ids, codes = pd.factorize(chunk[CODE_COLUMN])
+            order = np.argsort(ids, kind="stable")
+            ids, periods = ids[order], periods[order]
+            unordered = (np.diff(periods) < 0) & (np.diff(ids) == 0)
+            if unordered.any():
+                code = codes[ids[unordered.argmax()]]
+                raise DumpFormatError(f"{code} の期が昇順に並んでいません。")
+            bounds = np.flatnonzero(np.diff(ids)) + 1
+            for start, stop in zip([0, *bounds.tolist()], [*bounds.tolist(), len(ids)]):
+                text = "\n".join([lines[i] for i in order[start:stop].tolist()]) + "\n"
+                writer.add(codes[ids[start]], text, int(periods[start]), int(periods[stop - 1]))
+            rows += len(chunk)
+            if writer.full:
+                writer.flush(rows)
+    writer.flush(rows)
+    checkpoint.delete()
+
+    summary.rows = rows - summary.resumed_rows
+    summary.companies = len(checkpoint.companies)
+    summary.missing_info = sorted(
+        code for code in checkpoint.companies if not (data_dir / code / "company.json").exists()
+    )
+    return summary
+
+
+def main(argv: list[str] | None = None) -> None:
+    """全社分のダンプを企業別 CSV に取り込む CLI。"""
+    parser = argparse.ArgumentParser(description="全社分の財務諸表ダンプを企業別CSVに分割する")
+    parser.add_argument("source", type=Path, help="ダンプの CSV ファイル（code 列 + 財務諸表の列）")
+    parser.add_argument("--kind", choices=list(SCHEMAS), help="財務諸表種別（既定: ヘッダーから推定）")
+    parser.add_argument(
+        "--data-dir",
+        type=Path,
+        default=Path(__file__).resolve().parent.parent / "data",
+        help="企業別CSVディレクトリ（既定: data/）",
+    )
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="1回に読み込む行数")
+    parser.add_argument(
+        "--buffer-mb", type=int, default=DEFAULT_BUFFER_BYTES // (1024 * 1024),
+        help="書き出す前にバッファする量（MB）",
+    )
+    parser.add_argument("--encoding", default="utf-8-sig", help="ダンプの文字コード（例: cp932）")
+    parser.add_argument("--restart", action="store_true", help="取り込み途中の記録を破棄して最初から取り込む")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        summary = import_dump(
+            args.source,
+            args.data_dir,
+            kind=args.kind,
+            chunk_rows=args.chunk_rows,
+            buffer_bytes=args.buffer_mb * 1024 * 1024,
+            encoding=args.encoding,
+            restart=args.restart,
+        )
+    except DumpFormatError as e:
+        parser.exit(1, f"取り込みを中断しました: {e}\n")
+    elapsed = time.perf_counter() - started
+
+    resumed = f"（{summary.resumed_rows:,} 行目から再開）" if summary.resumed_rows else ""
+    print(f"{summary.companies} 社・{summary.rows:,} 行の {summary.kind} を取り込みました{resumed}（{elapsed:.1f} 秒）。")
+    if summary.ignored_columns:
+        print(f"  スキーマにない列は無視しました: {', '.join(summary.ignored_columns)}")
+    if summary.missing_info:
+        print(f"  company.json がない企業（一覧に表示されません）: {len(summary.missing_info)} 社")
+
+
+if __name__ == "__main__":
+    main()
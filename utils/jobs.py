@@ -0,0 +1,553 @@
+"""重い集計をプロセスプールで実行するジョブ管理。
+
+全社の検査（データチェック）・クラスタ分析・スクリーニング・一括書き出しなど時間のかかる処理を、
+Streamlit のスクリプトを実行するスレッドではなく別プロセスで実行する。計算中も GIL を握らないので、
+他の利用者や同じページの操作（再実行）は待たされない。
+
+- プロセス数に上限のあるプール（FINANCE_JOB_WORKERS、既定 DEFAULT_MAX_WORKERS）で実行する
+- 同じ処理・同じ引数・同じデータ版のジョブが実行中なら、新たに投入せず同じジョブを返す
+- 結果は（処理, 引数, データ版）ごとに保持し、データが更新されるまで再利用する
+- ワーカーは report_progress で進捗を送り、ページは Job.progress を見て進捗バーを表示する（show_job）
+
+ワーカーは forkserver で起動する（Streamlit のサーバーは多数のスレッドを持つため、fork すると
+他のスレッドが握っていたロックを子プロセスが引き継いでしまう）。set_backend で差し替えた
+バックエンドはワーカーにも渡す。ワーカーは読み込んだ全社データを次のジョブでも使う。
+全ワーカーはプールの作成時にまとめて起動する。utils.warmup から起動したサーバーでは、
+Streamlit がページを実行する前に start_pool で起動しておく。
+
+コマンドラインからも同じ処理を実行できる（進捗を表示する）:
+
+    python -m utils.jobs anomalies
+    python -m utils.jobs clusters 6 ward
+    python -m utils.jobs export pl pl_all.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterator
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import streamlit as st
+
+from utils.data_loader import data_version, explicit_backend, load_universe, set_backend
+from utils.periods import period_texts
+from utils.storage import CsvBackend, SqliteBackend
+
+
+# ワーカープロセス数の既定値（Streamlit のサーバー自身が使うコアを残す）
+DEFAULT_MAX_WORKERS = 2
+
+# ワーカープロセス数を指定する環境変数
+WORKERS_ENV = "FINANCE_JOB_WORKERS"
+
+# 保持する完了済みジョブの数（古いものから破棄）
+MAX_RESULTS = 32
+
+# show_job がページを止めずに完了を待つ秒数（すぐ終わるジョブで進捗バーを出さないため）
+QUICK_WAIT = 0.3
+
+# 実行中のジョブの進捗を見直す間隔（秒）
+POLL_INTERVAL = 0.5
+
+# 一括書き出しで1回に書く行数（この単位で進捗を送る）
+EXPORT_CHUNK_ROWS = 50_000
+
+# プールの起動時に全ワーカーがそろうのを待つ秒数
+WORKER_START_TIMEOUT = 60.0
+
+
+@dataclass(frozen=True)
+class Task:
+    """ジョブとして実行できる処理。
+
+    func はワーカーで呼ぶため、モジュールの最上位で定義した関数にする（pickle できること）。
+    """
+
+    func: Callable[..., Any]
+    label: str
+    # 結果の版を決める財務諸表種別（data_version に渡す）
+    kinds: tuple[str, ...] = ("pl", "bs", "cf")
+    # 完了した結果を呼び出し元のプロセスのキャッシュに取り込む関数（引数はデータ版と結果）
+    adopt: Callable[[str, Any], None] | None = None
+    # 完了した結果を保持して再利用するか（ファイルを書き出す処理などは毎回実行する）
+    cache: bool = True
+
+
+@dataclass(eq=False)
+class Job:
+    """投入したジョブ。進捗はワーカーからの報告で更新される。"""
+
+    id: int
+    name: str
+    params: tuple
+    version: str
+    future: Future = field(repr=False)
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    progress: float = 0.0
+    message: str = ""
+
+    @property
+    def state(self) -> str:
+        """queued（順番待ち）・running・done・failed のいずれか。"""
+        if self.future.done():
+            return "failed" if self.error is not None else "done"
+        return "running" if self.started_at is not None else "queued"
+
+    @property
+    def error(self) -> BaseException | None:
+        """失敗した場合の例外（未完了・成功なら None）。"""
+        if not self.future.done():
+            return None
+        if self.future.cancelled():
+            return CancelledError()
+        return self.future.exception()
+
+    @property
+    def elapsed(self) -> float:
+        """ワーカーでの実行時間（秒）。実行中なら現在までの時間。"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """完了するまで最大 timeout 秒待つ（待つ間は GIL を握らない）。
+
+        Returns:
+            完了していれば True。
+        """
+        try:
+            self.future.exception(timeout)
+        except TimeoutError:
+            return False
+        except CancelledError:
+            pass
+        return True
+
+    def result(self, timeout: float | None = None) -> Any:
+        """結果を返す（完了まで待つ）。ワーカーで発生した例外はここで送出される。"""
+        return self.future.result(timeout)
+
+
+# --- ワーカー側 ---
+
+_progress_queue: Any = None
+_current_job: int | None = None
+_started: Any = None
+
+
+def _init_worker(backend: Any, queue: Any, started: Any) -> None:
+    """ワーカープロセスの初期化（親と同じデータを読み、進捗の送り先を覚える）。"""
+    global _progress_queue, _started
+    _progress_queue = queue
+    _started = started
+    if backend is not None:
+        set_backend(backend)
+
+
+def _wait_started() -> None:
+    """全ワーカーが起動するまで待つ（プールの作成時にワーカー数だけ投入する）。"""
+    _started.wait(WORKER_START_TIMEOUT)
+
+
+def _run(job_id: int, name: str, params: tuple) -> Any:
+    """ワーカーでジョブを実行する。"""
+    global _current_job
+    _current_job = job_id
+    report_progress(0, 1)
+    try:
+        return TASKS[name].func(*params)
+    finally:
+        _current_job = None
+
+
+def report_progress(done: int, total: int, message: str = "") -> None:
+    """実行中のジョブの進捗を親プロセスに送る（ジョブの外から呼んだ場合は何もしない）。
+
+    Args:
+        done: 終わった量。
+        total: 全体の量。
+        message: 現在の処理内容。
+    """
+    if _progress_queue is not None and _current_job is not None:
+        _progress_queue.put((_current_job, done, total, message))
+
+
+# --- 処理 ---
+
+def _task_anomalies() -> Any:
+    from utils.anomalies import SCANNED_KINDS, scan_universe
+
+    steps = len(SCANNED_KINDS) + 1
+    for i, kind in enumerate(SCANNED_KINDS):
+        report_progress(i, steps, f"{kind.upper()} を読み込み中")
+        load_universe(kind)
+    report_progress(steps - 1, steps, "全社・全期を検査中")
+    return scan_universe()
+
+
+def _task_cluster_features() -> Any:
+    from utils.clusters import get_features
+
+    report_progress(0, 1, "特徴量を計算中")
+    return get_features()
+
+
+def _task_clusters(k: int, method: str = "kmeans", year: int | None = None) -> Any:
+    from utils.clusters import get_clusters, get_features
+
+    report_progress(0, 2, "特徴量を計算中")
+    get_features()
+    report_progress(1, 2, "クラスタに分割中")
+    return get_clusters(k, method, year)
+
+
+def _task_valuation_screen(rate: float, terminal: float) -> Any:
+    from utils.valuation import valuation_screen
+
+    for i, kind in enumerate(("pl", "bs", "cf")):
+        report_progress(i, 4, f"{kind.upper()} を読み込み中")
+        load_universe(kind)
+    report_progress(3, 4, "全社を試算中")
+    return valuation_screen(rate, terminal)
+
+
+def _task_export(kind: str, path: str) -> int:
+    """全社分を utils.importer で取り込み直せるダンプ（code 列 + 財務諸表の列）として書き出す。
+
+    期は CSV の形式（"2024.12"）で書く。金額は読み込み時に換算した共通単位（units.CANONICAL_UNIT）の
+    値なので、取り込み直す企業の company.json の currency も共通単位にする。
+    """
+    report_progress(0, 1, f"{kind.upper()} を読み込み中")
+    df = load_universe(kind)
+    total = max(len(df), 1)
+    for start in range(0, len(df) or 1, EXPORT_CHUNK_ROWS):
+        chunk = df.iloc[start:start + EXPORT_CHUNK_ROWS]
+        chunk = chunk.assign(期=period_texts(chunk["期"]))
+        chunk.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False,
+                     encoding="utf-8-sig" if start == 0 else "utf-8")
+        report_progress(start + len(chunk), total, f"{start + len(chunk):,} / {len(df):,} 行を書き出し済み")
+    return len(df)
+
+
+def _adopt_anomalies(version: str, result: Any) -> None:
+    from utils.anomalies import set_anomalies
+
+    set_anomalies(version, result)
+
+
+TASKS: dict[str, Task] = {
+    "anomalies": Task(_task_anomalies, "データチェック", adopt=_adopt_anomalies),
+    "cluster_features": Task(_task_cluster_features, "クラスタ分析の特徴量"),
+    "clusters": Task(_task_clusters, "クラスタ分析"),
+    "valuation_screen": Task(_task_valuation_screen, "全社スクリーニング"),
+    "export": Task(_task_export, "一括書き出し", cache=False),
+}
+
+
+# --- 親プロセス側 ---
+
+_executor: ProcessPoolExecutor | None = None
+_queue: Any = None
+_lock = threading.Lock()
+_ids = itertools.count(1)
+# (処理, 引数, データ版) → ジョブ
+_running: dict[Hashable, Job] = {}
+_results: OrderedDict[Hashable, Job] = OrderedDict()
+# ジョブ ID → 実行中のジョブ（進捗の反映先）
+_by_id: dict[int, Job] = {}
+
+
+def _after_fork() -> None:
+    """fork した子プロセスでは親のプールと実行中のジョブを引き継がない（完了済みの結果はそのまま使える）。"""
+    global _executor, _queue, _lock
+    _executor = _queue = None
+    _lock = threading.Lock()
+    _running.clear()
+    _by_id.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def max_workers() -> int:
+    """ワーカープロセス数（環境変数 FINANCE_JOB_WORKERS、なければ DEFAULT_MAX_WORKERS。CPU 数まで）。"""
+    value = os.environ.get(WORKERS_ENV)
+    workers = int(value) if value else DEFAULT_MAX_WORKERS
+    return max(1, min(workers, os.cpu_count() or 1))
+
+
+def _listen(queue: Any) -> None:
+    """ワーカーからの進捗を受け取ってジョブに反映する（None を受け取ったら終わる）。"""
+    while True:
+        item = queue.get()
+        if item is None:
+            return
+        job_id, done, total, message = item
+        job = _by_id.get(job_id)
+        if job is None:
+            continue
+        if job.started_at is None:
+            job.started_at = time.time()
+        job.progress = min(done / total, 1.0) if total else 0.0
+        if message:
+            job.message = message
+
+
+def _pool() -> ProcessPoolExecutor:
+    """プロセスプールを返す（初回のみ作成して全ワーカーを起動する。_lock を取得した状態で呼ぶ）。"""
+    global _executor, _queue
+    if _executor is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+        if method == "forkserver":
+            # pandas などの読み込みはサーバーで1回だけ行い、ワーカーはそこから fork する
+            context.set_forkserver_preload(["utils.anomalies", "utils.clusters", "utils.valuation"])
+        workers = max_workers()
+        queue = context.SimpleQueue()
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(explicit_backend(), queue, context.Barrier(workers)),
+        )
+        # ワーカーは空きがないときに submit の中で1つずつ起動される。全ワーカーがそろうまで終わらない
+        # 処理をワーカー数だけ投入してここで全ワーカーを起動し、以降の submit ではプロセスを起動しない
+        with _without_main():
+            started = [executor.submit(_wait_started) for _ in range(workers)]
+        try:
+            for future in started:
+                future.result()
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        _executor, _queue = executor, queue
+        threading.Thread(target=_listen, args=(queue,), name="job-progress", daemon=True).start()
+    return _executor
+
+
+def start_pool() -> None:
+    """プロセスプールを作成して全ワーカーを起動しておく（作成済みなら何もしない）。
+
+    Streamlit がページを実行する前に呼べば、ワーカーの起動時に __main__ を差し替えずに済む
+    （utils.warmup はサーバーの起動前に呼ぶ）。
+    """
+    with _lock:
+        _pool()
+
+
+@contextmanager
+def _without_main() -> Iterator[None]:
+    """ワーカーを起動する間だけ、スクリプトの __main__ を空のモジュールに差し替える。
+
+    Streamlit は実行中のページのスクリプトを __main__ として登録する。forkserver・spawn で起動した
+    ワーカーは __main__ を読み込み直すので、そのままではワーカーがページのスクリプトを実行してしまう。
+    モジュールとして起動した場合（python -m utils.warmup など）はワーカーが同じモジュールを
+    __mp_main__ として読み込むだけなので差し替えない。差し替えはプロセス全体に及ぶため、
+    プールの作成時（_pool）にだけ行う。
+    """
+    main = sys.modules.get("__main__")
+    if main is None or getattr(main.__spec__, "name", None) is not None:
+        yield
+        return
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def _finish(key: Hashable, job: Job, executor: ProcessPoolExecutor) -> None:
+    """ジョブの完了時に呼ばれる（成功した結果だけを保持する）。"""
+    job.finished_at = time.time()
+    error = job.error
+    task = TASKS[job.name]
+    with _lock:
+        _running.pop(key, None)
+        _by_id.pop(job.id, None)
+        if error is None:
+            job.progress = 1.0
+            if task.cache:
+                _results[key] = job
+                while len(_results) > MAX_RESULTS:
+                    _results.popitem(last=False)
+    if isinstance(error, BrokenProcessPool):
+        # ワーカーが異常終了した（メモリ不足など）。次の投入でプールを作り直す
+        _discard(executor, wait=False)
+    if error is None and task.adopt is not None:
+        task.adopt(job.version, job.future.result())
+
+
+def submit(name: str, *params: Hashable) -> Job:
+    """ジョブを投入する。
+
+    同じ処理・引数・データ版のジョブが完了済みならそれを、実行中ならそのジョブを返す。
+
+    Args:
+        name: TASKS のキー。
+        *params: 処理の引数（ハッシュ可能で pickle できる値）。
+
+    Returns:
+        Job。
+
+    Raises:
+        ValueError: 処理の名前が不明な場合。
+    """
+    if name not in TASKS:
+        raise ValueError(f"不明なジョブです: {name}（{', '.join(TASKS)}）")
+    version = data_version(TASKS[name].kinds)
+    key = (name, params, version)
+    with _lock:
+        job = _results.get(key)
+        if job is not None:
+            _results.move_to_end(key)
+            return job
+        job = _running.get(key)
+        if job is not None:
+            return job
+        executor = _pool()
+        job_id = next(_ids)
+        future = executor.submit(_run, job_id, name, params)
+        job = Job(id=job_id, name=name, params=params, version=version, future=future)
+        _running[key] = job
+        _by_id[job_id] = job
+    future.add_done_callback(lambda _: _finish(key, job, executor))
+    return job
+
+
+def running_jobs() -> list[Job]:
+    """実行中・順番待ちのジョブを投入順に返す。"""
+    with _lock:
+        return sorted(_running.values(), key=lambda job: job.id)
+
+
+def shutdown(wait: bool = True) -> None:
+    """プロセスプールを停止する（順番待ちのジョブは取り消す。次の submit で作り直す）。
+
+    Args:
+        wait: 実行中のジョブの終了を待つか。
+    """
+    with _lock:
+        executor = _executor
+    if executor is not None:
+        _discard(executor, wait)
+
+
+def _discard(executor: ProcessPoolExecutor, wait: bool) -> None:
+    """プールを停止する（すでに作り直していれば新しいプールには触れない）。"""
+    global _executor, _queue
+    with _lock:
+        if _executor is not executor:
+            return
+        queue = _queue
+        _executor = _queue = None
+    executor.shutdown(wait=wait, cancel_futures=True)
+    queue.put(None)
+
+
+# --- ページ ---
+
+@st.fragment(run_every=POLL_INTERVAL)
+def rerun_when_done(job: Job) -> None:
+    """ジョブが終わったらページ全体を再実行する（何も表示しない）。
+
+    結果がなくても表示できる補助的な要素（他ページの要確認バッジなど）を、後から表示するのに使う。
+    """
+    if job.done():
+        st.rerun()
+
+
+@st.fragment(run_every=POLL_INTERVAL)
+def _job_progress(job: Job, label: str) -> None:
+    """実行中のジョブの進捗バー。完了したらページ全体を再実行して結果を表示させる。"""
+    if job.done():
+        st.rerun()
+    if job.state == "queued":
+        text = f"{label}: 順番待ち（他の集計の完了を待っています）"
+    else:
+        text = f"{label}: {job.message or '計算中'}（{job.elapsed:.0f} 秒経過）"
+    st.progress(job.progress, text=text)
+
+
+def show_job(job: Job, label: str | None = None) -> Any:
+    """ページでジョブの結果を使う。
+
+    QUICK_WAIT 秒以内に終われば結果を返す。終わらなければ進捗バーを表示してページの描画をここで止め、
+    完了後にページを再実行する（待つ間もほかの操作はできる）。
+
+    Args:
+        job: submit の結果。
+        label: 進捗バーに表示する処理名（省略時は TASKS の label）。
+
+    Returns:
+        ジョブの結果。ジョブが失敗した場合はその例外が送出される。
+    """
+    if job.wait(QUICK_WAIT):
+        return job.result()
+    _job_progress(job, label or TASKS[job.name].label)
+    st.stop()
+
+
+def _parse_param(text: str) -> Any:
+    """コマンドラインの引数を Python の値として読む（読めなければ文字列のまま）。"""
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def main(argv: list[str] | None = None) -> None:
+    """ジョブを実行し、進捗を表示しながら完了を待つ CLI。"""
+    parser = argparse.ArgumentParser(description="重い集計をプロセスプールで実行する")
+    parser.add_argument("task", choices=list(TASKS), help="実行する処理")
+    parser.add_argument("params", nargs="*", help="処理の引数（例: clusters 6 ward）")
+    parser.add_argument("--data-dir", type=Path, help="企業別CSVディレクトリ（既定: data/）")
+    parser.add_argument("--db", type=Path, help="SQLite データベース（--data-dir より優先）")
+    args = parser.parse_args(argv)
+    if args.db is not None:
+        set_backend(SqliteBackend(args.db))
+    elif args.data_dir is not None:
+        set_backend(CsvBackend(args.data_dir))
+
+    job = submit(args.task, *(_parse_param(p) for p in args.params))
+    last = None
+    while not job.wait(POLL_INTERVAL):
+        line = f"{job.progress:>4.0%} {job.message}"
+        if line != last:
+            print(line, flush=True)
+            last = line
+    try:
+        result = job.result()
+    finally:
+        shutdown()
+    # 表なら行数、一括書き出しなら書き出した行数を添える
+    count = len(result) if isinstance(result, pd.DataFrame) else result if isinstance(result, int) else None
+    rows = f"、{count:,} 行" if count is not None else ""
+    print(f"{TASKS[args.task].label}: 完了（{job.elapsed:.2f} 秒{rows}）")
+
+
+if __name__ == "__main__":
+    # ワーカーに渡す関数を utils.jobs のものとして pickle できるよう、モジュールとして読み込んで実行する
+    from utils import jobs
+
+    jobs.main()
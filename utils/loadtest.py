@@ -0,0 +1,498 @@
+"""Streamlit ページの同時実行負荷テスト。
+
+実際のページスクリプト（app.py と pages/1_dashboard.py〜5_trend.py）を
+streamlit.testing の AppTest でヘッドレスに実行し、多数のセッションが同時に
+企業・期・タブ・複数選択を切り替えたときの再実行（rerun）の所要時間を測る。
+AppTest は実行のたびにプロセス全体の Runtime を差し替えるため、同じプロセスの複数スレッドで
+同時には動かせない。セッションごとにワーカープロセスを分け、それぞれが同時に再実行する。
+計測前に親プロセスで各ページを1回表示しておけば（既定）、fork したワーカーは温まった
+データのキャッシュを引き継ぐ。
+
+シナリオ（ページ）ごとに再実行時間の p50/p95/p99、プロセスの CPU 時間と使用率、
+1プロセスあたりの最大 RSS を表示する。データは合成した大規模データ（--companies 社）か、既存のディレクトリを使う。
+
+    python -m utils.loadtest --companies 2000 --sessions 16 --steps 20
+    python -m utils.loadtest --data-dir /srv/finance/data --scenario dashboard --max-p95 800
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Sequence
+import multiprocessing
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.bridge import parse_amount
+from utils.data_loader import DATA_DIR, clear_cache, list_companies, set_backend
+from utils.jobs import running_jobs
+from utils.periods import shift_period
+from utils.storage import STATEMENT_KINDS, CsvBackend, bump_version
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 合成データの元にする企業
+TEMPLATE_CODE = "5139"
+
+# 合成データの市場と決算月
+MARKETS = ["東証プライム", "東証スタンダード", "東証グロース"]
+FISCAL_MONTHS = [12, 12, 3, 3, 6, 9]
+
+# 合成の四半期データの季節性（第1〜第4四半期の構成比の目安）
+QUARTER_WEIGHTS = np.array([0.23, 0.24, 0.25, 0.28])
+
+# 1回の再実行の上限（秒）
+RUN_TIMEOUT = 120.0
+
+
+@dataclass
+class Scenario:
+    """負荷テストの対象ページと、そのページで切り替えるタブ。"""
+
+    name: str
+    script: str
+    tabs: dict[str, list[str]] = field(default_factory=dict)
+
+
+SCENARIOS: dict[str, Scenario] = {
+    s.name: s
+    for s in [
+        Scenario("app", "app.py"),
+        Scenario("dashboard", "pages/1_dashboard.py"),
+        Scenario(
+            "pl", "pages/2_pl.py",
+            {"pl_tab": ["サンキーダイアグラム", "ウォーターフォール", "シナリオ分析", "セグメント", "データテーブル"]},
+        ),
+        Scenario("bs", "pages/3_bs.py", {"bs_tab": ["ブロック図", "2期比較", "ドリルダウン", "データテーブル"]}),
+        Scenario("cf", "pages/4_cf.py", {"cf_tab": ["サンキーダイアグラム", "ウォーターフォール", "データテーブル"]}),
+        Scenario("trend", "pages/5_trend.py", {"trend_frequency": ["年次", "四半期"]}),
+    ]
+}
+
+
+@dataclass
+class ScenarioResult:
+    """1シナリオの計測結果（時間はミリ秒。CPU 時間は全ワーカーの合計、RSS はワーカー1つの最大）。"""
+
+    name: str
+    sessions: int
+    reruns: int
+    errors: int
+    p50: float
+    p95: float
+    p99: float
+    max: float
+    throughput: float
+    cpu_seconds: float
+    cpu_percent: float
+    peak_rss_mb: float
+    error_messages: list[str] = field(default_factory=list)
+
+
+def generate_universe(out_dir: Path, companies: int, seed: int = 0) -> Path:
+    """テンプレート企業の財務諸表を元に、合成した全社データを書き出す。
+
+    企業ごとの規模（対数正規）と期ごとの変動を金額に掛ける。行単位で同じ倍率を掛けるので、
+    合計と内訳の関係は保たれる。決算月と市場は企業ごとに割り振る。
+    年次データを4四半期に分けた四半期データ（pl_q・bs_q・cf_q）も書き出す。
+
+    Args:
+        out_dir: 出力先（`<out_dir>/<code>/*.csv` の形式）。
+        companies: 企業数。
+        seed: 乱数の種。
+
+    Returns:
+        out_dir。
+    """
+    rng = np.random.default_rng(seed)
+    template_dir = DATA_DIR / TEMPLATE_CODE
+    template_info = json.loads((template_dir / "company.json").read_text(encoding="utf-8"))
+    templates = {kind: pd.read_csv(template_dir / f"{kind}.csv", dtype={"期": str}) for kind in STATEMENT_KINDS}
+    years = [int(p.split(".")[0]) for p in templates["pl"]["期"]]
+
+    for i in range(companies):
+        code = str(1000 + i)
+        month = FISCAL_MONTHS[i % len(FISCAL_MONTHS)]
+        scale = float(rng.lognormal(1.5, 1.2))
+        factors = dict(zip(years, rng.normal(1.0, 0.1, len(years)).clip(0.5, 1.5) * scale))
+        company_dir = Path(out_dir) / code
+        company_dir.mkdir(parents=True, exist_ok=True)
+
+        annual: dict[str, pd.DataFrame] = {}
+        for kind, template in templates.items():
+            df = template.copy()
+            year = df["期"].str.split(".").str[0].astype(int)
+            row_scale = year.map(factors).to_numpy()
+            df["期"] = year.astype(str) + f".{month}"
+            for col in df.columns[1:]:
+                if pd.api.types.is_numeric_dtype(df[col]):
+                    df[col] = np.rint(df[col].to_numpy(dtype=float) * row_scale).astype(np.int64)
+            if kind == "factors":
+                amounts = df["金額"].map(parse_amount)
+                df["金額"] = [f"{v:+.0f}" for v in amounts * row_scale]
+            df.to_csv(company_dir / f"{kind}.csv", index=False, encoding="utf-8")
+            annual[kind] = df
+
+        # 四半期の乱数は企業ごとに分け、年次データが四半期の有無で変わらないようにする
+        for kind, df in quarterly_statements(annual, month, np.random.default_rng([seed, i])).items():
+            df.to_csv(company_dir / f"{kind}.csv", index=False, encoding="utf-8")
+
+        info = {
+            **template_info,
+            "code": code,
+            "name": f"テスト企業{i:04d}",
+            "name_en": f"Test Company {i:04d}",
+            "name_kana": f"てすときぎょう{i:04d}",
+            "market": MARKETS[i % len(MARKETS)],
+            "fiscal_month": month,
+            "fiscal_label": f"{month}月期",
+        }
+        (company_dir / "company.json").write_text(
+            json.dumps(info, ensure_ascii=False, indent=4), encoding="utf-8"
+        )
+    bump_version(out_dir)
+    return Path(out_dir)
+
+
+def quarterly_statements(
+    annual: dict[str, pd.DataFrame], fiscal_month: int, rng: np.random.Generator
+) -> dict[str, pd.DataFrame]:
+    """年次の P/L・B/S・CF を4四半期に分けた合成の四半期データを作る。
+
+    P/L・CF の金額は季節性のある構成比で分け（累計を丸めてから差を取るので、4四半期の合計は年次と一致する）、
+    CF の期首・期末現金は四半期の現金増減で積み上げる。B/S は前期末から当期末までを直線で補間した残高にする。
+
+    Args:
+        annual: 種別 → 年次の財務諸表（期は "2024.3" の形式）。
+        fiscal_month: 決算月。
+        rng: 乱数生成器。
+
+    Returns:
+        種別（"pl_q"・"bs_q"・"cf_q"）→ 四半期の財務諸表（期は "2023.06" の形式）。
+    """
+    years = annual["pl"]["期"].str.split(".").str[0].astype(int).to_numpy()
+    ends = [shift_period(y * 100 + fiscal_month, months=-3 * (3 - q)) for y in years for q in range(4)]
+    periods = [f"{p // 100}.{p % 100:02d}" for p in ends]
+    weights = QUARTER_WEIGHTS * rng.normal(1.0, 0.05, (len(years), 4)).clip(0.8, 1.2)
+    shares = (weights / weights.sum(axis=1, keepdims=True)).cumsum(axis=1)
+
+    def split(values: np.ndarray) -> np.ndarray:
+        # (年数, 列数) → (年数 × 4, 列数)
+        cumulative = np.rint(values[:, None, :] * shares[:, :, None])
+        return np.diff(cumulative, axis=1, prepend=0).reshape(-1, values.shape[1]).astype(np.int64)
+
+    result: dict[str, pd.DataFrame] = {}
+    pl = annual["pl"]
+    result["pl_q"] = pd.DataFrame(split(pl.iloc[:, 1:].to_numpy(dtype=float)), columns=pl.columns[1:])
+
+    cf = annual["cf"]
+    flows = ["営業CF", "投資CF", "財務CF", "現金増減"]
+    cf_q = pd.DataFrame(split(cf[flows].to_numpy(dtype=float)), columns=flows)
+    change = cf_q["現金増減"].to_numpy().reshape(len(years), 4)
+    closing = cf["期首現金"].to_numpy()[:, None] + change.cumsum(axis=1)
+    cf_q["期首現金"] = (closing - change).ravel()
+    cf_q["期末現金"] = closing.ravel()
+    result["cf_q"] = cf_q[cf.columns[1:]]
+
+    bs = annual["bs"]
+    current = bs.iloc[:, 1:].to_numpy(dtype=float)
+    previous = np.vstack([current[:1], current[:-1]])
+    steps = np.arange(1, 5)[None, :, None] / 4
+    balances = previous[:, None, :] + (current - previous)[:, None, :] * steps
+    result["bs_q"] = pd.DataFrame(
+        np.rint(balances).reshape(-1, current.shape[1]).astype(np.int64), columns=bs.columns[1:]
+    )
+
+    for df in result.values():
+        df.insert(0, "期", periods)
+    return result
+
+
+def _rss_mb() -> float:
+    """現在の RSS（MB）。/proc がない環境では最大 RSS で代用する。"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (FileNotFoundError, ValueError, OSError):
+        import resource
+
+        # macOS はバイト、Linux は KB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class _RssSampler:
+    """計測中の RSS を一定間隔で記録し、最大値を求める。"""
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.peak = _rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_mb())
+
+    def __enter__(self) -> _RssSampler:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_mb())
+
+
+class _Session:
+    """1セッション分の AppTest と、再実行ごとの所要時間。"""
+
+    def __init__(self, scenario: Scenario, code: str) -> None:
+        from streamlit.testing.v1 import AppTest
+
+        self.scenario = scenario
+        self.at = AppTest.from_file(str(ROOT / scenario.script), default_timeout=RUN_TIMEOUT)
+        self.at.session_state["selected_code"] = code
+        self.latencies: list[float] = []
+        self.errors: list[str] = []
+
+    def run(self) -> None:
+        started = time.perf_counter()
+        self.at.run()
+        self.latencies.append((time.perf_counter() - started) * 1000)
+        if self.at.exception:
+            self.errors.append(self.at.exception[0].message)
+
+
+def _actions(session: _Session, codes: Sequence[str], names: Sequence[str]) -> list[Callable[[random.Random], bool]]:
+    """画面上の部品から、ランダムに選べる操作の一覧を作る（操作しなかった場合は False を返す）。"""
+    at = session.at
+
+    def switch_company(rng: random.Random) -> bool:
+        at.session_state["selected_code"] = rng.choice(codes)
+        return True
+
+    def select_option(rng: random.Random) -> bool:
+        boxes = [sb for sb in at.selectbox if len(sb.options) > 1]
+        if not boxes:
+            return False
+        box = rng.choice(boxes)
+        box.select_index(rng.randrange(len(box.options)))
+        return True
+
+    def toggle_multiselect(rng: random.Random) -> bool:
+        # 表示名と値が同じ（format_func なし）の複数選択だけを操作する
+        boxes = [ms for ms in at.multiselect if ms.options]
+        if not boxes:
+            return False
+        box = rng.choice(boxes)
+        if box.value and rng.random() < 0.5:
+            box.unselect(rng.choice(box.value))
+        else:
+            box.select(rng.choice(box.options))
+        return True
+
+    def flip_toggle(rng: random.Random) -> bool:
+        if not at.toggle:
+            return False
+        toggle = rng.choice(list(at.toggle))
+        toggle.set_value(not toggle.value)
+        return True
+
+    def switch_tab(rng: random.Random) -> bool:
+        if not session.scenario.tabs:
+            return False
+        key = rng.choice(list(session.scenario.tabs))
+        at.session_state[key] = rng.choice(session.scenario.tabs[key])
+        return True
+
+    def search(rng: random.Random) -> bool:
+        if not at.text_input:
+            return False
+        name = rng.choice(names)
+        at.text_input[0].set_value(name[: rng.randint(1, max(1, len(name)))])
+        return True
+
+    return [switch_company, select_option, toggle_multiselect, flip_toggle, switch_tab, search]
+
+
+def _drive(scenario: Scenario, codes: Sequence[str], names: Sequence[str], steps: int, seed: int) -> _Session:
+    """1セッション分の操作を行う（初回表示 + steps 回の操作）。"""
+    rng = random.Random(seed)
+    session = _Session(scenario, rng.choice(codes))
+    session.run()
+    actions = _actions(session, codes, names)
+    for _ in range(steps):
+        if session.at.exception:
+            break
+        # 部品がない操作は選び直す
+        for action in rng.sample(actions, len(actions)):
+            if action(rng):
+                break
+        session.run()
+    return session
+
+
+def _init_worker(data_dir: Path) -> None:
+    # fork できない環境ではバックエンドを引き継がないので設定し直す
+    set_backend(CsvBackend(data_dir))
+
+
+def _worker(args: tuple[Scenario, Sequence[str], Sequence[str], int, int]) -> tuple[list[float], list[str], float]:
+    """ワーカープロセスで1セッションを動かし、所要時間・エラー・最大 RSS を返す。"""
+    with _RssSampler() as rss:
+        session = _drive(*args)
+    return session.latencies, session.errors, rss.peak
+
+
+def _children_cpu() -> float:
+    """終了した子プロセスの CPU 時間（ユーザー + システム）の合計。"""
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def run_scenario(
+    scenario: Scenario,
+    sessions: int,
+    steps: int,
+    codes: Sequence[str],
+    names: Sequence[str],
+    data_dir: Path,
+    seed: int = 0,
+) -> ScenarioResult:
+    """多数のセッションを同時に動かして、1ページ分の再実行時間を計測する。
+
+    Args:
+        scenario: 対象のページ。
+        sessions: 同時に動かすセッション数（ワーカープロセス数）。
+        steps: 1セッションあたりの操作回数。
+        codes: 切り替え先の証券コード。
+        names: 検索語の元にする社名。
+        data_dir: 企業別CSVディレクトリ。
+        seed: 乱数の種（セッションごとに変える）。
+
+    Returns:
+        計測結果。
+    """
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    context = multiprocessing.get_context(method)
+    tasks = [(scenario, codes, names, steps, seed * 1000 + i) for i in range(sessions)]
+    cpu_started = _children_cpu()
+    wall_started = time.perf_counter()
+    with context.Pool(sessions, initializer=_init_worker, initargs=(data_dir,)) as pool:
+        done = pool.map(_worker, tasks, chunksize=1)
+        pool.close()
+        pool.join()
+    wall = time.perf_counter() - wall_started
+    cpu = _children_cpu() - cpu_started
+
+    latencies = np.array([t for times, _, _ in done for t in times])
+    errors = [e for _, messages, _ in done for e in messages]
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+    return ScenarioResult(
+        name=scenario.name,
+        sessions=sessions,
+        reruns=len(latencies),
+        errors=len(errors),
+        p50=float(p50),
+        p95=float(p95),
+        p99=float(p99),
+        max=float(latencies.max()) if len(latencies) else float("nan"),
+        throughput=len(latencies) / wall if wall else 0.0,
+        cpu_seconds=cpu,
+        cpu_percent=cpu / wall * 100 if wall else 0.0,
+        peak_rss_mb=max(peak for _, _, peak in done),
+        error_messages=list(dict.fromkeys(errors))[:5],
+    )
+
+
+def format_results(results: Sequence[ScenarioResult]) -> str:
+    """計測結果を表にする。"""
+    header = (
+        f"{'シナリオ':<10}{'再実行':>7}{'エラー':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'最大 ms':>9}{'回/秒':>8}{'CPU 秒':>8}{'CPU %':>7}{'RSS MB':>8}"
+    )
+    lines = [header]
+    for r in results:
+        lines.append(
+            f"{r.name:<12}{r.reruns:>8}{r.errors:>8}{r.p50:>9.0f}{r.p95:>9.0f}{r.p99:>9.0f}"
+            f"{r.max:>10.0f}{r.throughput:>9.1f}{r.cpu_seconds:>9.1f}{r.cpu_percent:>8.0f}{r.peak_rss_mb:>8.0f}"
+        )
+        for message in r.error_messages:
+            lines.append(f"    ! {message.splitlines()[0][:120]}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """負荷テストを実行して結果を表示する CLI。"""
+    parser = argparse.ArgumentParser(description="Streamlit ページの同時実行負荷テスト")
+    parser.add_argument("--data-dir", type=Path, help="企業別CSVディレクトリ（省略時は合成データを作る）")
+    parser.add_argument("--companies", type=int, default=1000, help="合成データの企業数")
+    parser.add_argument("--sessions", type=int, default=8, help="同時に動かすセッション数")
+    parser.add_argument("--steps", type=int, default=10, help="1セッションあたりの操作回数")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="対象のシナリオ（複数指定可。省略時はすべて）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cold", action="store_true",
+                        help="キャッシュが空の状態から計測する（既定では各ページを1回表示してから計測）")
+    parser.add_argument("--json", type=Path, help="結果を書き出す JSON ファイル")
+    parser.add_argument("--max-p95", type=float, help="いずれかのシナリオの p95（ms）がこれを超えたら失敗にする")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="finance-loadtest-") as tmp:
+        data_dir = args.data_dir
+        if data_dir is None:
+            started = time.perf_counter()
+            data_dir = generate_universe(Path(tmp), args.companies, args.seed)
+            print(f"{args.companies} 社の合成データを作成しました（{time.perf_counter() - started:.1f} 秒）。")
+        set_backend(CsvBackend(data_dir))
+        companies = list_companies()
+        codes = [c["code"] for c in companies]
+        # 検索語は社名の一部（記号を除く）
+        names = [re.sub(r"\W", "", c["name"]) or c["code"] for c in companies]
+
+        scenarios = [SCENARIOS[name] for name in (args.scenario or list(SCENARIOS))]
+        if not args.cold:
+            for scenario in scenarios:
+                _drive(scenario, codes, names, 0, args.seed)
+            # ページが投入した全社の集計（jobs）も終わらせておく（fork したワーカーは完了済みの結果だけを引き継ぐ）
+            for job in running_jobs():
+                job.wait()
+        else:
+            clear_cache()
+
+        results = []
+        for scenario in scenarios:
+            result = run_scenario(scenario, args.sessions, args.steps, codes, names, data_dir, args.seed)
+            results.append(result)
+            print(f"  {scenario.name}: {result.reruns} 回 p95 {result.p95:.0f} ms", flush=True)
+
+    print(format_results(results))
+    if args.json is not None:
+        args.json.write_text(json.dumps([asdict(r) for r in results], ensure_ascii=False, indent=2), encoding="utf-8")
+
+    failed = [r for r in results if r.errors or (args.max_p95 is not None and r.p95 > args.max_p95)]
+    if failed:
+        print(f"基準を満たさないシナリオ: {', '.join(r.name for r in failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # ワーカーに渡す関数を pickle できるよう、__main__ ではなく utils.loadtest として実行する
+    # （AppTest がページを実行すると sys.modules["__main__"] が差し替わるため）
+    from utils.loadtest import main as _main
+
+    _main()
@@ -0,0 +1,54 @@
+"""経営指標の計算モジュール。"""
+
+from __future__ import annotations
+
+import pandas as pd
+
+
+# calc_metrics が返す指標列（METRIC_TOOLTIPS のキーと対応）
+METRIC_COLUMNS: list[str] = [
+    "営業利益率",
+    "売上総利益率",
+    "自己資本比率",
+    "ROE",
+    "ROA",
+    "売上高成長率",
+]
+
+
+def _ratio(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    """百分率を計算する（分母が0の期は0）。"""
+    return (numerator / denominator * 100).where(denominator != 0, 0.0)
+
+
+def calc_metrics(pl: pd.DataFrame, bs: pd.DataFrame) -> pd.DataFrame:
+    """P/L と B/S から期ごとの経営指標を計算する。
+
+    load_universe で読んだ全社分の DataFrame（code 列あり）も渡せる。
+    その場合は企業ごとに成長率を計算し、結果にも code 列を残す。
+
+    Args:
+        pl: 損益計算書の DataFrame。
+        bs: 貸借対照表の DataFrame。
+
+    Returns:
+        期列と METRIC_COLUMNS の各指標（%）を持つ DataFrame。
+    """
+    keys = ["code", "期"] if "code" in pl.columns else ["期"]
+    merged = pl[keys + ["営業収益", "売上総利益", "営業利益", "当期純利益"]].merge(
+        bs[keys + ["純資産合計", "資産合計"]], on=keys, how="left"
+    )
+    revenue = merged["営業収益"]
+    if "code" in keys:
+        growth = revenue.groupby(merged["code"], observed=True).pct_change() * 100
+    else:
+        growth = revenue.pct_change() * 100
+    return pd.DataFrame({
+        **{k: merged[k] for k in keys},
+        "営業利益率": _ratio(merged["営業利益"], merged["営業収益"]),
+        "売上総利益率": _ratio(merged["売上総利益"], merged["営業収益"]),
+        "自己資本比率": _ratio(merged["純資産合計"], merged["資産合計"]),
+        "ROE": _ratio(merged["当期純利益"], merged["純資産合計"]),
+        "ROA": _ratio(merged["当期純利益"], merged["資産合計"]),
+        "売上高成長率": growth,
+    })
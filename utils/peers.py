@@ -0,0 +1,205 @@
+"""全社・同一市場の企業と比べた経営指標のパーセンタイル。
+
+指標 × 年度 × 市場ごとにソート済みの分布を事前に作っておき、
+1社分の順位は二分探索で求める。全社分の順位はまとめてベクトル演算で求める。
+
+パーセンタイルは「値より小さい企業数 + 同値の企業数の半分」を企業数で割った値（0〜100）。
+決算月の異なる企業（3月期と12月期など）は期ではなく年度（periods.fiscal_year）で比べる。
+"""
+
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import data_version, list_companies, load_shared_table, load_universe
+from utils.metrics import calc_metrics
+from utils.periods import fiscal_year
+from utils.shared_store import METRICS_TABLE
+
+
+# パーセンタイルを付ける指標
+RANKED_METRICS: list[str] = ["営業利益率", "売上総利益率", "自己資本比率", "ROE", "ROA"]
+
+# 比較対象がこれより少ない場合は分布として扱わない
+MIN_PEERS = 5
+
+# 全市場をまとめた分布のキー
+ALL_MARKETS = "全市場"
+
+# ゲージの色分け（低・中・高の3区間）と、比較対象が少ない場合の固定の目安（下限, 上限, 色）
+GAUGE_COLORS: tuple[str, str, str] = ("#FFCDD2", "#FFF9C4", "#C8E6C9")
+GAUGE_RANGES: dict[str, list[tuple[float, float, str]]] = {
+    "営業利益率": [(0, 10, "#FFCDD2"), (10, 20, "#FFF9C4"), (20, 50, "#C8E6C9")],
+    "売上総利益率": [(0, 30, "#FFCDD2"), (30, 60, "#FFF9C4"), (60, 100, "#C8E6C9")],
+    "自己資本比率": [(0, 30, "#FFCDD2"), (30, 50, "#FFF9C4"), (50, 100, "#C8E6C9")],
+    "ROE": [(0, 5, "#FFCDD2"), (5, 10, "#FFF9C4"), (10, 40, "#C8E6C9")],
+    "ROA": [(0, 3, "#FFCDD2"), (3, 5, "#FFF9C4"), (5, 30, "#C8E6C9")],
+}
+
+
+def universe_metrics() -> pd.DataFrame:
+    """全社・全期の経営指標を計算する。
+
+    Returns:
+        code, 期, 年度, market 列と METRIC_COLUMNS の各指標を持つ DataFrame。
+    """
+    # ローダープロセスが公開した計算済みの指標があれば、それを共有して使う
+    metrics = load_shared_table(METRICS_TABLE)
+    if metrics is None:
+        metrics = calc_metrics(load_universe("pl"), load_universe("bs"))
+    markets = {c["code"]: c["market"] for c in list_companies()}
+    return metrics.assign(
+        年度=fiscal_year(metrics["期"]),
+        market=metrics["code"].astype(str).map(markets).fillna("").astype("category"),
+    )
+
+
+def peer_percentiles(
+    metrics: pd.DataFrame | None = None,
+    by_market: bool = False,
+) -> pd.DataFrame:
+    """全社・全期の各指標について同じ年度の中でのパーセンタイルを求める。
+
+    スクリーニングやエクスポートでまとめて使うための一括計算。
+
+    Args:
+        metrics: universe_metrics() の結果。None なら計算する。
+        by_market: True なら同一市場内、False なら全社の中での順位。
+
+    Returns:
+        code, 期 列と RANKED_METRICS の各パーセンタイル列を持つ DataFrame。
+    """
+    if metrics is None:
+        metrics = universe_metrics()
+    keys = ["年度", "market"] if by_market else ["年度"]
+    grouped = metrics.groupby(keys, observed=True)[RANKED_METRICS]
+    # 同値は平均順位（小さい企業数 + 同値数 / 2）
+    lower = grouped.rank(method="min") - 1
+    upper = grouped.rank(method="max")
+    counts = grouped.transform("count")
+    result = (lower + upper) / 2 / counts * 100
+    return pd.concat([metrics[["code", "期"]], result], axis=1)
+
+
+class PeerDistributions:
+    """指標 × 年度 × 市場ごとのソート済み分布。"""
+
+    def __init__(self, metrics: pd.DataFrame) -> None:
+        """分布を構築する。
+
+        Args:
+            metrics: universe_metrics() の結果。
+        """
+        self._sorted: dict[tuple[str, int, str], np.ndarray] = {}
+        for market_key, frame in [(ALL_MARKETS, metrics), *metrics.groupby("market", observed=True)]:
+            for year, group in frame.groupby("年度"):
+                for metric in RANKED_METRICS:
+                    values = group[metric].to_numpy(dtype=float)
+                    self._sorted[(metric, int(year), market_key)] = np.sort(values[~np.isnan(values)])
+
+    def _values(self, metric: str, period: int, market: str | None) -> np.ndarray | None:
+        # 期コードを年度に変換して、決算月の異なる企業の分布を引く
+        year = int(fiscal_year([period])[0])
+        return self._sorted.get((metric, year, market or ALL_MARKETS))
+
+    def count(self, metric: str, period: int, market: str | None = None) -> int:
+        """比較対象の企業数を返す。
+
+        Args:
+            metric: 指標名。
+            period: 期コード。
+            market: 市場名。None なら全市場。
+
+        Returns:
+            分布に含まれる企業数。
+        """
+        values = self._values(metric, period, market)
+        return 0 if values is None else len(values)
+
+    def percentile(
+        self, metric: str, period: int, value: float, market: str | None = None
+    ) -> float | None:
+        """値が分布の中で何パーセンタイルに当たるかを返す。
+
+        Args:
+            metric: 指標名。
+            period: 期コード。
+            value: 指標の値。
+            market: 市場名。None なら全市場。
+
+        Returns:
+            0〜100 のパーセンタイル。比較対象が MIN_PEERS 未満なら None。
+        """
+        values = self._values(metric, period, market)
+        if values is None or len(values) < MIN_PEERS:
+            return None
+        lower = np.searchsorted(values, value, side="left")
+        upper = np.searchsorted(values, value, side="right")
+        return float((lower + upper) / 2 / len(values) * 100)
+
+    def quantiles(
+        self,
+        metric: str,
+        period: int,
+        qs: tuple[float, ...],
+        market: str | None = None,
+    ) -> list[float] | None:
+        """分布の分位点を返す（ゲージの色分けなどに使う）。
+
+        Args:
+            metric: 指標名。
+            period: 期コード。
+            qs: 0〜1 の分位のタプル。
+            market: 市場名。None なら全市場。
+
+        Returns:
+            各分位の値。比較対象が MIN_PEERS 未満なら None。
+        """
+        values = self._values(metric, period, market)
+        if values is None or len(values) < MIN_PEERS:
+            return None
+        return [float(v) for v in np.quantile(values, qs)]
+
+    def gauge_ranges(
+        self, metric: str, period: int, market: str | None = None
+    ) -> list[tuple[float, float, str]]:
+        """ゲージの色分けを返す（同じ年度の他社の第1・第3四分位で区切る）。
+
+        ダッシュボードと API で同じ色分けにするため、ゲージはすべてこれを使う。
+
+        Args:
+            metric: 指標名（GAUGE_RANGES のキー）。
+            period: 期コード。
+            market: 市場名。None なら全市場。
+
+        Returns:
+            (下限, 上限, 色) の3区間。比較対象が MIN_PEERS 未満なら GAUGE_RANGES の目安。
+        """
+        ranges = GAUGE_RANGES[metric]
+        quartiles = self.quantiles(metric, period, (0.25, 0.75), market)
+        if quartiles is None:
+            return ranges
+        upper = ranges[-1][1]
+        q1, q3 = (min(max(q, 0), upper) for q in quartiles)
+        return list(zip((0, q1, q3), (q1, q3, upper), GAUGE_COLORS))
+
+
+_distributions: tuple[str, PeerDistributions] | None = None
+_lock = threading.Lock()
+
+
+def get_peer_distributions() -> PeerDistributions:
+    """現在のデータ版に対応する分布を返す（データ更新時のみ再構築）。
+
+    Returns:
+        PeerDistributions。
+    """
+    global _distributions
+    version = data_version(("pl", "bs"))
+    with _lock:
+        if _distributions is None or _distributions[0] != version:
+            _distributions = (version, PeerDistributions(universe_metrics()))
+        return _distributions[1]
@@ -0,0 +1,217 @@
+"""決算期の表現と、決算月の異なる企業を比べるための年度・四半期への変換。
+
+期は「決算期末の年 × 100 + 月」の整数（期コード）で表す。2024年10月期は 202410。
+CSV には "2024.10" のように書かれているが、浮動小数として読むと 2024.1 になり
+1月期と区別できないため、読み込み時に一度だけ期コードへ変換する。
+
+3月決算と12月決算の企業は同じ期コードを持たないので、企業間で比べるときは
+年度（決算期の12か月が始まる年。2025年3月期・2024年12月期はどちらも 2024年度）や
+期末の暦四半期にそろえる。いずれも期コードの配列に対する整数演算で求める。
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+# 決算月の宣言がない企業の決算月
+DEFAULT_FISCAL_MONTH = 12
+
+# 期の書式: "2024.12"・"2024.1"（1月。数値で保存された期では10月のこともある）・"2024"（月は決算月）・"202412"。
+# 取り込み時の検査（utils.importer）も同じ書式で行う
+PERIOD_PATTERN = r"^(\d{4})(?:\.(\d{1,2})|(\d{2}))?$"
+
+
+def parse_fiscal_month(value: object) -> int:
+    """company.json の fiscal_month（数値・文字列・空）を決算月に変換する。"""
+    return int(value) if value not in (None, "") else DEFAULT_FISCAL_MONTH
+
+
+def parse_periods(
+    values: pd.Series | list,
+    fiscal_month: int | np.ndarray = DEFAULT_FISCAL_MONTH,
+    quarterly: bool = False,
+) -> np.ndarray:
+    """期の値を期コードに変換する。
+
+    文字列の月はそのまま読む（"2024.1" は1月）。浮動小数の値（数値として保存された期）で
+    月が1桁、10倍すると決算月に一致する場合だけ、末尾の0が落ちたものとみなす
+    （10月決算の 2024.1 → 202410）。四半期の期は決算月以外の月末もあるため、この補正をしない。
+    月のない値（"2024"）は決算月で補う。
+
+    Args:
+        values: CSV・SQLite から読んだ期の値（文字列または数値）。
+        fiscal_month: 決算月。全社分の DataFrame では行ごとの配列。
+        quarterly: 四半期の財務諸表の期か。
+
+    Returns:
+        int32 の期コードの配列。
+
+    Raises:
+        ValueError: 期として解釈できない値がある場合。
+    """
+    raw = pd.Series(values)
+    text = raw.astype(object).astype(str).str.strip()
+    parts = text.str.extract(PERIOD_PATTERN)
+    invalid = parts[0].isna() | ~(parts[1].isna() | parts[2].isna())
+    year = pd.to_numeric(parts[0]).to_numpy(dtype=float)
+    digits = parts[1].fillna(parts[2])
+    month = pd.to_numeric(digits).to_numpy(dtype=float)
+
+    fiscal = np.broadcast_to(np.asarray(fiscal_month, dtype=float), month.shape)
+    month = np.where(np.isnan(month), fiscal, month)
+    if not quarterly:
+        tens = month * 10
+        truncated = (digits.str.len() == 1).to_numpy() & (tens == fiscal) & _is_float(raw)
+        month = np.where(truncated, tens, month)
+
+    invalid = invalid.to_numpy() | ~((month >= 1) & (month <= 12))
+    if invalid.any():
+        examples = ", ".join(text[invalid].unique()[:5])
+        raise ValueError(f"期として解釈できない値があります: {examples}")
+    return (year * 100 + month).astype(np.int32)
+
+
+def _is_float(values: pd.Series) -> np.ndarray:
+    """各値が浮動小数か（文字列として読んだ期は末尾の0が落ちていない）。"""
+    if pd.api.types.is_float_dtype(values.dtype):
+        return np.ones(len(values), dtype=bool)
+    if values.dtype != object:
+        return np.zeros(len(values), dtype=bool)
+    return values.map(lambda v: isinstance(v, (float, np.floating))).to_numpy(dtype=bool)
+
+
+def to_period(value: object, fiscal_month: int = DEFAULT_FISCAL_MONTH) -> int:
+    """期の値1つを期コードに変換する（URL のパラメータや DataFrame の行から取り出した値など）。"""
+    # 期コード（行を取り出すと浮動小数になっていることもある）はそのまま使う
+    if isinstance(value, (int, float, np.number)) and value >= 100_000 and float(value).is_integer():
+        return int(value)
+    return int(parse_periods([value], fiscal_month)[0])
+
+
+@lru_cache(maxsize=None)
+def period_label(period: int) -> str:
+    """期コードの表示用ラベル（例: 202410 → "2024年10月期"）。一度作ったラベルは再利用する。"""
+    return f"{period // 100}年{period % 100}月期"
+
+
+def period_labels(periods: pd.Series) -> pd.Series:
+    """期の列を表示用ラベルの列に変換する。
+
+    カテゴリ型（data_loader が読み込んだ期列）ならカテゴリごとに1回だけラベルを作る。
+
+    Args:
+        periods: 期コードの Series。
+
+    Returns:
+        ラベルの Series（カテゴリ型の入力には順序付きカテゴリ型で返す）。
+    """
+    return _map_periods(periods, period_label)
+
+
+def period_text(period: int) -> str:
+    """期コードを CSV に書く形式にする（202412 → "2024.12"、202403 → "2024.03"）。
+
+    月は2桁で書く。"2024.1" は10月決算の企業では10月期と読まれるため。
+    """
+    return f"{period // 100}.{period % 100:02d}"
+
+
+def period_texts(periods: pd.Series) -> pd.Series:
+    """期の列を CSV に書く形式（period_text）の列に変換する。"""
+    return _map_periods(periods, period_text)
+
+
+def _map_periods(periods: pd.Series, func: Callable[[int], str]) -> pd.Series:
+    """期コードの列の各値に func を適用する（カテゴリ型ならカテゴリごとに1回だけ）。"""
+    if isinstance(periods.dtype, pd.CategoricalDtype):
+        values = [func(int(p)) for p in periods.cat.categories]
+        return pd.Series(
+            pd.Categorical.from_codes(periods.cat.codes, values, ordered=periods.cat.ordered),
+            index=periods.index,
+            name=periods.name,
+        )
+    return periods.map(lambda p: func(int(p)))
+
+
+def shift_period(period: int, years: int = 0, months: int = 0) -> int:
+    """期コードを年・月単位でずらす（202412 を1年後 → 202512）。"""
+    index = (period // 100) * 12 + period % 100 - 1 + years * 12 + months
+    return (index // 12) * 100 + index % 12 + 1
+
+
+def fiscal_year(periods: pd.Series | np.ndarray) -> np.ndarray:
+    """期コードを年度（12か月の期間が始まる年）に変換する。
+
+    2025年3月期（2024年4月〜2025年3月）と2024年12月期（2024年1月〜12月）はどちらも 2024 になる。
+
+    Args:
+        periods: 期コードの配列。
+
+    Returns:
+        年度の整数配列。
+    """
+    codes = np.asarray(periods, dtype=np.int64)
+    year, month = codes // 100, codes % 100
+    return (year - (month < 12)).astype(np.int32)
+
+
+def calendar_quarter(periods: pd.Series | np.ndarray) -> np.ndarray:
+    """期コードを期末の暦四半期（年 × 10 + 四半期。2024年10月期 → 20244）に変換する。
+
+    Args:
+        periods: 期コードの配列。
+
+    Returns:
+        暦四半期の整数配列。
+    """
+    codes = np.asarray(periods, dtype=np.int64)
+    year, month = codes // 100, codes % 100
+    return (year * 10 + (month + 2) // 3).astype(np.int32)
+
+
+def fiscal_year_label(year: int) -> str:
+    """年度の表示用ラベル（例: "2024年度"）。"""
+    return f"{year}年度"
+
+
+def quarter_label(quarter: int) -> str:
+    """暦四半期の表示用ラベル（例: 20244 → "2024年Q4"）。"""
+    return f"{quarter // 10}年Q{quarter % 10}"
+
+
+def fiscal_quarter(
+    periods: pd.Series | np.ndarray, fiscal_month: int = DEFAULT_FISCAL_MONTH
+) -> tuple[np.ndarray, np.ndarray]:
+    """四半期末の期コードを、属する決算期（期コード）と第何四半期かに変換する。
+
+    3月決算の 202406 は 2025年3月期の第1四半期、202503 は第4四半期になる。
+
+    Args:
+        periods: 四半期末の期コードの配列。
+        fiscal_month: 決算月。
+
+    Returns:
+        (決算期の期コード, 四半期番号 1〜4) の整数配列の組。
+    """
+    codes = np.asarray(periods, dtype=np.int64)
+    year, month = codes // 100, codes % 100
+    quarter = 4 - (fiscal_month - month) % 12 // 3
+    end_year = year + (month > fiscal_month)
+    return (end_year * 100 + fiscal_month).astype(np.int32), quarter.astype(np.int8)
+
+
+@lru_cache(maxsize=None)
+def fiscal_quarter_label(period: int, fiscal_month: int = DEFAULT_FISCAL_MONTH) -> str:
+    """四半期末の期コードの表示用ラベル（例: 3月決算の 202406 → "2025年3月期 1Q"）。"""
+    fiscal_period, quarter = fiscal_quarter([period], fiscal_month)
+    return f"{period_label(int(fiscal_period[0]))} {int(quarter[0])}Q"
+
+
+def fiscal_quarter_labels(periods: pd.Series, fiscal_month: int = DEFAULT_FISCAL_MONTH) -> list[str]:
+    """四半期末の期の列を表示用ラベルのリストに変換する。"""
+    return [fiscal_quarter_label(int(p), fiscal_month) for p in periods]
@@ -0,0 +1,239 @@
+"""四半期の財務諸表の集計（直近12か月合計・前四半期比・前年同期比・移動平均）。
+
+四半期の P/L・CF は各四半期（3か月）の金額、B/S は四半期末の残高で持つ（data_loader.load_pl_q など）。
+直近12か月（TTM）の合計や B/S の移動平均は、1社分でも全社分の縦持ちの表（code 列あり）でも、
+sliding_window_view で全期間の窓を一度に作って集計する（行ごとのループは使わない）。
+窓の中に欠けた四半期がある位置や、窓が企業をまたぐ位置の値は NaN にする。
+表は企業ごとに期の昇順に並んでいること（load_statement・load_universe の結果はそうなっている）。
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.schema import AMOUNT, SCHEMAS
+
+
+QUARTERS_PER_YEAR = 4
+
+# B/S の平均残高に使う四半期末の数（期首と各四半期末の5点。期首・期末の2点より季節変動をならせる）
+AVERAGE_POINTS = QUARTERS_PER_YEAR + 1
+
+# CF のうち残高の列（TTM では合計せず、期首は窓の最初の四半期、期末は最後の四半期の値を使う）
+_CF_OPENING = "期首現金"
+_CF_CLOSING = "期末現金"
+
+# quarterly_metrics が返す指標列
+QUARTERLY_METRIC_COLUMNS: list[str] = [
+    "営業収益(TTM)",
+    "営業利益(TTM)",
+    "当期純利益(TTM)",
+    "営業利益率(TTM)",
+    "売上高前四半期比",
+    "売上高前年同期比",
+    "営業利益前年同期比",
+    "平均純資産",
+    "平均総資産",
+    "ROE(TTM)",
+    "ROA(TTM)",
+]
+
+
+def _keys(df: pd.DataFrame) -> list[str]:
+    """結果に残すキー列（全社分の表なら code と期）。"""
+    return ["code", "期"] if "code" in df.columns else ["期"]
+
+
+def lag_valid(df: pd.DataFrame, lag: int) -> np.ndarray:
+    """各行について、lag 行前が同じ企業のちょうど lag 四半期前の行かを返す。
+
+    期が昇順に並んでいれば、lag 行前までの lag + 1 四半期が欠けずに続いているかと同じ意味になる
+    （長さ w の窓が使えるかは lag_valid(df, w - 1)）。
+
+    Args:
+        df: 期列（四半期末の期コード）を持つ表。
+        lag: 何行前と比べるか。
+
+    Returns:
+        bool の配列。
+    """
+    n = len(df)
+    if lag <= 0:
+        return np.ones(n, dtype=bool)
+    valid = np.zeros(n, dtype=bool)
+    if n > lag:
+        codes = np.asarray(df["期"], dtype=np.int64)
+        months = codes // 100 * 12 + codes % 100
+        ok = months[lag:] - months[:-lag] == 3 * lag
+        if "code" in df.columns:
+            ids = pd.factorize(df["code"])[0]
+            ok &= ids[lag:] == ids[:-lag]
+        valid[lag:] = ok
+    return valid
+
+
+def _frame(df: pd.DataFrame, columns: Sequence[str], values: np.ndarray) -> pd.DataFrame:
+    """キー列と計算結果の列からなる表を作る（期は期コードの整数にする）。"""
+    result = {k: df[k].reset_index(drop=True) for k in _keys(df)}
+    result["期"] = np.asarray(df["期"], dtype=np.int32)
+    result.update({col: values[:, i] for i, col in enumerate(columns)})
+    return pd.DataFrame(result)
+
+
+def _window(values: np.ndarray, window: int, valid: np.ndarray, reduce: str) -> np.ndarray:
+    """各行で終わる長さ window の窓を集計する（valid が偽の行は NaN）。"""
+    out = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        # 形状 (行数 - window + 1, 列数, window) のビュー。値はコピーしない
+        windows = sliding_window_view(values, window, axis=0)
+        out[window - 1:] = windows.sum(axis=-1) if reduce == "sum" else windows.mean(axis=-1)
+    out[~valid] = np.nan
+    return out
+
+
+def _shift(values: np.ndarray, lag: int, valid: np.ndarray) -> np.ndarray:
+    """lag 行前の値（valid が偽の行は NaN）。"""
+    out = np.full(values.shape, np.nan)
+    out[lag:] = values[:len(values) - lag]
+    out[~valid] = np.nan
+    return out
+
+
+def trailing_sum(df: pd.DataFrame, columns: Sequence[str], quarters: int = QUARTERS_PER_YEAR) -> pd.DataFrame:
+    """直近 quarters 四半期の合計を全行について求める。
+
+    Args:
+        df: 四半期の P/L・CF（1社分または code 列を持つ全社分）。
+        columns: 合計する列。
+        quarters: 合計する四半期数（既定は4＝直近12か月）。
+
+    Returns:
+        キー列と各列の合計を持つ表（欠けた四半期を含む窓は NaN）。
+    """
+    values = df[list(columns)].to_numpy(dtype=float)
+    return _frame(df, columns, _window(values, quarters, lag_valid(df, quarters - 1), "sum"))
+
+
+def rolling_mean(df: pd.DataFrame, columns: Sequence[str], points: int = AVERAGE_POINTS) -> pd.DataFrame:
+    """直近 points 個の四半期末の残高の平均を全行について求める。
+
+    ROE・ROA の分母などに使う（既定は期首と4つの四半期末の5点）。
+
+    Args:
+        df: 四半期末の B/S（1社分または code 列を持つ全社分）。
+        columns: 平均する列。
+        points: 平均する四半期末の数。
+
+    Returns:
+        キー列と各列の平均を持つ表（欠けた四半期を含む窓は NaN）。
+    """
+    values = df[list(columns)].to_numpy(dtype=float)
+    return _frame(df, columns, _window(values, points, lag_valid(df, points - 1), "mean"))
+
+
+def growth(df: pd.DataFrame, columns: Sequence[str], lag: int) -> pd.DataFrame:
+    """lag 四半期前からの増減率（%）を全行について求める。
+
+    lag=1 で前四半期比、lag=4 で前年同期比になる。比べる四半期がない・値が 0 の行は NaN。
+
+    Args:
+        df: 四半期の財務諸表（1社分または code 列を持つ全社分）。
+        columns: 対象の列。
+        lag: 何四半期前と比べるか。
+
+    Returns:
+        キー列と各列の増減率を持つ表。
+    """
+    values = df[list(columns)].to_numpy(dtype=float)
+    previous = _shift(values, lag, lag_valid(df, lag))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(previous != 0, (values / previous - 1) * 100, np.nan)
+    return _frame(df, columns, rate)
+
+
+def ttm(df: pd.DataFrame, kind: str) -> pd.DataFrame:
+    """四半期の P/L・CF から直近12か月（TTM）の値を求める。
+
+    金額の列は4四半期の合計にする。CF の期首現金は窓の最初の四半期の期首、期末現金は最後の四半期の期末を使う。
+
+    Args:
+        df: 四半期の P/L または CF（1社分または code 列を持つ全社分）。
+        kind: "pl" または "cf"（"pl_q"・"cf_q" も可）。
+
+    Returns:
+        キー列と年次と同じ金額列を持つ表（4四半期がそろわない行は NaN）。
+
+    Raises:
+        ValueError: B/S など合計できない種別の場合。
+    """
+    kind = kind.removesuffix("_q")
+    if kind not in ("pl", "cf"):
+        raise ValueError(f"直近12か月の合計は P/L・CF だけが対象です: {kind}")
+    columns = [c for c, role in SCHEMAS[kind].items() if role == AMOUNT and c in df.columns]
+    balances = [c for c in (_CF_OPENING, _CF_CLOSING) if kind == "cf" and c in columns]
+    flows = [c for c in columns if c not in balances]
+
+    lag = QUARTERS_PER_YEAR - 1
+    valid = lag_valid(df, lag)
+    result = trailing_sum(df, flows)
+    if _CF_OPENING in balances:
+        result[_CF_OPENING] = _shift(df[[_CF_OPENING]].to_numpy(dtype=float), lag, valid)[:, 0]
+    if _CF_CLOSING in balances:
+        result[_CF_CLOSING] = np.where(valid, df[_CF_CLOSING].to_numpy(dtype=float), np.nan)
+    return result[_keys(df) + columns]
+
+
+def _ratio(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    """百分率を計算する（分母が 0・欠損の行は NaN）。"""
+    return (numerator / denominator * 100).where(denominator != 0)
+
+
+def quarterly_metrics(pl_q: pd.DataFrame, bs_q: pd.DataFrame | None = None) -> pd.DataFrame:
+    """四半期の P/L と B/S から、四半期ごとの TTM・成長率・平均残高ベースの指標を求める。
+
+    ROE(TTM)・ROA(TTM) は直近12か月の当期純利益を直近5四半期末の平均純資産・平均総資産で割る。
+    load_universe で読んだ全社分の表（code 列あり）も渡せる。
+
+    Args:
+        pl_q: 四半期の損益計算書。
+        bs_q: 四半期末の貸借対照表。None なら平均残高・ROE・ROA は NaN。
+
+    Returns:
+        キー列と QUARTERLY_METRIC_COLUMNS の各指標を持つ DataFrame（pl_q と同じ行順）。
+    """
+    keys = _keys(pl_q)
+    totals = trailing_sum(pl_q, ["営業収益", "営業利益", "当期純利益"])
+    yoy = growth(pl_q, ["営業収益", "営業利益"], QUARTERS_PER_YEAR)
+    result = pd.DataFrame({
+        **{k: totals[k] for k in keys},
+        "営業収益(TTM)": totals["営業収益"],
+        "営業利益(TTM)": totals["営業利益"],
+        "当期純利益(TTM)": totals["当期純利益"],
+        "営業利益率(TTM)": _ratio(totals["営業利益"], totals["営業収益"]),
+        "売上高前四半期比": growth(pl_q, ["営業収益"], 1)["営業収益"],
+        "売上高前年同期比": yoy["営業収益"],
+        "営業利益前年同期比": yoy["営業利益"],
+    })
+
+    if bs_q is not None:
+        averages = rolling_mean(bs_q, ["純資産合計", "資産合計"])
+        averages = averages.rename(columns={"純資産合計": "平均純資産", "資産合計": "平均総資産"})
+        if result[keys].equals(averages[keys]):
+            # P/L と B/S の行がそろっていれば（通常はそう）結合せずにそのまま並べる
+            result["平均純資産"] = averages["平均純資産"]
+            result["平均総資産"] = averages["平均総資産"]
+        else:
+            if "code" in keys:
+                averages["code"] = averages["code"].astype(str)
+                result["code"] = result["code"].astype(str)
+            result = result.merge(averages, on=keys, how="left")
+    else:
+        result["平均純資産"] = np.nan
+        result["平均総資産"] = np.nan
+    result["ROE(TTM)"] = _ratio(result["当期純利益(TTM)"], result["平均純資産"])
+    result["ROA(TTM)"] = _ratio(result["当期純利益(TTM)"], result["平均総資産"])
+    return result[keys + QUARTERLY_METRIC_COLUMNS]
@@ -0,0 +1,155 @@
+"""営業利益のモンテカルロ・シナリオ分析。
+
+過去の P/L から売上成長率・原価率・販管費率の分布を推定し、
+翌期以降の P/L を NumPy の一括演算で多数シミュレーションする。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+
+# 過去データが少なく標準偏差が推定できない場合の下限
+MIN_GROWTH_STD = 0.05
+MIN_RATIO_STD = 0.01
+
+# 結果の要約に使う分位
+SUMMARY_QUANTILES: tuple[float, ...] = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+@dataclass(frozen=True)
+class ScenarioParams:
+    """シミュレーションの前提（いずれも正規分布の平均と標準偏差）。
+
+    成長率は対数成長率、原価率・販管費率は営業収益に対する比率。
+    """
+
+    growth_mean: float
+    growth_std: float
+    cost_ratio_mean: float
+    cost_ratio_std: float
+    sga_ratio_mean: float
+    sga_ratio_std: float
+
+    def with_overrides(self, **kwargs: float) -> ScenarioParams:
+        """一部の前提を差し替えたコピーを返す。"""
+        return replace(self, **kwargs)
+
+
+def calibrate(pl: pd.DataFrame) -> ScenarioParams:
+    """過去の P/L からシミュレーションの前提を推定する。
+
+    Args:
+        pl: 損益計算書の DataFrame（推定に使う期までに絞ったもの）。
+
+    Returns:
+        ScenarioParams。
+    """
+    revenue = pl["営業収益"].to_numpy(dtype=float)
+    valid = revenue > 0
+    log_growth = np.diff(np.log(revenue[valid])) if valid.sum() >= 2 else np.array([0.0])
+    cost_ratio = pl["売上原価"].to_numpy(dtype=float)[valid] / revenue[valid]
+    sga_ratio = pl["販管費"].to_numpy(dtype=float)[valid] / revenue[valid]
+
+    def _std(values: np.ndarray, floor: float) -> float:
+        return max(float(np.std(values, ddof=1)) if len(values) >= 2 else 0.0, floor)
+
+    return ScenarioParams(
+        growth_mean=float(np.mean(log_growth)),
+        growth_std=_std(log_growth, MIN_GROWTH_STD),
+        cost_ratio_mean=float(np.mean(cost_ratio)) if len(cost_ratio) else 0.0,
+        cost_ratio_std=_std(cost_ratio, MIN_RATIO_STD),
+        sga_ratio_mean=float(np.mean(sga_ratio)) if len(sga_ratio) else 0.0,
+        sga_ratio_std=_std(sga_ratio, MIN_RATIO_STD),
+    )
+
+
+def simulate(
+    base_revenue: float,
+    params: ScenarioParams,
+    n: int = 100_000,
+    horizon: int = 1,
+    seed: int | None = 0,
+) -> dict[str, np.ndarray]:
+    """翌期以降の P/L を一括でシミュレーションする。
+
+    Args:
+        base_revenue: 基準期の営業収益。
+        params: シミュレーションの前提。
+        n: 試行回数。
+        horizon: 何期先までシミュレーションするか。
+        seed: 乱数シード（同じ前提なら同じ結果を返すため既定で固定）。
+
+    Returns:
+        "営業収益", "売上原価", "販管費", "営業利益" をキーに、
+        形状 (n, horizon) の配列を持つ辞書。
+    """
+    rng = np.random.default_rng(seed)
+    shape = (n, horizon)
+    growth = rng.normal(params.growth_mean, params.growth_std, shape)
+    revenue = base_revenue * np.exp(np.cumsum(growth, axis=1))
+    cost_ratio = np.clip(rng.normal(params.cost_ratio_mean, params.cost_ratio_std, shape), 0.0, None)
+    sga_ratio = np.clip(rng.normal(params.sga_ratio_mean, params.sga_ratio_std, shape), 0.0, None)
+    cost = revenue * cost_ratio
+    sga = revenue * sga_ratio
+    return {
+        "営業収益": revenue,
+        "売上原価": cost,
+        "販管費": sga,
+        "営業利益": revenue - cost - sga,
+    }
+
+
+def fan_quantiles(
+    values: np.ndarray,
+    qs: tuple[float, ...] = SUMMARY_QUANTILES,
+) -> dict[float, np.ndarray]:
+    """シミュレーション結果の期ごとの分位を求める。
+
+    Args:
+        values: 形状 (n, horizon) の配列。
+        qs: 求める分位。
+
+    Returns:
+        分位 → 長さ horizon の配列。
+    """
+    bands = np.quantile(values, qs, axis=0)
+    return dict(zip(qs, bands))
+
+
+def bridge_summary(
+    base_row: pd.Series,
+    sim: dict[str, np.ndarray],
+    qs: tuple[float, ...] = SUMMARY_QUANTILES,
+) -> pd.DataFrame:
+    """基準期から翌期への営業利益ブリッジの各要素の平均と分位を求める。
+
+    平均は加法的なので、基準期の営業利益に各要素の平均を足すと翌期営業利益の平均に一致する。
+    ウォーターフォールには平均を、ばらつきの表示には分位を使う。
+
+    Args:
+        base_row: 基準期の P/L 行。
+        sim: simulate() の結果（1期先の列を使う）。
+        qs: 求める分位。
+
+    Returns:
+        行が要素（売上増減・原価増減・販管費増減・翌期営業利益）、
+        列が "平均" と各分位の DataFrame。
+    """
+    components = {
+        "売上増減": sim["営業収益"][:, 0] - base_row["営業収益"],
+        "原価増減": -(sim["売上原価"][:, 0] - base_row["売上原価"]),
+        "販管費増減": -(sim["販管費"][:, 0] - base_row["販管費"]),
+        "翌期営業利益": sim["営業利益"][:, 0],
+    }
+    stacked = np.vstack(list(components.values()))
+    summary = pd.DataFrame(
+        np.quantile(stacked, qs, axis=1).T,
+        index=list(components),
+        columns=list(qs),
+    )
+    summary.insert(0, "平均", stacked.mean(axis=1))
+    return summary
@@ -0,0 +1,113 @@
+"""財務諸表の列スキーマ定義とメモリ効率のよい型への変換。"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+# 列の役割
+PERIOD = "period"      # 期（順序付きカテゴリ型）
+AMOUNT = "amount"      # 金額（最小限の安全な数値型）
+CATEGORY = "category"  # 繰り返し出現する文字列（カテゴリ型）
+TEXT = "text"          # 自由記述（そのまま保持）
+
+_PL_AMOUNTS = [
+    "営業収益", "売上原価", "売上総利益", "販管費", "営業利益", "営業外収益", "営業外費用",
+    "経常利益", "特別利益", "特別損失", "税引前利益", "法人税等", "当期純利益",
+]
+_BS_AMOUNTS = [
+    "現金及び預金", "売掛金", "その他流動資産", "流動資産合計", "有形固定資産", "無形固定資産",
+    "投資その他", "固定資産合計", "資産合計", "買掛金", "短期借入金", "その他流動負債",
+    "流動負債合計", "長期借入金", "その他固定負債", "固定負債合計", "負債合計", "資本金",
+    "資本剰余金", "利益剰余金", "その他", "純資産合計",
+]
+_CF_AMOUNTS = ["営業CF", "投資CF", "財務CF", "現金増減", "期首現金", "期末現金"]
+
+# 財務諸表ごとの列スキーマ（列名 → 役割）。CSV の列順と一致させる
+SCHEMAS: dict[str, dict[str, str]] = {
+    "pl": {"期": PERIOD, **{c: AMOUNT for c in _PL_AMOUNTS}},
+    "bs": {"期": PERIOD, **{c: AMOUNT for c in _BS_AMOUNTS}},
+    "cf": {"期": PERIOD, **{c: AMOUNT for c in _CF_AMOUNTS}},
+    "segment": {"期": PERIOD, "セグメント": CATEGORY, "売上": AMOUNT, "営業利益": AMOUNT},
+    # 金額は "+562" / "−177" のような符号付き文字列で入っているため TEXT 扱い
+    "factors": {"期": PERIOD, "項目": CATEGORY, "要因": CATEGORY, "金額": TEXT, "説明": TEXT},
+}
+
+# 四半期の財務諸表（P/L・CF は各四半期3か月分の金額、B/S は四半期末の残高）。列構成は年次と同じ
+SCHEMAS.update({f"{kind}_q": SCHEMAS[kind] for kind in ("pl", "bs", "cf")})
+
+_INT32 = np.iinfo(np.int32)
+
+
+def compact_amount(s: pd.Series) -> pd.Series:
+    """金額列を値を失わない範囲で小さい数値型に変換する。
+
+    整数値は int32（範囲外なら int64）にする。int8/int16 まで落とすと
+    項目同士の加減算で桁あふれするため、int32 を下限としている。
+    小数を含む列は float32 で全値が元の値に戻る場合のみ float32 にする。
+
+    Args:
+        s: 金額列。
+
+    Returns:
+        変換後の Series。
+    """
+    if not pd.api.types.is_numeric_dtype(s):
+        s = pd.to_numeric(s)
+    if s.isna().any():
+        return s
+    values = s.to_numpy()
+    if pd.api.types.is_float_dtype(s):
+        if np.array_equal(values, np.round(values)):
+            values = values.astype(np.int64)
+        else:
+            narrowed = values.astype(np.float32)
+            if np.array_equal(narrowed.astype(values.dtype), values):
+                return pd.Series(narrowed, index=s.index, name=s.name)
+            return s
+    if len(values) == 0 or (values.min() >= _INT32.min and values.max() <= _INT32.max):
+        return pd.Series(values.astype(np.int32), index=s.index, name=s.name)
+    return pd.Series(values.astype(np.int64), index=s.index, name=s.name)
+
+
+def compact_period(s: pd.Series) -> pd.Series:
+    """期列を昇順の順序付きカテゴリ型に変換する。
+
+    値そのもの（期コード。例: 202412）は変わらないため、比較はそのまま使える。
+
+    Args:
+        s: 期列。
+
+    Returns:
+        カテゴリ型の Series。
+    """
+    categories = sorted(s.dropna().unique())
+    return s.astype(pd.CategoricalDtype(categories, ordered=True))
+
+
+def apply_schema(df: pd.DataFrame, kind: str) -> pd.DataFrame:
+    """スキーマに従って列の型を変換する。
+
+    スキーマにない列は変更しない。
+
+    Args:
+        df: 読み込んだままの DataFrame。
+        kind: 財務諸表種別（SCHEMAS のキー）。
+
+    Returns:
+        型を変換した新しい DataFrame。
+    """
+    schema = SCHEMAS[kind]
+    converted: dict[str, pd.Series] = {}
+    for col in df.columns:
+        role = schema.get(col)
+        if role == PERIOD:
+            converted[col] = compact_period(df[col])
+        elif role == AMOUNT:
+            converted[col] = compact_amount(df[col])
+        elif role == CATEGORY:
+            converted[col] = df[col].astype("category")
+        else:
+            converted[col] = df[col]
+    return pd.DataFrame(converted, index=df.index)
@@ -0,0 +1,230 @@
+"""企業検索インデックス。
+
+企業一覧（data_loader.list_companies のメタデータ）から、証券コード・社名・英語名・読みの
+前方一致用のソート済みキーと、部分一致用の文字 n-gram の転置インデックスを作っておく。
+検索はキーの二分探索と転置リストの積集合だけで行い、全社を走査しない。
+
+表記ゆれを吸収するため、キーと検索語はどちらも正規化する
+（全角英数→半角、大文字→小文字、カタカナ→ひらがな、空白・記号の除去）。
+"""
+
+from __future__ import annotations
+
+import bisect
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from utils.data_loader import list_companies
+
+
+# 検索対象の項目と重み（大きいほど上位に並ぶ）
+FIELD_WEIGHTS: dict[str, int] = {
+    "code": 5,
+    "name": 4,
+    "name_kana": 3,
+    "name_en": 3,
+}
+
+# 英語名の2語目以降の単語の先頭からの一致（"work" で "Open Work Inc." に一致）
+WORD_WEIGHT = 2
+
+# 前方一致・完全一致・部分一致のスコア
+PREFIX_SCORE = 100
+EXACT_BONUS = 50
+SUBSTRING_SCORE = 10
+
+# n-gram の長さ
+GRAM = 2
+
+# 順位を1つの整数にまとめるときの桁（スコア・キー長・企業番号の順に比較）
+_LENGTH_BITS = 10
+_INDEX_BITS = 24
+
+_KATAKANA_TO_HIRAGANA = {c: c - 0x60 for c in range(ord("ァ"), ord("ヶ") + 1)}
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """検索用に文字列を正規化する。
+
+    Args:
+        text: 社名や検索語。
+
+    Returns:
+        NFKC 正規化・小文字化・ひらがな化し、空白と記号を除いた文字列。
+    """
+    text = unicodedata.normalize("NFKC", text).casefold().translate(_KATAKANA_TO_HIRAGANA)
+    return _SEPARATORS.sub("", text)
+
+
+def _rank(score: int, length: int, index: int) -> int:
+    """(スコア降順, キー長昇順, 企業番号昇順) の順位を大小比較できる整数にする。"""
+    length = min(length, (1 << _LENGTH_BITS) - 1)
+    return ((score << _LENGTH_BITS | ((1 << _LENGTH_BITS) - 1 - length)) << _INDEX_BITS) | (
+        (1 << _INDEX_BITS) - 1 - index
+    )
+
+
+def _grams(text: str, n: int) -> set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class CompanyIndex:
+    """証券コード・社名・英語名・読みによる企業検索インデックス。"""
+
+    def __init__(self, companies: list[dict[str, str]]) -> None:
+        """インデックスを構築する。
+
+        Args:
+            companies: list_companies() の結果。
+        """
+        self.codes: list[str] = [c["code"] for c in companies]
+        self._labels = {c["code"]: f"{c['code']} {c['name']}" for c in companies}
+
+        # 部分一致用: 企業ごと・項目ごとの (正規化キー, 重み, 企業番号)
+        fields: list[tuple[str, int, int]] = []
+        # 前方一致用: 上記に英語名の2語目以降を加えたもの
+        prefixes: list[tuple[str, int, int]] = []
+        for i, company in enumerate(companies):
+            for field, weight in FIELD_WEIGHTS.items():
+                key = normalize(str(company.get(field) or ""))
+                if key:
+                    fields.append((key, weight, i))
+            words = unicodedata.normalize("NFKC", str(company.get("name_en") or "")).casefold().split()
+            for word in words[1:]:
+                key = normalize(word)
+                if key:
+                    prefixes.append((key, WORD_WEIGHT, i))
+        prefixes.extend(fields)
+
+        # 部分一致: 1文字・n文字 → その文字列を含む項目番号のソート済み配列
+        unigrams: dict[str, set[int]] = {}
+        grams: dict[str, set[int]] = {}
+        for e, (key, _, _) in enumerate(fields):
+            for ch in key:
+                unigrams.setdefault(ch, set()).add(e)
+            for gram in _grams(key, GRAM):
+                grams.setdefault(gram, set()).add(e)
+        self._unigrams = {ch: np.array(sorted(ids), dtype=np.int64) for ch, ids in unigrams.items()}
+        self._grams = {g: np.array(sorted(ids), dtype=np.int64) for g, ids in grams.items()}
+        self._field_keys = [key for key, _, _ in fields]
+        self._field_company = np.array([i for _, _, i in fields], dtype=np.int64)
+        self._field_rank = np.array(
+            [_rank(SUBSTRING_SCORE * weight, len(key), i) for key, weight, i in fields], dtype=np.int64
+        )
+
+        # 前方一致: キーの昇順に並べ、検索語で始まる範囲を二分探索で求める
+        prefixes.sort()
+        self._prefix_keys = [key for key, _, _ in prefixes]
+        self._prefix_company = np.array([i for _, _, i in prefixes], dtype=np.int64)
+        self._prefix_rank = np.array(
+            [_rank(PREFIX_SCORE + 10 * weight, len(key), i) for key, weight, i in prefixes],
+            dtype=np.int64,
+        )
+        counts = np.bincount(self._prefix_company) if prefixes else np.ones(1, dtype=np.int64)
+        self._max_entries = int(counts.max())
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def label(self, code: str) -> str:
+        """表示用のラベル（"コード 社名"）を返す。"""
+        return self._labels.get(code, code)
+
+    def _substring_candidates(self, query: str) -> np.ndarray:
+        """検索語の n-gram をすべて含む項目番号（実際に検索語を含むとは限らない）を返す。"""
+        empty = np.empty(0, dtype=np.int64)
+        if len(query) < GRAM:
+            return self._unigrams.get(query, empty)
+        postings = [self._grams.get(g) for g in _grams(query, GRAM)]
+        if any(p is None for p in postings):
+            return empty
+        postings.sort(key=len)
+        result = postings[0]
+        for p in postings[1:]:
+            result = np.intersect1d(result, p, assume_unique=True)
+        return result
+
+    @staticmethod
+    def _take_best(ranks: np.ndarray, companies: np.ndarray, count: int) -> np.ndarray:
+        """順位の高い順に並べた上位 count 件の企業番号を返す（全件は並べない）。"""
+        if count < len(ranks):
+            top = np.argpartition(-ranks, count - 1)[:count]
+        else:
+            top = np.arange(len(ranks))
+        return companies[top[np.argsort(-ranks[top])]]
+
+    def search(self, query: str, limit: int = 10) -> list[str]:
+        """検索語に一致する企業を関連度順に返す。
+
+        前方一致（完全一致はさらに上位）を部分一致より優先し、
+        同じ種類の一致では項目の重みが大きい順、一致した項目の短い順、コード順に並べる。
+        順位は検索語によらず決まるので事前に整数化しておき、該当範囲から上位だけを部分選択する。
+
+        Args:
+            query: 検索語（コード・社名・英語名・読みのいずれか）。
+            limit: 返す最大件数。
+
+        Returns:
+            証券コードのリスト。
+        """
+        q = normalize(query)
+        if not q:
+            return []
+
+        found: list[int] = []
+        seen: set[int] = set()
+
+        # 前方一致（同じ企業が複数の項目で一致しうるので、件数 × 項目数だけ取り出して重複を除く）
+        start = bisect.bisect_left(self._prefix_keys, q)
+        stop = bisect.bisect_left(self._prefix_keys, q + "\U0010ffff", lo=start)
+        ranks = self._prefix_rank[start:stop]
+        exact = bisect.bisect_right(self._prefix_keys, q, lo=start, hi=stop) - start
+        if exact:
+            ranks = ranks.copy()
+            ranks[:exact] += EXACT_BONUS << (_LENGTH_BITS + _INDEX_BITS)
+        companies = self._take_best(ranks, self._prefix_company[start:stop], limit * self._max_entries)
+        for i in companies.tolist():
+            if i not in seen:
+                seen.add(i)
+                found.append(i)
+                if len(found) == limit:
+                    return [self.codes[i] for i in found]
+
+        # 部分一致は前方一致より必ず下位なので、前方一致で件数が足りないときだけ探す。
+        # 順位の高い項目から確認し、件数がそろった時点で打ち切る
+        candidates = self._substring_candidates(q)
+        ranks = self._field_rank[candidates]
+        order = np.argsort(-ranks)
+        for e, i in zip(candidates[order].tolist(), self._field_company[candidates][order].tolist()):
+            if i in seen:
+                continue
+            # n-gram の積集合は候補なので、実際に含むかを確認する
+            if q in self._field_keys[e]:
+                seen.add(i)
+                found.append(i)
+                if len(found) == limit:
+                    break
+        return [self.codes[i] for i in found]
+
+
+_index: tuple[list[dict[str, str]], CompanyIndex] | None = None
+_lock = threading.Lock()
+
+
+def get_company_index() -> CompanyIndex:
+    """現在の企業一覧に対応する検索インデックスを返す（企業一覧の更新時のみ再構築）。
+
+    Returns:
+        CompanyIndex。
+    """
+    global _index
+    companies = list_companies()
+    with _lock:
+        # list_companies はメタデータが変わらない限り同じリストを返す
+        if _index is None or _index[0] is not companies:
+            _index = (companies, CompanyIndex(companies))
+        return _index[1]
@@ -0,0 +1,121 @@
+"""Streamlit セッション単位の計算結果キャッシュと表示設定。
+
+起動時のウォームアップ（warmup モジュール）が prebuild で作った結果は全セッション共通で持ち、
+セッションのキャッシュにない場合に使う。
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Sequence
+from typing import TypeVar
+
+import pandas as pd
+import streamlit as st
+
+from utils.units import CANONICAL_UNIT, DISPLAY_UNITS
+
+
+T = TypeVar("T")
+
+# 1セッションで保持する結果の上限（古いものから破棄）
+MAX_ENTRIES = 64
+
+_STATE_KEY = "_session_memo"
+
+# 事前に作った結果の上限（全セッション共通。古いものから破棄）
+MAX_PREBUILT = 1024
+
+_prebuilt: OrderedDict[Hashable, tuple[Sequence[pd.DataFrame], object]] = OrderedDict()
+_prebuilt_lock = threading.Lock()
+
+
+def display_unit() -> str:
+    """セッションで選択中の表示単位を返す（未選択なら共通単位）。"""
+    unit = st.session_state.get("display_unit", CANONICAL_UNIT)
+    return unit if unit in DISPLAY_UNITS else CANONICAL_UNIT
+
+
+def _memo_key(name: str, frames: Sequence[pd.DataFrame], params: Hashable) -> Hashable:
+    return (name, tuple(id(f) for f in frames), params)
+
+
+def session_memo(
+    name: str,
+    frames: Sequence[pd.DataFrame],
+    params: Hashable,
+    build: Callable[[], T],
+) -> T:
+    """セッション内で同じ入力に対する計算結果を再利用する。
+
+    タブを切り替えて戻ったときに図や表を作り直さないために使う。
+    入力の DataFrame はオブジェクトの同一性で判定する（data_loader が読み直すと
+    別オブジェクトになるため、データ更新後は自動的に作り直される）。
+    キャッシュは入力の DataFrame への参照も保持するので、id が再利用されることはない。
+    セッションで初めての入力でも、prebuild 済みならその結果を使う。
+
+    Args:
+        name: 計算の種類（例: "pl_sankey"）。
+        frames: 計算の入力となる DataFrame。
+        params: DataFrame 以外の入力（選択期など）。
+        build: 結果を生成する関数。
+
+    Returns:
+        キャッシュ済み、または新たに生成した結果。
+    """
+    cache: OrderedDict[Hashable, tuple[Sequence[pd.DataFrame], object]] | None = (
+        st.session_state.get(_STATE_KEY)
+    )
+    if cache is None:
+        cache = OrderedDict()
+        st.session_state[_STATE_KEY] = cache
+
+    key = _memo_key(name, frames, params)
+    hit = cache.get(key)
+    if hit is not None:
+        cache.move_to_end(key)
+        return hit[1]  # type: ignore[return-value]
+
+    with _prebuilt_lock:
+        shared = _prebuilt.get(key)
+    value = shared[1] if shared is not None else build()
+    cache[key] = (tuple(frames), value)
+    while len(cache) > MAX_ENTRIES:
+        cache.popitem(last=False)
+    return value
+
+
+def prebuild(
+    name: str,
+    frames: Sequence[pd.DataFrame],
+    params: Hashable,
+    build: Callable[[], T],
+) -> T:
+    """全セッション共通の結果を事前に作っておく（起動時のウォームアップ用）。
+
+    引数は session_memo と同じ。ページと同じ name・frames・params で呼ぶと、
+    そのページを初めて開いたセッションでも作り直さずに済む。
+    結果は複数のセッションで共有されるため、呼び出し側で変更しないものに限る（図など）。
+
+    Args:
+        name: 計算の種類（session_memo と同じ名前）。
+        frames: 計算の入力となる DataFrame。
+        params: DataFrame 以外の入力。
+        build: 結果を生成する関数。
+
+    Returns:
+        作成済み、または新たに生成した結果。
+    """
+    key = _memo_key(name, frames, params)
+    with _prebuilt_lock:
+        hit = _prebuilt.get(key)
+    if hit is not None:
+        return hit[1]  # type: ignore[return-value]
+
+    value = build()
+    with _prebuilt_lock:
+        _prebuilt[key] = (tuple(frames), value)
+        while len(_prebuilt) > MAX_PREBUILT:
+            _prebuilt.popitem(last=False)
+    return value
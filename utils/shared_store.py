@@ -0,0 +1,326 @@
+"""複数の Streamlit サーバープロセスで共有する、読み取り専用の財務データのスナップショット。
+
+1つのローダープロセス（publish）が全社分の財務諸表と経営指標を読み込んで変換し、
+列ごとの .npy ファイルとして公開ディレクトリに書き出す。各サーバープロセスは環境変数
+FINANCE_SHARED に公開ディレクトリを指定すると、data_loader の load_* がそのファイルを
+メモリマップ（np.load(mmap_mode="r")）して DataFrame を組み立てる。
+数値列とカテゴリ列のコードはコピーせずページキャッシュ上の同じ物理メモリを指すため、
+サーバープロセスを増やしても財務データの分のメモリは増えない（文字列の列だけは各プロセスで読む）。
+
+公開ディレクトリの構成:
+
+    CURRENT                  現在の版のディレクトリ名
+    <版>/manifest.json       表・列の定義、企業ごとの行範囲、企業一覧と企業基本情報
+    <版>/<表>.<列番号>.npy   列の値（カテゴリ列はコード）
+
+新しい版は別ディレクトリに書き出してから CURRENT を置き換えるので、読み手が書きかけの版を
+見ることはない。古い版は KEEP_VERSIONS 世代を残して削除する（削除後もマップ済みの
+プロセスは読み続けられる）。
+
+ローダープロセスの起動例（データが更新されるたびに新しい版を公開する）:
+
+    python -m utils.shared_store /dev/shm/finance --interval 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+
+# 現在の版を指すファイル
+CURRENT = "CURRENT"
+
+# 残す版の数（切り替え直後も前の版を読んでいるプロセスがあるため）
+KEEP_VERSIONS = 2
+
+# 経営指標の表の名前（財務諸表は STATEMENT_KINDS の名前で公開する）
+METRICS_TABLE = "metrics"
+
+
+def _json_value(value: Any) -> Any:
+    """numpy のスカラーを JSON に書ける値にする。"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _company_offsets(df: pd.DataFrame) -> dict[str, list[int]]:
+    """code 列でまとまっている表の、企業ごとの行範囲 [開始, 終了) を求める。"""
+    codes = df["code"].astype(str).to_numpy()
+    if len(codes) == 0:
+        return {}
+    bounds = [0, *(np.flatnonzero(codes[1:] != codes[:-1]) + 1).tolist(), len(codes)]
+    return {codes[start]: [start, stop] for start, stop in zip(bounds[:-1], bounds[1:])}
+
+
+def write_snapshot(
+    root: Path,
+    tables: dict[str, pd.DataFrame],
+    companies: list[dict[str, str]],
+    infos: dict[str, dict[str, Any]],
+) -> str:
+    """表を新しい版として書き出し、現在の版に切り替える。
+
+    Args:
+        root: 公開ディレクトリ。
+        tables: 表の名前 → DataFrame。code 列を持つ表は企業ごとに切り出せるようにする。
+        companies: 企業一覧（list_companies の結果）。
+        infos: 証券コード → 企業基本情報。
+
+    Returns:
+        公開した版の名前。
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    version = f"v{time.time_ns()}"
+    tmp = root / f".{version}.tmp"
+    tmp.mkdir()
+
+    manifest: dict[str, Any] = {"version": version, "tables": {}, "companies": companies, "infos": infos}
+    for name, df in tables.items():
+        if "code" in df.columns:
+            # 企業ごとの行が連続するように並べる（企業内の行の順は保つ）
+            df = df.sort_values("code", kind="stable").reset_index(drop=True)
+        columns = []
+        for i, col in enumerate(df.columns):
+            s = df[col]
+            entry: dict[str, Any] = {"name": col}
+            path = tmp / f"{name}.{i}.npy"
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                entry["kind"] = "category"
+                entry["categories"] = [_json_value(c) for c in s.cat.categories]
+                entry["categories_dtype"] = str(s.cat.categories.dtype)
+                entry["ordered"] = bool(s.cat.ordered)
+                np.save(path, s.array.codes)
+            elif pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+                entry["kind"] = "array"
+                np.save(path, s.to_numpy())
+            else:
+                # 文字列などはマップできないので値のまま持つ（少量の説明文など）
+                entry["kind"] = "object"
+                entry["dtype"] = str(s.dtype)
+                entry["values"] = [None if pd.isna(v) else _json_value(v) for v in s.tolist()]
+            columns.append(entry)
+        manifest["tables"][name] = {
+            "rows": len(df),
+            "columns": columns,
+            "offsets": _company_offsets(df) if "code" in df.columns else {},
+        }
+    (tmp / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+
+    tmp.rename(root / version)
+    pointer = root / f".{CURRENT}.tmp"
+    pointer.write_text(version, encoding="utf-8")
+    pointer.replace(root / CURRENT)
+
+    versions = sorted(p for p in root.iterdir() if p.is_dir() and p.name.startswith("v"))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(old, ignore_errors=True)
+    return version
+
+
+class Snapshot:
+    """公開された1つの版。表は初回参照時にメモリマップして組み立てる。"""
+
+    def __init__(self, directory: Path) -> None:
+        """版のディレクトリを開く。
+
+        Args:
+            directory: 版のディレクトリ（manifest.json を含む）。
+        """
+        self.directory = Path(directory)
+        manifest = json.loads((self.directory / "manifest.json").read_text(encoding="utf-8"))
+        self.version: str = manifest["version"]
+        self.companies: list[dict[str, str]] = manifest["companies"]
+        self._infos: dict[str, dict[str, Any]] = manifest["infos"]
+        self._tables: dict[str, dict[str, Any]] = manifest["tables"]
+        self._frames: dict[str, pd.DataFrame] = {}
+        self._slices: dict[tuple[str, str], pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    def has_table(self, name: str) -> bool:
+        """表が公開されているかを返す。"""
+        return name in self._tables
+
+    def has_statement(self, code: str, name: str) -> bool:
+        """企業の行が表にあるかを返す（四半期の財務諸表は一部の企業にしかない）。"""
+        spec = self._tables.get(name)
+        return spec is not None and code in spec["offsets"]
+
+    def info(self, code: str) -> dict[str, Any]:
+        """企業基本情報を返す。
+
+        Raises:
+            KeyError: 企業がスナップショットにない場合。
+        """
+        try:
+            return self._infos[code]
+        except KeyError:
+            raise KeyError(f"企業データがありません: {code}") from None
+
+    def table(self, name: str) -> pd.DataFrame:
+        """表全体を返す（数値列・カテゴリ列はファイルをマップしたまま、コピーしない）。
+
+        返す DataFrame はプロセス内で共有しているため、破壊的に変更しないこと。
+
+        Args:
+            name: 表の名前。
+
+        Returns:
+            公開時と同じ列・型の DataFrame。
+        """
+        with self._lock:
+            df = self._frames.get(name)
+            if df is None:
+                df = self._frames[name] = self._attach(name)
+            return df
+
+    def _attach(self, name: str) -> pd.DataFrame:
+        spec = self._tables[name]
+        columns: dict[str, Any] = {}
+        for i, entry in enumerate(spec["columns"]):
+            if entry["kind"] == "object":
+                columns[entry["name"]] = pd.Series(entry["values"], dtype=entry["dtype"])
+                continue
+            # memmap のサブクラスのままだと演算結果も memmap になるため、同じメモリの ndarray として扱う
+            values = np.load(self.directory / f"{name}.{i}.npy", mmap_mode="r").view(np.ndarray)
+            if entry["kind"] == "category":
+                values = pd.Series(
+                    pd.Categorical.from_codes(
+                        values,
+                        pd.Index(entry["categories"], dtype=entry["categories_dtype"]),
+                        ordered=entry["ordered"],
+                        validate=False,
+                    ),
+                    copy=False,
+                )
+            columns[entry["name"]] = values
+        return pd.DataFrame(columns, copy=False)
+
+    def statement(self, code: str, name: str) -> pd.DataFrame:
+        """1社分の行を切り出して返す（code 列を除き、使われないカテゴリを落とす）。
+
+        Args:
+            code: 証券コード。
+            name: 表の名前（財務諸表種別）。
+
+        Returns:
+            load_statement と同じ形の DataFrame。
+
+        Raises:
+            FileNotFoundError: 企業のデータがスナップショットにない場合。
+        """
+        key = (code, name)
+        cached = self._slices.get(key)
+        if cached is not None:
+            return cached
+        spec = self._tables.get(name)
+        bounds = spec["offsets"].get(code) if spec is not None else None
+        if bounds is None:
+            raise FileNotFoundError(f"企業データがありません: {code} ({name})")
+        df = self.table(name).iloc[bounds[0]:bounds[1]].drop(columns="code").reset_index(drop=True)
+        # 他社の期・セグメントがカテゴリに残らないようにする（コードの小さな配列だけを作り直す）
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].cat.remove_unused_categories()
+        self._slices[key] = df
+        return df
+
+
+class SharedStore:
+    """公開ディレクトリの現在の版を追いかける読み手。"""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self._stamp: tuple[int, int] | None = None
+        self._snapshot: Snapshot | None = None
+        self._lock = threading.Lock()
+
+    def current(self) -> Snapshot | None:
+        """現在の版を返す（CURRENT が置き換わったときだけ開き直す）。
+
+        Returns:
+            Snapshot。まだ公開されていなければ None。
+        """
+        try:
+            st = (self.root / CURRENT).stat()
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if stamp != self._stamp:
+                version = (self.root / CURRENT).read_text(encoding="utf-8").strip()
+                self._snapshot = Snapshot(self.root / version)
+                self._stamp = stamp
+            return self._snapshot
+
+
+def publish(root: Path) -> str:
+    """現在のバックエンドの全データを変換して公開する。
+
+    Args:
+        root: 公開ディレクトリ。
+
+    Returns:
+        公開した版の名前。
+    """
+    from utils import data_loader
+    from utils.metrics import calc_metrics
+    from utils.storage import QUARTERLY_KINDS, STATEMENT_KINDS
+
+    tables = {kind: data_loader.load_universe(kind) for kind in STATEMENT_KINDS}
+    # 四半期の財務諸表は、持つ企業があるものだけ公開する
+    for kind in QUARTERLY_KINDS:
+        df = data_loader.load_universe(kind)
+        if len(df):
+            tables[kind] = df
+    tables[METRICS_TABLE] = calc_metrics(tables["pl"], tables["bs"])
+    companies = data_loader.list_companies()
+    infos = {c["code"]: data_loader.load_company_info(c["code"]) for c in companies}
+    return write_snapshot(root, tables, companies, infos)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """財務データを共有スナップショットとして公開するローダープロセスの CLI。"""
+    from utils import data_loader
+    from utils.storage import CsvBackend, SqliteBackend
+
+    parser = argparse.ArgumentParser(description="財務データを共有スナップショットとして公開する")
+    parser.add_argument("root", type=Path, help="公開ディレクトリ（/dev/shm 以下など）")
+    parser.add_argument("--data-dir", type=Path, help="企業別CSVディレクトリ（既定: data/）")
+    parser.add_argument("--db", type=Path, help="SQLite データベース（--data-dir より優先）")
+    parser.add_argument(
+        "--interval", type=float, default=0,
+        help="データの更新を確認する間隔（秒）。0 なら1回公開して終了する",
+    )
+    args = parser.parse_args(argv)
+    # 公開元は常に実データ（FINANCE_SHARED が設定されていても自分の公開物は読まない）
+    if args.db is not None:
+        data_loader.set_backend(SqliteBackend(args.db))
+    elif args.data_dir is not None:
+        data_loader.set_backend(CsvBackend(args.data_dir))
+    else:
+        data_loader.set_backend(data_loader.get_backend())
+
+    published = None
+    while True:
+        version = data_loader.data_version()
+        if version != published:
+            started = time.perf_counter()
+            name = publish(args.root)
+            published = version
+            print(f"{args.root / name} を公開しました（{time.perf_counter() - started:.1f} 秒）。", flush=True)
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
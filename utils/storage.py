@@ -0,0 +1,525 @@
+"""財務データのストレージバックエンド。
+
+`utils.data_loader` の `load_*` 関数はすべてここで定義するバックエンドを経由する。
+企業ごとのディレクトリに CSV を置く従来形式 (`CsvBackend`) と、
+1ファイルにまとめたインデックス付き SQLite 形式 (`SqliteBackend`) を提供する。
+
+SQLite データベースは CSV ディレクトリから生成できる::
+
+    python -m utils.storage data/finance.db --data-dir data
+
+CSV ディレクトリを書き換える処理（utils.importer など）は、書き換えたら bump_version で
+直下の VERSION を更新する。全社分の更新検知（universe_stamp・metadata_stamp）はこのファイルだけを読む。
+VERSION がないディレクトリ（手で置いたデータ）では企業ごとのファイルを走査し、
+結果を SCAN_TTL 秒のあいだ使い回す。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import Hashable, Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+
+# 財務諸表の種類（CSVファイル名・SQLiteテーブル名を兼ねる）
+STATEMENT_KINDS: tuple[str, ...] = ("pl", "bs", "cf", "segment", "factors")
+
+# 四半期の財務諸表の種類（列構成は末尾の "_q" を除いた年次の種類と同じ）。
+# 任意のデータで、ない企業もある（has_statement で確かめる）
+QUARTERLY_KINDS: tuple[str, ...] = ("pl_q", "bs_q", "cf_q")
+
+# 企業一覧で返すメタデータ項目（name_kana は社名の読み、currency は金額の単位、
+# fiscal_month は決算月。company.json に無ければ空文字）
+COMPANY_FIELDS: tuple[str, ...] = (
+    "code", "name", "name_en", "name_kana", "market", "currency", "fiscal_month"
+)
+
+
+# CSV ディレクトリの版のファイル（書き換えるたびに bump_version で更新する）
+VERSION_FILE = "VERSION"
+
+# VERSION がない CSV ディレクトリで、ファイルの走査結果を使い回す秒数
+SCAN_TTL = 2.0
+
+
+def bump_version(data_dir: Path) -> None:
+    """CSV ディレクトリのデータを書き換えたことを記録する（VERSION を新しい値で置き換える）。
+
+    Args:
+        data_dir: 企業別 CSV ディレクトリ。
+    """
+    path = Path(data_dir) / VERSION_FILE
+    tmp = path.with_name(f".{VERSION_FILE}.{os.getpid()}.tmp")
+    tmp.write_text(uuid.uuid4().hex, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _file_stamp(path: Path) -> Hashable:
+    # 変更時刻は cp -p・rsync -t で古い値に戻せるため、書き込みで必ず進む ctime も含める
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_ctime_ns, st.st_size)
+
+
+def _check_kind(kind: str) -> None:
+    if kind not in STATEMENT_KINDS and kind not in QUARTERLY_KINDS:
+        raise ValueError(f"未知の財務諸表種別です: {kind}")
+
+
+class StorageBackend(ABC):
+    """財務データの保存先を抽象化する基底クラス。"""
+
+    @abstractmethod
+    def list_companies(self) -> list[dict[str, str]]:
+        """利用可能な企業一覧を返す。
+
+        Returns:
+            COMPANY_FIELDS をキーに持つ辞書のリスト（コード順）。
+        """
+
+    @abstractmethod
+    def load_company_info(self, code: str) -> dict[str, Any]:
+        """企業基本情報を返す。
+
+        Args:
+            code: 証券コード。
+
+        Returns:
+            company.json 相当の辞書。
+        """
+
+    @abstractmethod
+    def load_statement(self, code: str, kind: str) -> pd.DataFrame:
+        """1社分の財務諸表を返す。
+
+        Args:
+            code: 証券コード。
+            kind: 財務諸表種別（STATEMENT_KINDS のいずれか）。
+
+        Returns:
+            財務諸表の DataFrame（CSV と同じ列構成）。
+        """
+
+    def has_statement(self, code: str, kind: str) -> bool:
+        """企業の財務諸表があるかを返す（四半期の財務諸表は任意のため）。
+
+        既定の実装は実際に読み込んで確かめる。安価に確かめられるバックエンドはオーバーライドする。
+
+        Args:
+            code: 証券コード。
+            kind: 財務諸表種別。
+
+        Returns:
+            load_statement で読み込めれば True。
+        """
+        try:
+            self.load_statement(code, kind)
+        except (FileNotFoundError, KeyError):
+            return False
+        return True
+
+    def stamp(self, code: str, kind: str) -> Hashable:
+        """財務諸表の更新を検知するための値を返す。
+
+        値が変わったらキャッシュ済みの内容を読み直す。既定では常に None（更新検知なし）。
+
+        Args:
+            code: 証券コード。
+            kind: 財務諸表種別。
+
+        Returns:
+            更新されると変化する値。
+        """
+        return None
+
+    def info_stamp(self, code: str) -> Hashable:
+        """企業基本情報の更新を検知するための値を返す。
+
+        既定では常に None（更新検知なし）。
+
+        Args:
+            code: 証券コード。
+
+        Returns:
+            company.json が更新されると変化する値。
+        """
+        return None
+
+    def metadata_stamp(self) -> Hashable:
+        """企業一覧（メタデータ）の更新を検知するための値を返す。
+
+        既定では企業一覧そのもの（毎回読み直す）。安価に求められるバックエンドはオーバーライドする。
+
+        Returns:
+            企業の追加・削除や company.json の更新で変化する値。
+        """
+        return tuple(tuple(c.values()) for c in self.list_companies())
+
+    def universe_stamp(self, kind: str) -> Hashable:
+        """全社分の財務諸表の更新を検知するための値を返す。
+
+        Args:
+            kind: 財務諸表種別。
+
+        Returns:
+            いずれかの企業のデータが追加・更新・削除されると変化する値。
+        """
+        return tuple(
+            (c["code"], self.stamp(c["code"], kind)) for c in self.list_companies()
+        )
+
+    def query(
+        self,
+        kind: str,
+        codes: Sequence[str] | None = None,
+        periods: Iterable[float] | None = None,
+        columns: Sequence[str] | None = None,
+    ) -> pd.DataFrame:
+        """複数企業分の財務諸表をまとめて取得する。
+
+        既定の実装は企業ごとに `load_statement` を呼んで結合する。
+        絞り込みを保存先へ委譲できるバックエンドはオーバーライドする。
+
+        Args:
+            kind: 財務諸表種別。
+            codes: 対象の証券コード。None なら全社。
+            periods: 対象の期。None なら全期。
+            columns: 取得する列（"期" は常に含む）。None なら全列。
+
+        Returns:
+            先頭に code 列を持つ縦持ちの DataFrame。
+        """
+        _check_kind(kind)
+        if codes is None:
+            codes = [c["code"] for c in self.list_companies()]
+        wanted = _select_columns(columns)
+        period_set = set(periods) if periods is not None else None
+
+        frames: list[pd.DataFrame] = []
+        for code in codes:
+            # 四半期の財務諸表がない企業は飛ばす
+            if kind in QUARTERLY_KINDS and not self.has_statement(code, kind):
+                continue
+            df = self.load_statement(code, kind)
+            if period_set is not None:
+                df = df[df["期"].isin(period_set)]
+            if wanted is not None:
+                df = df[wanted]
+            frames.append(df.assign(code=code))
+        if not frames:
+            return pd.DataFrame(columns=["code"] + (wanted or ["期"]))
+        result = pd.concat(frames, ignore_index=True)
+        return result[["code"] + [c for c in result.columns if c != "code"]]
+
+
+def _select_columns(columns: Sequence[str] | None) -> list[str] | None:
+    if columns is None:
+        return None
+    return ["期"] + [c for c in columns if c != "期"]
+
+
+class CsvBackend(StorageBackend):
+    """`<data_dir>/<code>/*.csv` 形式のディレクトリを読むバックエンド。"""
+
+    def __init__(self, data_dir: Path) -> None:
+        self.data_dir = Path(data_dir)
+        # ファイル名 → (走査した時刻, 結果)
+        self._scans: dict[str, tuple[float, Hashable]] = {}
+
+    def __reduce__(self) -> tuple:
+        # 別プロセスにはパスだけを渡す（走査結果は引き継がない）
+        return (type(self), (self.data_dir,))
+
+    def list_companies(self) -> list[dict[str, str]]:
+        companies: list[dict[str, str]] = []
+        for d in sorted(self.data_dir.iterdir()):
+            info_path = d / "company.json"
+            if d.is_dir() and info_path.exists():
+                info = json.loads(info_path.read_text(encoding="utf-8"))
+                companies.append({f: info.get(f, "") for f in COMPANY_FIELDS})
+        return companies
+
+    def load_company_info(self, code: str) -> dict[str, Any]:
+        path = self.data_dir / code / "company.json"
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def load_statement(self, code: str, kind: str) -> pd.DataFrame:
+        _check_kind(kind)
+        path = self.data_dir / code / f"{kind}.csv"
+        # 期は文字列のまま読む（浮動小数だと "2024.10" が 2024.1 になる）
+        return pd.read_csv(path, encoding="utf-8", dtype={"期": str})
+
+    def has_statement(self, code: str, kind: str) -> bool:
+        _check_kind(kind)
+        return (self.data_dir / code / f"{kind}.csv").is_file()
+
+    def stamp(self, code: str, kind: str) -> Hashable:
+        return _file_stamp(self.data_dir / code / f"{kind}.csv")
+
+    def info_stamp(self, code: str) -> Hashable:
+        return _file_stamp(self.data_dir / code / "company.json")
+
+    def universe_stamp(self, kind: str) -> Hashable:
+        return self._version_stamp(f"{kind}.csv")
+
+    def metadata_stamp(self) -> Hashable:
+        return self._version_stamp("company.json")
+
+    def _version_stamp(self, filename: str) -> Hashable:
+        """VERSION の値（なければ企業ごとの filename を走査した結果。SCAN_TTL 秒は使い回す）。"""
+        try:
+            return (self.data_dir / VERSION_FILE).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            pass
+        now = time.monotonic()
+        cached = self._scans.get(filename)
+        if cached is not None and now - cached[0] < SCAN_TTL:
+            return cached[1]
+        stamp = self._scan_stamp(filename)
+        self._scans[filename] = (now, stamp)
+        return stamp
+
+    def _scan_stamp(self, filename: str) -> Hashable:
+        # company.json を読まずに stat だけで集計する
+        count = 0
+        latest = 0
+        changed = 0
+        total = 0
+        for d in os.scandir(self.data_dir):
+            try:
+                st = os.stat(os.path.join(d.path, filename))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            count += 1
+            latest = max(latest, st.st_mtime_ns)
+            changed = max(changed, st.st_ctime_ns)
+            total += st.st_size
+        return (count, latest, changed, total)
+
+
+class SqliteBackend(StorageBackend):
+    """1つの SQLite ファイルに全社分を格納するバックエンド。
+
+    財務諸表ごとに1テーブル（先頭に code 列）を持ち、(code, 期) にインデックスを張る。
+    接続は最大 MAX_CONNECTIONS 個をプールし、スレッドをまたいで貸し出して再利用する
+    （Streamlit はスクリプトを新しいスレッドで実行するので、スレッドごとに接続を作ると増え続ける）。
+    """
+
+    # 同時に開く接続の上限（使用中の接続がすべて貸し出されていれば返却を待つ）
+    MAX_CONNECTIONS = 8
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._idle: queue.Queue[sqlite3.Connection] = queue.Queue()
+        self._connections: list[sqlite3.Connection] = []
+
+    def __reduce__(self) -> tuple:
+        # 別プロセスにはパスだけを渡す（接続はプロセスごとに作り直す）
+        return (type(self), (self.path,))
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """プールから接続を借りる（with を抜けると返却する）。
+
+        空いている接続がなく、上限に達していなければ新しく開く。上限に達していれば返却を待つ。
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                opened = len(self._connections) < self.MAX_CONNECTIONS
+                if opened:
+                    # 貸し出すスレッドは毎回変わるので、作成したスレッド以外からの利用を許す
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    conn.execute("PRAGMA query_only = ON")
+                    self._connections.append(conn)
+            if not opened:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        """プール中の全接続を閉じる。"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._idle = queue.Queue()
+
+    def list_companies(self) -> list[dict[str, str]]:
+        # 項目追加前に生成したデータベースでは欠けている列を空文字で補う
+        with self.connection() as conn:
+            present = {row[1] for row in conn.execute("PRAGMA table_info(companies)")}
+            cols = ", ".join(f if f in present else "''" for f in COMPANY_FIELDS)
+            rows = conn.execute(f"SELECT {cols} FROM companies ORDER BY code").fetchall()
+        return [dict(zip(COMPANY_FIELDS, r)) for r in rows]
+
+    def load_company_info(self, code: str) -> dict[str, Any]:
+        with self.connection() as conn:
+            row = conn.execute("SELECT info FROM companies WHERE code = ?", (code,)).fetchone()
+        if row is None:
+            raise KeyError(f"企業データがありません: {code}")
+        return json.loads(row[0])
+
+    def _has_table(self, kind: str) -> bool:
+        # 四半期のテーブルは、四半期の財務諸表を持つ企業が1社もなければ作られない
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (kind,)
+            ).fetchone()
+        return row is not None
+
+    def has_statement(self, code: str, kind: str) -> bool:
+        _check_kind(kind)
+        if not self._has_table(kind):
+            return False
+        with self.connection() as conn:
+            row = conn.execute(f"SELECT 1 FROM {kind} WHERE code = ? LIMIT 1", (code,)).fetchone()
+        return row is not None
+
+    def load_statement(self, code: str, kind: str) -> pd.DataFrame:
+        _check_kind(kind)
+        if kind in QUARTERLY_KINDS and not self.has_statement(code, kind):
+            raise FileNotFoundError(f"企業データがありません: {code} ({kind})")
+        with self.connection() as conn:
+            df = pd.read_sql_query(f"SELECT * FROM {kind} WHERE code = ? ORDER BY rowid", conn, params=(code,))
+        return df.drop(columns="code")
+
+    def stamp(self, code: str, kind: str) -> Hashable:
+        return _file_stamp(self.path)
+
+    def info_stamp(self, code: str) -> Hashable:
+        return self.stamp(code, "companies")
+
+    def universe_stamp(self, kind: str) -> Hashable:
+        return self.stamp("", kind)
+
+    def metadata_stamp(self) -> Hashable:
+        return self.stamp("", "companies")
+
+    def query(
+        self,
+        kind: str,
+        codes: Sequence[str] | None = None,
+        periods: Iterable[float] | None = None,
+        columns: Sequence[str] | None = None,
+    ) -> pd.DataFrame:
+        _check_kind(kind)
+        wanted = _select_columns(columns)
+        select = "*" if wanted is None else ", ".join(
+            ["code"] + [_quote(c) for c in wanted]
+        )
+
+        where: list[str] = []
+        params: list[Any] = []
+        if codes is not None:
+            codes = list(codes)
+            where.append(f"code IN ({', '.join('?' * len(codes))})")
+            params.extend(codes)
+        if periods is not None:
+            periods = list(periods)
+            where.append(f'"期" IN ({", ".join("?" * len(periods))})')
+            params.extend(periods)
+
+        if not self._has_table(kind):
+            return pd.DataFrame(columns=["code"] + (wanted or ["期"]))
+        sql = f"SELECT {select} FROM {kind}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY code, rowid"
+        with self.connection() as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    @classmethod
+    def build(cls, source: StorageBackend, path: Path) -> SqliteBackend:
+        """別のバックエンドの全データから SQLite ファイルを生成する。
+
+        Args:
+            source: 読み込み元のバックエンド（通常は CsvBackend）。
+            path: 出力先の SQLite ファイル。既存ファイルは置き換える。
+
+        Returns:
+            生成したファイルを読む SqliteBackend。
+        """
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.unlink(missing_ok=True)
+
+        conn = sqlite3.connect(tmp)
+        try:
+            field_defs = ", ".join(f"{f} TEXT" for f in COMPANY_FIELDS[1:])
+            conn.execute(
+                f"CREATE TABLE companies (code TEXT PRIMARY KEY, {field_defs}, info TEXT)"
+            )
+            codes = [c["code"] for c in source.list_companies()]
+            for code in codes:
+                info = source.load_company_info(code)
+                conn.execute(
+                    f"INSERT INTO companies VALUES ({', '.join('?' * (len(COMPANY_FIELDS) + 1))})",
+                    (
+                        code,
+                        *(info.get(f, "") for f in COMPANY_FIELDS[1:]),
+                        json.dumps(info, ensure_ascii=False),
+                    ),
+                )
+                for kind in STATEMENT_KINDS + QUARTERLY_KINDS:
+                    if kind in QUARTERLY_KINDS and not source.has_statement(code, kind):
+                        continue
+                    df = source.load_statement(code, kind)
+                    df.insert(0, "code", code)
+                    # 期は文字列のまま保存する（REAL だと "2024.10" が 2024.1 になる）
+                    df.to_sql(kind, conn, if_exists="append", index=False, dtype={"期": "TEXT"})
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for kind in STATEMENT_KINDS + QUARTERLY_KINDS:
+                if kind not in tables:
+                    continue
+                conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS idx_{kind}_code_period ON {kind} (code, "期")'
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+        tmp.replace(path)
+        return cls(path)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def main(argv: list[str] | None = None) -> None:
+    """CSV ディレクトリから SQLite データベースを生成する CLI。"""
+    parser = argparse.ArgumentParser(description="CSVデータをSQLiteデータベースに変換する")
+    parser.add_argument("db_path", type=Path, help="出力する SQLite ファイル")
+    parser.add_argument(
+        "--data-dir",
+        type=Path,
+        default=Path(__file__).resolve().parent.parent / "data",
+        help="企業別CSVディレクトリ（既定: data/）",
+    )
+    args = parser.parse_args(argv)
+    backend = SqliteBackend.build(CsvBackend(args.data_dir), args.db_path)
+    print(f"{len(backend.list_companies())} 社を {args.db_path} に書き出しました。")
+    backend.close()
+
+
+if __name__ == "__main__":
+    main()
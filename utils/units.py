@@ -0,0 +1,167 @@
+"""金額の単位（円・千円・百万円・億円）の正規化と表示単位への換算。
+
+企業ごとに company.json の "currency"（例: "百万円"）で金額の単位を宣言する。
+data_loader は読み込み時に金額列を共通単位（CANONICAL_UNIT）へ一括で換算するため、
+集計や企業間の比較は常に同じ単位で行える。
+
+画面に表示する単位はサイドバーでまとめて切り替える（セッション単位。session_cache.display_unit）。
+各ページは読み込んだ DataFrame を scaled_view で表示単位に換算して使う。
+このモジュールは Streamlit に依存しない（data_loader・API・ワーカーからも使うため）。
+換算結果は元の DataFrame ごとにキャッシュするので、同じ表示単位なら再計算しない。
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+
+from utils.schema import AMOUNT, SCHEMAS
+
+
+# 単位 → 1単位あたりの円
+UNIT_YEN: dict[str, int] = {
+    "円": 1,
+    "千円": 1_000,
+    "百万円": 1_000_000,
+    "億円": 100_000_000,
+}
+
+# 読み込み後の共通単位
+CANONICAL_UNIT = "百万円"
+
+# 画面で選べる表示単位と小数点以下の桁数
+DISPLAY_UNITS: dict[str, int] = {
+    "百万円": 0,
+    "億円": 1,
+    "千円": 0,
+}
+
+# いずれかの財務諸表で金額として扱う列
+AMOUNT_COLUMNS: frozenset[str] = frozenset(
+    col for schema in SCHEMAS.values() for col, role in schema.items() if role == AMOUNT
+)
+
+# 表示単位に換算した DataFrame のキャッシュ: (元の id, 単位, 列) → (元の DataFrame, 換算結果)
+MAX_VIEWS = 256
+_views: OrderedDict[tuple, tuple[pd.DataFrame, pd.DataFrame]] = OrderedDict()
+_views_lock = threading.Lock()
+
+
+def unit_yen(unit: str | None) -> int:
+    """単位1あたりの円を返す。
+
+    Args:
+        unit: 単位（"千円" など）。未指定（None・空文字）は共通単位とみなす。
+
+    Returns:
+        円換算の倍率。
+
+    Raises:
+        ValueError: 未対応の単位の場合。
+    """
+    if not unit:
+        unit = CANONICAL_UNIT
+    try:
+        return UNIT_YEN[unit]
+    except KeyError:
+        raise ValueError(f"未対応の金額単位です: {unit}") from None
+
+
+def unit_factor(from_unit: str | None, to_unit: str | None) -> float:
+    """from_unit の金額を to_unit に換算する倍率を返す。"""
+    return unit_yen(from_unit) / unit_yen(to_unit)
+
+
+def normalize_amounts(df: pd.DataFrame, kind: str, yen: int | np.ndarray) -> pd.DataFrame:
+    """金額列を共通単位に換算する。
+
+    すべての金額列を1つの配列として一度に換算する。
+    整数に円換算の倍率を掛けてから割るので、千円→百万円なども丸め誤差を最小にできる。
+
+    Args:
+        df: 読み込んだままの財務諸表。
+        kind: 財務諸表種別（SCHEMAS のキー）。
+        yen: 元の単位1あたりの円。全社分の DataFrame では行ごとの配列。
+
+    Returns:
+        換算後の DataFrame（換算が不要なら df をそのまま返す）。
+    """
+    yen = np.asarray(yen, dtype=np.int64)
+    canonical = UNIT_YEN[CANONICAL_UNIT]
+    columns = [c for c, role in SCHEMAS[kind].items() if role == AMOUNT and c in df.columns]
+    if not columns or bool(np.all(yen == canonical)):
+        return df
+    values = df[columns].to_numpy(dtype=float)
+    scale = yen[:, None] if yen.ndim else yen
+    df = df.copy()
+    df[columns] = values * scale / canonical
+    return df
+
+
+def scaled_view(
+    df: pd.DataFrame, unit: str, columns: Sequence[str] | None = None
+) -> pd.DataFrame:
+    """共通単位の DataFrame を表示単位に換算したものを返す。
+
+    結果は元の DataFrame・単位・列ごとにキャッシュし、同じ入力には同じオブジェクトを返す
+    （session_memo などのオブジェクト同一性によるキャッシュがそのまま効く）。
+    返す DataFrame は呼び出し側で破壊的に変更しないこと。
+
+    Args:
+        df: 共通単位の DataFrame（data_loader の load_* の結果など）。
+        unit: 表示単位。
+        columns: 換算する列。None なら財務諸表の金額列（AMOUNT_COLUMNS）のすべて。
+
+    Returns:
+        換算後の DataFrame。共通単位と同じなら df そのもの。
+    """
+    if unit == CANONICAL_UNIT:
+        return df
+    if columns is None:
+        columns = [c for c in df.columns if c in AMOUNT_COLUMNS]
+    key = (id(df), unit, tuple(columns))
+    with _views_lock:
+        hit = _views.get(key)
+        if hit is not None and hit[0] is df:
+            _views.move_to_end(key)
+            return hit[1]
+
+    view = df.copy()
+    view[list(columns)] = df[list(columns)].to_numpy(dtype=float) / unit_factor(unit, CANONICAL_UNIT)
+    with _views_lock:
+        _views[key] = (df, view)
+        while len(_views) > MAX_VIEWS:
+            _views.popitem(last=False)
+    return view
+
+
+def amount_format(unit: str) -> str:
+    """表示単位に合わせた数値の書式（d3-format / str.format 共通）を返す。
+
+    Args:
+        unit: 表示単位。
+
+    Returns:
+        ",.0f" など。
+    """
+    return f",.{DISPLAY_UNITS.get(unit, 0)}f"
+
+
+def format_amount(value: float, unit: str, signed: bool = False, suffix: bool = True) -> str:
+    """金額を表示単位の桁数で書式化する。
+
+    Args:
+        value: 表示単位に換算済みの金額。
+        unit: 表示単位。
+        signed: True なら正の値にも + を付ける。
+        suffix: True なら単位を付ける。
+
+    Returns:
+        "2,037 百万円" などの文字列。
+    """
+    text = format(value, ("+" if signed else "") + amount_format(unit))
+    return f"{text} {unit}" if suffix else text
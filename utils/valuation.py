@@ -0,0 +1,293 @@
+"""DCF（割引キャッシュフロー）による企業価値の試算。
+
+予測期間の FCF を「営業収益 × FCF マージン」とし、営業収益は一定の成長率で伸びると仮定する。
+企業価値は予測期間の FCF の現在価値と、最終年度以降を永久成長率で延長した継続価値の和。
+
+enterprise_value は全引数をブロードキャストする要素ごとの閉形式なので、
+割引率 × 永久成長率 × マージンの感応度グリッドも全社一括の試算も1回の配列演算で求まる。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import list_companies, load_universe
+
+
+# 予測期間（年）
+FORECAST_YEARS = 5
+
+# 既定の割引率・永久成長率
+DEFAULT_DISCOUNT_RATE = 0.08
+DEFAULT_TERMINAL_GROWTH = 0.01
+
+# 過去実績から推定する売上成長率の範囲（極端な値で企業価値が発散しないように）
+GROWTH_BOUNDS = (-0.10, 0.30)
+
+# 過去実績から推定する FCF マージンの範囲（6_valuation のスライダーの範囲と同じ）
+MARGIN_BOUNDS = (-0.20, 0.60)
+
+# 有利子負債とみなす B/S 項目
+DEBT_COLUMNS = ["短期借入金", "長期借入金"]
+
+# トルネードチャートで各前提を振る幅（前提名 → (下げ幅, 上げ幅)）
+TORNADO_SPANS: dict[str, tuple[float, float]] = {
+    "revenue_growth": (-0.05, 0.05),
+    "discount_rate": (-0.02, 0.02),
+    "terminal_growth": (-0.01, 0.01),
+    "fcf_margin": (-0.05, 0.05),
+}
+
+# 前提の表示名
+ASSUMPTION_LABELS: dict[str, str] = {
+    "revenue_growth": "売上成長率",
+    "discount_rate": "割引率",
+    "terminal_growth": "永久成長率",
+    "fcf_margin": "FCFマージン",
+}
+
+
+@dataclass(frozen=True)
+class DcfAssumptions:
+    """DCF の前提（いずれも小数。例: 8% は 0.08）。"""
+
+    revenue_growth: float
+    discount_rate: float = DEFAULT_DISCOUNT_RATE
+    terminal_growth: float = DEFAULT_TERMINAL_GROWTH
+    fcf_margin: float = 0.0
+
+    def with_overrides(self, **kwargs: float) -> DcfAssumptions:
+        """一部の前提を差し替えたコピーを返す。"""
+        return replace(self, **kwargs)
+
+
+def fcf_history(pl: pd.DataFrame, cf: pd.DataFrame) -> pd.DataFrame:
+    """FCF（営業CF + 投資CF）と FCF マージンの実績を求める。
+
+    calc_metrics と同様に、load_universe で読んだ全社分（code 列あり）も渡せる。
+
+    Args:
+        pl: 損益計算書の DataFrame。
+        cf: キャッシュフロー計算書の DataFrame。
+
+    Returns:
+        期, 営業収益, 営業CF, 投資CF, FCF, FCFマージン（%）列を持つ DataFrame。
+    """
+    keys = ["code", "期"] if "code" in pl.columns else ["期"]
+    merged = pl[keys + ["営業収益"]].merge(cf[keys + ["営業CF", "投資CF"]], on=keys, how="inner")
+    merged["FCF"] = merged["営業CF"] + merged["投資CF"]
+    revenue = merged["営業収益"]
+    merged["FCFマージン"] = (merged["FCF"] / revenue * 100).where(revenue != 0, 0.0)
+    return merged
+
+
+def estimate_assumptions(history: pd.DataFrame) -> DcfAssumptions:
+    """FCF の実績から売上成長率と FCF マージンの初期値を推定する。
+
+    Args:
+        history: fcf_history() の結果（1社分、推定に使う期までに絞ったもの）。
+
+    Returns:
+        DcfAssumptions（割引率・永久成長率は既定値）。
+    """
+    revenue = history["営業収益"].to_numpy(dtype=float)
+    if len(revenue) >= 2 and revenue[0] > 0 and revenue[-1] > 0:
+        growth = (revenue[-1] / revenue[0]) ** (1 / (len(revenue) - 1)) - 1
+    else:
+        growth = 0.0
+    return DcfAssumptions(
+        revenue_growth=float(np.clip(growth, *GROWTH_BOUNDS)),
+        fcf_margin=float(np.clip(history["FCFマージン"].median() / 100, *MARGIN_BOUNDS)) if len(history) else 0.0,
+    )
+
+
+def enterprise_value(
+    base_revenue: float | np.ndarray,
+    revenue_growth: float | np.ndarray,
+    discount_rate: float | np.ndarray,
+    terminal_growth: float | np.ndarray,
+    fcf_margin: float | np.ndarray,
+    years: int = FORECAST_YEARS,
+) -> np.ndarray:
+    """DCF による企業価値を計算する。
+
+    引数はすべて NumPy のブロードキャスト規則で組み合わされる。
+    たとえば割引率を (R, 1, 1)、永久成長率を (1, G, 1)、マージンを (1, 1, M) の形にすると
+    (R, G, M) のグリッドが1回の演算で求まる。
+
+    予測期間の現在価値は等比数列の和 R0·q(1−q^N)/(1−q)（q = (1+成長率)/(1+割引率)）、
+    継続価値は R0·q^N·(1+g)/(r−g) で、いずれもマージンを掛けて FCF に換算する。
+
+    Args:
+        base_revenue: 基準期の営業収益。
+        revenue_growth: 予測期間の売上成長率。
+        discount_rate: 割引率。
+        terminal_growth: 永久成長率。
+        fcf_margin: FCF マージン。
+        years: 予測期間（年）。
+
+    Returns:
+        企業価値の配列。割引率が永久成長率以下の組み合わせは NaN。
+    """
+    base = np.asarray(base_revenue, dtype=float)
+    growth = np.asarray(revenue_growth, dtype=float)
+    rate = np.asarray(discount_rate, dtype=float)
+    terminal = np.asarray(terminal_growth, dtype=float)
+    margin = np.asarray(fcf_margin, dtype=float)
+
+    q = (1 + growth) / (1 + rate)
+    q_n = q ** years
+    with np.errstate(divide="ignore", invalid="ignore"):
+        explicit = np.where(np.isclose(q, 1.0), years, q * (1 - q_n) / (1 - q))
+        continuing = q_n * (1 + terminal) / (rate - terminal)
+    ev = base * margin * (explicit + continuing)
+    return np.where(rate > terminal, ev, np.nan)
+
+
+def sensitivity_grid(
+    base_revenue: float,
+    assumptions: DcfAssumptions,
+    discount_rates: np.ndarray,
+    terminal_growths: np.ndarray,
+    fcf_margins: np.ndarray,
+) -> np.ndarray:
+    """割引率 × 永久成長率 × FCF マージンの全組み合わせの企業価値を求める。
+
+    Args:
+        base_revenue: 基準期の営業収益。
+        assumptions: 売上成長率に使う前提。
+        discount_rates: 割引率の軸。
+        terminal_growths: 永久成長率の軸。
+        fcf_margins: FCF マージンの軸。
+
+    Returns:
+        形状 (割引率, 永久成長率, マージン) の企業価値の配列。
+    """
+    return enterprise_value(
+        base_revenue,
+        assumptions.revenue_growth,
+        np.asarray(discount_rates)[:, None, None],
+        np.asarray(terminal_growths)[None, :, None],
+        np.asarray(fcf_margins)[None, None, :],
+    )
+
+
+def tornado(
+    base_revenue: float,
+    assumptions: DcfAssumptions,
+    spans: dict[str, tuple[float, float]] = TORNADO_SPANS,
+) -> pd.DataFrame:
+    """前提を1つずつ上下に振ったときの企業価値の変化を求める。
+
+    全シナリオ（前提の数 × 2）を1回の enterprise_value 呼び出しで計算する。
+
+    Args:
+        base_revenue: 基準期の営業収益。
+        assumptions: 基準となる前提。
+        spans: 前提名 → (下げ幅, 上げ幅)。
+
+    Returns:
+        前提, 下限, 上限, 下限時企業価値, 上限時企業価値 列を持ち、
+        企業価値の振れ幅が大きい順に並んだ DataFrame。
+    """
+    names = list(spans)
+    fields = list(ASSUMPTION_LABELS)
+    base = np.array([getattr(assumptions, f) for f in fields])
+    # 行: 前提ごとの (下げ, 上げ) シナリオ、列: ASSUMPTION_LABELS の順の前提値
+    scenarios = np.repeat(base[None, :], 2 * len(names), axis=0)
+    rows = np.arange(2 * len(names))
+    cols = np.repeat([fields.index(n) for n in names], 2)
+    scenarios[rows, cols] += np.array([spans[n] for n in names]).ravel()
+    ev = enterprise_value(base_revenue, *scenarios.T).reshape(len(names), 2)
+    varied = scenarios[rows, cols].reshape(len(names), 2)
+
+    result = pd.DataFrame({
+        "前提": [ASSUMPTION_LABELS[n] for n in names],
+        "下限": varied[:, 0],
+        "上限": varied[:, 1],
+        "下限時企業価値": ev[:, 0],
+        "上限時企業価値": ev[:, 1],
+    })
+    swing = (result["上限時企業価値"] - result["下限時企業価値"]).abs()
+    return result.loc[swing.sort_values(ascending=False).index].reset_index(drop=True)
+
+
+def net_cash(bs_row: pd.Series) -> float:
+    """ネットキャッシュ（現金及び預金 − 有利子負債）を返す。
+
+    Args:
+        bs_row: 貸借対照表の1期分の行。
+
+    Returns:
+        ネットキャッシュ（百万円）。
+    """
+    return float(bs_row["現金及び預金"] - sum(bs_row[c] for c in DEBT_COLUMNS))
+
+
+def valuation_screen(
+    discount_rate: float = DEFAULT_DISCOUNT_RATE,
+    terminal_growth: float = DEFAULT_TERMINAL_GROWTH,
+) -> pd.DataFrame:
+    """全社の最新期について DCF を一括で試算する。
+
+    各社の売上成長率（期間 CAGR）と FCF マージン（中央値）を実績から推定し、
+    割引率と永久成長率は全社共通の値を使う。
+
+    Args:
+        discount_rate: 割引率。
+        terminal_growth: 永久成長率。
+
+    Returns:
+        code, 企業名, 市場, 期, 営業収益, 売上成長率, FCFマージン（%）, 企業価値,
+        ネットキャッシュ, 株主価値, EV/営業利益, 株主価値/純資産 列を持つ DataFrame。
+    """
+    pl = load_universe("pl")
+    bs = load_universe("bs")
+    history = fcf_history(pl, load_universe("cf"))
+    grouped = history.groupby("code", observed=True)
+
+    first = grouped.first()
+    latest = grouped.last()
+    span = grouped.size() - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = (latest["営業収益"] / first["営業収益"]) ** (1 / span) - 1
+    valid = (span > 0) & (first["営業収益"] > 0) & (latest["営業収益"] > 0)
+    growth = cagr.where(valid, 0.0).clip(*GROWTH_BOUNDS)
+    margin = (grouped["FCFマージン"].median() / 100).clip(*MARGIN_BOUNDS)
+
+    ev = enterprise_value(
+        latest["営業収益"].to_numpy(), growth.to_numpy(), discount_rate, terminal_growth, margin.to_numpy()
+    )
+
+    keys = ["code", "期"]
+    latest_keys = latest.reset_index()[keys]
+    latest_pl = latest_keys.merge(pl[keys + ["営業利益"]], on=keys, how="left")
+    latest_bs = latest_keys.merge(bs[keys + ["現金及び預金", "純資産合計", *DEBT_COLUMNS]], on=keys, how="left")
+    cash = (latest_bs["現金及び預金"] - latest_bs[DEBT_COLUMNS].sum(axis=1)).to_numpy(dtype=float)
+    equity = ev + cash
+
+    companies = {c["code"]: c for c in list_companies()}
+    codes = latest.index.astype(str)
+    operating_profit = latest_pl["営業利益"].to_numpy(dtype=float)
+    book = latest_bs["純資産合計"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ev_multiple = np.where(operating_profit > 0, ev / operating_profit, np.nan)
+        book_multiple = np.where(book > 0, equity / book, np.nan)
+
+    return pd.DataFrame({
+        "code": codes,
+        "企業名": [companies.get(c, {}).get("name", "") for c in codes],
+        "市場": [companies.get(c, {}).get("market", "") for c in codes],
+        "期": latest["期"].to_numpy(),
+        "営業収益": latest["営業収益"].to_numpy(),
+        "売上成長率": growth.to_numpy() * 100,
+        "FCFマージン": margin.to_numpy() * 100,
+        "企業価値": ev,
+        "ネットキャッシュ": cash,
+        "株主価値": equity,
+        "EV/営業利益": ev_multiple,
+        "株主価値/純資産": book_multiple,
+    })
@@ -0,0 +1,378 @@
+"""サーバー起動時のウォームアップ（よく見られる企業のデータ・図の事前準備）と準備状況の公開。
+
+デプロイ直後の最初の利用者が CSV の読み込みや図の生成を待たずに済むよう、
+起動時にバックグラウンドのスレッドで次を準備する。
+
+- 全社分: 企業一覧と検索インデックス、他社比較の分布、データチェックの検査結果、全社スクリーニング、
+  企業クラスタ分析（データチェックとクラスタ分析はページと同じジョブとして jobs のワーカーで計算する）
+- よく見られる企業: 財務諸表の読み込み、経営指標の計算、各ページの既定の期（最新期）の図
+
+図は session_cache.prebuild で全セッション共通のキャッシュに入れておき、各ページの session_memo が
+セッションのキャッシュにないときに使う。事前に作るのは既定の表示単位（共通単位）の図だけ。
+
+準備状況は小さな HTTP サーバーで公開する（ロードバランサーのヘルスチェック用）:
+
+    GET /ready   ウォームアップが終わっていれば 200、それまでと、全社分の準備に失敗した場合は 503
+    GET /status  進捗（JSON、常に 200。一部の企業の準備に失敗した場合は state が degraded）
+
+起動例（ウォームアップを始めてから、同じプロセスで Streamlit を起動する）:
+
+    python -m utils.warmup --codes 5139,7203 -- app.py --server.port 8501
+    python -m utils.warmup --access-log /var/log/finance/api.log --top 50 -- app.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from utils.data_loader import (
+    get_period_label,
+    list_companies,
+    load_bs,
+    load_cf,
+    load_company_info,
+    load_factors,
+    load_pl,
+    load_segment,
+    load_universe,
+)
+
+
+# 対象企業を環境変数で指定する場合の変数名（カンマ区切りの証券コード）
+HOT_CODES_ENV = "FINANCE_HOT_CODES"
+
+# アクセスログから選ぶ企業数
+DEFAULT_TOP = 20
+
+# アクセスログから証券コードを拾うパターン（API の /companies/<code>/... と ?code=...）
+_LOG_CODE = re.compile(r"/companies/(\w+)|[?&]code=(\w+)")
+
+
+@dataclass
+class WarmupStatus:
+    """ウォームアップの進捗。"""
+
+    state: str = "idle"  # idle → running → ready・degraded（一部の企業が失敗）・failed
+    total: int = 0
+    done: int = 0
+    current: str = ""
+    errors: list[str] = field(default_factory=list)
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        """トラフィックを受けてよいか（全社分の準備が済んでいれば、一部の企業が失敗していても受ける）。"""
+        return self.state in ("ready", "degraded")
+
+
+_status = WarmupStatus()
+_lock = threading.Lock()
+_thread: threading.Thread | None = None
+
+
+def status() -> WarmupStatus:
+    """現在の進捗を返す（ready が True になるまでトラフィックを受けない想定）。"""
+    return _status
+
+
+def hot_codes(
+    codes: Sequence[str] | None = None,
+    access_log: Path | None = None,
+    top: int = DEFAULT_TOP,
+) -> list[str]:
+    """ウォームアップする企業を決める。
+
+    指定したコード（なければ環境変数 FINANCE_HOT_CODES）と、アクセスログで参照回数の多い
+    企業を合わせる。サイドバーで最初に選ばれている先頭の企業は常に含める。
+
+    Args:
+        codes: 対象の証券コード。
+        access_log: アクセスログのファイル。
+        top: アクセスログから選ぶ企業数。
+
+    Returns:
+        存在する企業の証券コード（重複なし、指定順）。
+    """
+    if codes is None:
+        codes = [c for c in os.environ.get(HOT_CODES_ENV, "").split(",") if c.strip()]
+    wanted = [c.strip() for c in codes]
+    if access_log is not None:
+        counts: Counter[str] = Counter()
+        with open(access_log, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                for match in _LOG_CODE.finditer(line):
+                    counts[match.group(1) or match.group(2)] += 1
+        wanted += [code for code, _ in counts.most_common(top)]
+
+    known = [c["code"] for c in list_companies()]
+    available = set(known)
+    return list(dict.fromkeys(([known[0]] if known else []) + [c for c in wanted if c in available]))
+
+
+def warm_universe() -> None:
+    """全社分のデータと、それを使う集計（検索・他社比較・データチェック・スクリーニング・クラスタ分析）を準備する。"""
+    from utils.jobs import submit
+    from utils.peers import get_peer_distributions
+    from utils.search import get_company_index
+    from utils.session_cache import prebuild
+    from utils.valuation import DEFAULT_DISCOUNT_RATE, DEFAULT_TERMINAL_GROWTH, valuation_screen
+
+    # ワーカーでの計算を先に投入し、このスレッドではほかの準備を進める。
+    # クラスタ分析は 8_clusters の既定値（k-means・6 クラスタ・各社の最新期）
+    jobs = [
+        submit("anomalies"),
+        submit("cluster_features"),
+        submit("clusters", 6, "kmeans", None),
+    ]
+    get_company_index()
+    get_peer_distributions()
+    # 6_valuation の全社スクリーニングの既定値（スライダーの初期値）と同じ入力で作る
+    rate, terminal = DEFAULT_DISCOUNT_RATE * 100, DEFAULT_TERMINAL_GROWTH * 100
+    prebuild(
+        "valuation_screen",
+        [load_universe("pl"), load_universe("bs"), load_universe("cf")],
+        (rate, terminal),
+        lambda: valuation_screen(rate / 100, terminal / 100),
+    )
+    for job in jobs:
+        job.result()
+
+
+def warm_company(code: str) -> None:
+    """1社分の財務諸表を読み込み、各ページの最新期の図を作っておく。
+
+    ページの session_memo と同じ名前・入力・パラメータで prebuild する。
+
+    Args:
+        code: 証券コード。
+    """
+    from utils.bridge import FactorBridge, LineItemBridge
+    from utils.charts import (
+        create_bs_block,
+        create_bs_block_frames,
+        create_cf_sankey_frames,
+        create_pl_sankey_frames,
+        create_trend_chart,
+    )
+    from utils.clusters import cf_pattern_note
+    from utils.metrics import calc_metrics
+    from utils.session_cache import prebuild
+    from utils.units import CANONICAL_UNIT, unit_factor
+    from utils.valuation import fcf_history
+
+    unit = CANONICAL_UNIT
+    info = load_company_info(code)
+    pl, bs, cf = load_pl(code), load_bs(code), load_cf(code)
+    load_segment(code)
+    factors = load_factors(code)
+    calc_metrics(pl, bs)
+
+    # 損益計算書（2_pl）
+    periods = pl["期"].tolist()
+    period = periods[-1]
+    prebuild("pl_sankey_frames", [pl], period, lambda: create_pl_sankey_frames(pl, unit, period))
+    prebuild("pl_bridge", [pl], None, lambda: LineItemBridge(pl))
+    factor_scale = unit_factor(info.get("currency"), unit)
+    prebuild(
+        "pl_factor_bridge", [pl, factors], factor_scale,
+        lambda: FactorBridge(factors, periods, factor_scale),
+    )
+
+    # 貸借対照表（3_bs）
+    bs_period = bs["期"].tolist()[-1]
+    bs_row = bs[bs["期"] == bs_period].iloc[0]
+    prebuild("bs_block_frames", [bs], bs_period, lambda: create_bs_block_frames(bs, unit, bs_period))
+    # 2期比較タブの当期側
+    prebuild("bs_block", [bs], bs_period, lambda: create_bs_block(bs_row, get_period_label(bs_period), unit))
+    prebuild("bs_bridge", [bs], None, lambda: LineItemBridge(bs))
+
+    # キャッシュフロー計算書（4_cf）
+    cf_period = cf["期"].tolist()[-1]
+    prebuild(
+        "cf_sankey_frames", [cf], cf_period,
+        lambda: create_cf_sankey_frames(cf, unit, cf_period, note=cf_pattern_note),
+    )
+
+    # 時系列推移（5_trend）
+    prebuild(
+        "trend_revenue", [pl], None,
+        lambda: create_trend_chart(
+            pl, ["営業収益", "売上総利益", "営業利益", "経常利益", "当期純利益"], "売上・利益の推移", unit,
+            visible=["営業収益", "営業利益", "当期純利益"],
+        ),
+    )
+    prebuild(
+        "trend_bs", [bs], None,
+        lambda: create_trend_chart(
+            bs, ["資産合計", "純資産合計", "負債合計", "現金及び預金", "利益剰余金"], "B/S主要項目の推移", unit,
+            visible=["資産合計", "純資産合計", "現金及び預金"],
+        ),
+    )
+
+    # バリュエーション（6_valuation）
+    history = fcf_history(pl, cf)
+    history = history[history["期"] <= period]
+    prebuild(
+        "valuation_fcf", [pl, cf], period,
+        lambda: create_trend_chart(history, ["営業CF", "投資CF", "FCF"], "FCF（営業CF + 投資CF）の推移", unit),
+    )
+
+
+def run_warmup(codes: Sequence[str]) -> WarmupStatus:
+    """ウォームアップを実行する（呼び出したスレッドで完了まで処理する）。
+
+    1社の失敗で全体を止めないよう、失敗は errors に記録して次に進む。
+    終了後の state は、失敗がなければ ready、一部の企業だけが失敗していれば degraded、
+    全社分の準備か対象の企業すべてが失敗していれば failed（/ready は 503 のまま）。
+
+    Args:
+        codes: ウォームアップする企業（hot_codes の結果）。
+
+    Returns:
+        完了後の進捗。
+    """
+    _status.state = "running"
+    _status.total = len(codes) + 1
+    _status.done = 0
+    _status.errors = []
+    _status.started_at = time.time()
+    _status.finished_at = None
+
+    steps = [("全社", warm_universe)] + [(code, lambda code=code: warm_company(code)) for code in codes]
+    failed = set()
+    for name, step in steps:
+        _status.current = name
+        try:
+            step()
+        except Exception as e:  # noqa: BLE001 - ウォームアップの失敗は通常の表示時に再び起きる
+            _status.errors.append(f"{name}: {type(e).__name__}: {e}")
+            failed.add(name)
+        _status.done += 1
+
+    _status.current = ""
+    _status.finished_at = time.time()
+    # 全社分か、対象の企業すべてが失敗していればキャッシュは冷えたままなので受け付けない
+    if "全社" in failed or (codes and failed >= set(codes)):
+        _status.state = "failed"
+    elif failed:
+        _status.state = "degraded"
+    else:
+        _status.state = "ready"
+    return _status
+
+
+def start_warmup(codes: Sequence[str]) -> threading.Thread:
+    """バックグラウンドのスレッドでウォームアップを始める（実行中なら何もしない）。
+
+    Args:
+        codes: ウォームアップする企業。
+
+    Returns:
+        ウォームアップのスレッド。
+    """
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _status.state = "running"
+            _thread = threading.Thread(target=run_warmup, args=(list(codes),), name="warmup", daemon=True)
+            _thread.start()
+        return _thread
+
+
+class ReadinessHandler(BaseHTTPRequestHandler):
+    """/ready と /status を返すハンドラ。"""
+
+    server_version = "FinanceVisualizerWarmup/1.0"
+
+    def do_GET(self) -> None:  # noqa: N802 - BaseHTTPRequestHandler の命名規約
+        current = status()
+        if self.path == "/ready":
+            code = HTTPStatus.OK if current.ready else HTTPStatus.SERVICE_UNAVAILABLE
+        elif self.path == "/status":
+            code = HTTPStatus.OK
+        else:
+            code = HTTPStatus.NOT_FOUND
+        body = json.dumps({"ready": current.ready, **asdict(current)}, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        # ヘルスチェックは頻繁に来るので記録しない
+        pass
+
+
+def serve_readiness(host: str, port: int) -> ThreadingHTTPServer:
+    """準備状況の HTTP サーバーをバックグラウンドのスレッドで起動する。
+
+    Args:
+        host: 待ち受けるアドレス。
+        port: 待ち受けるポート。
+
+    Returns:
+        起動したサーバー。
+    """
+    server = ThreadingHTTPServer((host, port), ReadinessHandler)
+    threading.Thread(target=server.serve_forever, name="readiness", daemon=True).start()
+    return server
+
+
+def main(argv: list[str] | None = None) -> None:
+    """ウォームアップと準備状況のサーバーを始めてから、同じプロセスで Streamlit を起動する。"""
+    argv = sys.argv[1:] if argv is None else argv
+    # "--" より後は streamlit run に渡す
+    if "--" in argv:
+        split = argv.index("--")
+        argv, streamlit_args = argv[:split], argv[split + 1:]
+    else:
+        streamlit_args = ["app.py"]
+
+    parser = argparse.ArgumentParser(description="ウォームアップしてから Streamlit を起動する")
+    parser.add_argument("--codes", help="ウォームアップする証券コード（カンマ区切り）")
+    parser.add_argument("--access-log", type=Path, help="参照回数の多い企業を選ぶアクセスログ")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="アクセスログから選ぶ企業数")
+    parser.add_argument("--ready-host", default="0.0.0.0")
+    parser.add_argument("--ready-port", type=int, default=8503, help="/ready・/status を返すポート")
+    parser.add_argument("--no-streamlit", action="store_true",
+                        help="Streamlit を起動せず、ウォームアップの所要時間だけ表示する")
+    args = parser.parse_args(argv)
+
+    codes = hot_codes(args.codes.split(",") if args.codes else None, args.access_log, args.top)
+    if args.no_streamlit:
+        started = time.perf_counter()
+        result = run_warmup(codes)
+        print(f"{len(codes)} 社をウォームアップしました（{time.perf_counter() - started:.1f} 秒、{result.state}）。")
+        for error in result.errors:
+            print(f"  {error}")
+        return
+
+    serve_readiness(args.ready_host, args.ready_port)
+    # ジョブのワーカーは Streamlit がページを実行する前に起動する（utils.jobs.start_pool）
+    from utils.jobs import start_pool
+
+    start_pool()
+    start_warmup(codes)
+    from streamlit.web import cli as stcli
+
+    sys.argv = ["streamlit", "run", *streamlit_args]
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    main()